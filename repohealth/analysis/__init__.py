@@ -4,6 +4,9 @@ from . import last_commits
 from . import commit_LOC_delta
 from . import stargazers
 from . import issues_opened_closed
+from . import contributor_activity
+from . import hotspots
+from . import issue_lifecycle
 
 
 # Format: "key", "Title", plot_module.
@@ -17,4 +20,12 @@ PLOTLY_PLOTS = (
     ['commit_LOC_delta', 'Lines of change per commit', commit_LOC_delta],
     ['stargazers', 'Repository stargazers', stargazers],
     ['issues', 'All time issues opened & closed', issues_opened_closed],
+    ['active_contributors', 'Monthly active & new contributors',
+     contributor_activity],
+    ['bus_factor', "Bus factor: authors covering half of a year's commits",
+     contributor_activity],
+    ['open_backlog', 'Open issue backlog', issue_lifecycle],
+    ['time_to_close', 'Time to close issues (by month closed)',
+     issue_lifecycle],
+    ['hotspots', 'File hotspots: most frequently changed paths', hotspots],
 )
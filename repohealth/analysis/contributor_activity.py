@@ -0,0 +1,154 @@
+from contextlib import contextmanager
+import threading
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+
+
+def contributor_activity(dates, authors, window=12, threshold=0.5):
+    """
+    Compute contributor activity from the (date, author) pair of each commit.
+
+    All of the results are computed with vectorised passes over the commit
+    arrays, so that very large histories (millions of commits) remain cheap.
+
+    Returns a dictionary containing the monthly timeline ("month", "active",
+    "new", "bus_factor" and "monthly_commits") and the per-author summary
+    ("author", "first_seen", "last_seen" and "commits").
+
+    The bus factor for a month is the smallest number of authors who between
+    them account for ``threshold`` of the commits in the ``window`` months
+    up to and including that month.
+
+    """
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    codes, labels = pd.factorize(np.asarray(authors))
+
+    if len(dates) and np.any(dates[1:] < dates[:-1]):
+        order = np.argsort(dates, kind='mergesort')
+        dates, codes = dates[order], codes[order]
+
+    n_commits, n_authors = len(dates), len(labels)
+    if n_commits == 0:
+        empty = np.array([], dtype=np.int64)
+        return {'month': np.array([], dtype='datetime64[M]'),
+                'active': empty, 'new': empty, 'bus_factor': empty,
+                'monthly_commits': empty,
+                'author': labels, 'first_seen': dates, 'last_seen': dates,
+                'commits': empty}
+
+    month = dates.astype('datetime64[M]')
+    month_idx = (month - month[0]).astype(np.int64)
+    n_months = month_idx[-1] + 1
+
+    # The index of the first and last commit of each author (every author
+    # code is present, so these are indexed by author code).
+    first = np.unique(codes, return_index=True)[1]
+    last = n_commits - 1 - np.unique(codes[::-1], return_index=True)[1]
+
+    # The distinct (month, author) pairs, ordered by month, along with the
+    # number of commits that author made in that month.
+    pairs, pair_commits = np.unique(month_idx * n_authors + codes,
+                                    return_counts=True)
+    pair_month = pairs // n_authors
+    pair_author = pairs % n_authors
+
+    active = np.bincount(pair_month, minlength=n_months)
+    new = np.bincount(month_idx[first], minlength=n_months)
+
+    bounds = np.searchsorted(pair_month, np.arange(n_months + 1))
+    bus_factor = np.zeros(n_months, dtype=np.int64)
+    for i in range(n_months):
+        start, end = bounds[max(0, i - window + 1)], bounds[i + 1]
+        if start == end:
+            continue
+        counts = np.bincount(pair_author[start:end],
+                             weights=pair_commits[start:end])
+        counts = np.sort(counts[counts > 0])[::-1]
+        cumulative = np.cumsum(counts)
+        bus_factor[i] = np.searchsorted(cumulative,
+                                        threshold * cumulative[-1]) + 1
+
+    return {'month': month[0] + np.arange(n_months),
+            'active': active,
+            'new': new,
+            'bus_factor': bus_factor,
+            'monthly_commits': np.bincount(month_idx, minlength=n_months),
+            'author': labels,
+            'first_seen': dates[first],
+            'last_seen': dates[last],
+            'commits': np.bincount(codes, minlength=n_authors)}
+
+
+_SHARED = threading.local()
+
+
+@contextmanager
+def shared_activity(payload):
+    """
+    Within the context, the payload's activity is computed once, however
+    many of the analyses (e.g. the active contributors and bus factor
+    plots) use it.
+
+    """
+    _SHARED.payload, _SHARED.activity = payload, None
+    try:
+        yield
+    finally:
+        _SHARED.payload = _SHARED.activity = None
+
+
+def payload_activity(payload):
+    if getattr(_SHARED, 'payload', None) is payload:
+        if _SHARED.activity is None:
+            _SHARED.activity = _payload_activity(payload)
+        return _SHARED.activity
+    return _payload_activity(payload)
+
+
+def _payload_activity(payload):
+    commits = payload['commits']
+    dates = pd.to_datetime([commit['date'] for commit in commits], utc=True)
+    emails = [commit['email'] for commit in commits]
+    return contributor_activity(dates.tz_localize(None).values, emails)
+
+
+def _month_index(activity):
+    return pd.DatetimeIndex(activity['month'].astype('datetime64[ns]'))
+
+
+def active_contributors_prep(payload):
+    activity = payload_activity(payload)
+    return pd.DataFrame({'active': activity['active'],
+                         'new': activity['new']},
+                        index=_month_index(activity))
+
+
+def active_contributors_viz(monthly):
+    active = go.Scatter(
+        x=monthly.index,
+        y=monthly['active'],
+        name='Active contributors'
+    )
+    new = go.Bar(
+        x=monthly.index,
+        y=monthly['new'],
+        name='New contributors'
+    )
+    return go.Figure(data=[active, new])
+
+
+def bus_factor_prep(payload):
+    activity = payload_activity(payload)
+    return pd.Series(activity['bus_factor'],
+                     index=_month_index(activity))
+
+
+def bus_factor_viz(bus_factor):
+    return go.Figure(data=[go.Scatter(
+        x=bus_factor.index,
+        y=bus_factor.values,
+        line=dict(shape='hv'),
+        name='Bus factor (12 months)'
+    )])
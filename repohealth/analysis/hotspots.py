@@ -0,0 +1,27 @@
+import pandas as pd
+import plotly.graph_objs as go
+
+
+def hotspots_prep(payload):
+    # The churn index is optional (and absent from older caches), in which
+    # case there are no hotspots to show.
+    hotspots = pd.DataFrame.from_dict(payload.get('hotspots', []))
+    if hotspots.empty:
+        hotspots = pd.DataFrame(columns=['path', 'commits', 'insertions',
+                                         'deletions'])
+    # Show the hottest 20 paths, with the hottest at the top of the plot.
+    return hotspots.head(20).iloc[::-1]
+
+
+def hotspots_viz(hotspots):
+    commits = go.Bar(
+        x=hotspots['commits'],
+        y=hotspots['path'],
+        text=(hotspots['insertions'] + hotspots['deletions']).map(
+            '{} lines changed'.format),
+        orientation='h',
+        name='Commits'
+    )
+    fig = go.Figure(data=[commits])
+    fig.layout.yaxis = dict(automargin=True)
+    return fig
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+
+
+def _percentiles_by_group(groups, values, n_groups, percentiles):
+    # Percentiles of ``values`` for each group, where ``groups`` is sorted.
+    result = np.full((n_groups, len(percentiles)), np.nan)
+    bounds = np.searchsorted(groups, np.arange(n_groups + 1))
+    for group, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        if start != end:
+            result[group] = np.percentile(values[start:end], percentiles)
+    return result
+
+
+def issue_lifecycle(created, closed, percentiles=(50, 90)):
+    """
+    Compute the lifecycle of a repository's issues.
+
+    ``created`` and ``closed`` are datetime64 arrays (with NaT for issues
+    that are still open).
+
+    Returns a dictionary with the open backlog at every open/close event
+    ("event_time", "backlog"), and a monthly table as a DataFrame
+    ("monthly") of the number of issues opened and closed, the backlog at
+    the end of the month and the given percentiles of the days taken to
+    close (by month closed).
+
+    """
+    created = np.asarray(created, dtype='datetime64[ns]')
+    closed = np.asarray(closed, dtype='datetime64[ns]')
+    is_closed = ~np.isnat(closed)
+
+    opens = np.sort(created)
+    closes = np.sort(closed[is_closed])
+
+    # Merge the sorted open and close events, and count how many of each
+    # have happened at each point in time.
+    event_time = np.concatenate([opens, closes])
+    event_time.sort(kind='mergesort')
+    backlog = (np.searchsorted(opens, event_time, side='right') -
+               np.searchsorted(closes, event_time, side='right'))
+
+    columns = ['opened', 'closed', 'backlog']
+    columns += ['close_p{}'.format(p) for p in percentiles]
+    if len(opens) == 0:
+        return {'event_time': event_time, 'backlog': backlog,
+                'monthly': pd.DataFrame(columns=columns)}
+
+    first_month = opens[0].astype('datetime64[M]')
+    last_month = event_time[-1].astype('datetime64[M]')
+    months = first_month + np.arange((last_month - first_month).astype(int) + 1)
+    n_months = len(months)
+    month_end = (months + 1).astype('datetime64[ns]')
+
+    def month_index(times):
+        return (times.astype('datetime64[M]') - first_month).astype(np.int64)
+
+    opened = np.bincount(month_index(opens), minlength=n_months)
+    closed_count = np.bincount(month_index(closes), minlength=n_months)
+    month_backlog = (np.searchsorted(opens, month_end, side='left') -
+                     np.searchsorted(closes, month_end, side='left'))
+
+    day = np.timedelta64(1, 'D')
+    order = np.argsort(closed[is_closed], kind='mergesort')
+    time_to_close = ((closed[is_closed] - created[is_closed])[order] / day)
+    close_pct = _percentiles_by_group(month_index(closes), time_to_close,
+                                      n_months, percentiles)
+
+    monthly = pd.DataFrame(
+        np.column_stack([opened, closed_count, month_backlog,
+                         close_pct]),
+        columns=columns, index=pd.DatetimeIndex(months.astype('datetime64[ns]')))
+    monthly[['opened', 'closed', 'backlog']] = (
+        monthly[['opened', 'closed', 'backlog']].astype(np.int64))
+    return {'event_time': event_time, 'backlog': backlog, 'monthly': monthly}
+
+
+def _parse_dates(values):
+    # GitHub dates are always ISO 8601 in UTC (e.g. "2018-01-01T10:00:00Z"),
+    # which numpy parses much faster than the general pandas machinery.
+    return np.array([value[:-1] if value else 'NaT' for value in values],
+                    dtype='datetime64[s]').astype('datetime64[ns]')
+
+
+def payload_lifecycle(payload):
+    issues = payload['github']['issues']
+    created = _parse_dates([issue['created_at'] for issue in issues])
+    closed = _parse_dates([issue['closed_at'] for issue in issues])
+    return issue_lifecycle(created, closed)
+
+
+def open_backlog_prep(payload):
+    lifecycle = payload_lifecycle(payload)
+    # Keep only the backlog at the end of each day, so that the plot stays
+    # small for repositories with a great many issues.
+    day = lifecycle['event_time'].astype('datetime64[D]')
+    end_of_day = np.ones(len(day), dtype=bool)
+    end_of_day[:-1] = day[1:] != day[:-1]
+    return pd.Series(lifecycle['backlog'][end_of_day],
+                     index=pd.DatetimeIndex(lifecycle['event_time'][end_of_day]))
+
+
+def open_backlog_viz(backlog):
+    return go.Figure(data=[go.Scatter(
+        x=backlog.index,
+        y=backlog.values,
+        line=dict(shape='hv'),
+        name='Open issues'
+    )])
+
+
+def time_to_close_prep(payload):
+    return payload_lifecycle(payload)['monthly']
+
+
+def time_to_close_viz(monthly):
+    traces = []
+    for column in monthly.columns:
+        if column.startswith('close_p') and monthly[column].notnull().any():
+            traces.append(go.Scatter(
+                x=monthly.index,
+                y=monthly[column],
+                connectgaps=False,
+                name='Days to close ({}th percentile)'.format(column[len('close_p'):])
+            ))
+    fig = go.Figure(data=traces)
+    fig.layout.yaxis = dict(type='log')
+    return fig
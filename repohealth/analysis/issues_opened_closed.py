@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import plotly.graph_objs as go
 
@@ -9,21 +10,23 @@ def issues_prep(payload):
 
     issues_open = issues.sort_values(by='created_at')
 
-    issues_closed = issues.sort_values(by='closed_at')
-    return issues_open, issues_closed[issues_closed['closed_at'].notnull()]
+    # Only the closed issues need ordering by their close date.
+    issues_closed = issues[issues['closed_at'].notnull()]
+    issues_closed = issues_closed.sort_values(by='closed_at')
+    return issues_open, issues_closed
 
 
 def issues_viz(issues_open_and_closed):
     issues_open, issues_closed = issues_open_and_closed
     v_issues_open = go.Scatter(
         x=issues_open['created_at'],
-        y=[i + 1 for i in range(len(issues_open['created_at']))],
+        y=np.arange(len(issues_open)) + 1,
         text=issues_open['user/login'],
         name='Issues opened'
     )
     v_issues_closed = go.Scatter(
         x=issues_closed['closed_at'],
-        y=[i + 1 for i in range(len(issues_closed['closed_at']))],
+        y=np.arange(len(issues_closed)) + 1,
         text=issues_closed['user/login'],
         name='Issues closed'
     )
@@ -0,0 +1,100 @@
+"""
+Benchmarks of the repohealth hot paths.
+
+Each benchmark module is runnable (``python -m repohealth.benchmarks.<name>``)
+and writes its results as JSON, so that the results of different versions
+can be compared with ``python -m repohealth.benchmarks.compare``.
+
+"""
+import datetime
+import gc
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+
+def measure(fn, *args, trace_memory=True, **kwargs):
+    """
+    Call the given function, and return its result along with a dictionary
+    of the wall time ("seconds"), the peak memory allocated by Python
+    during the call ("peak_bytes", if ``trace_memory``), and the peak RSS
+    of the process so far ("max_rss_bytes").
+
+    """
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+        duration = time.perf_counter() - start
+        measurement = {'seconds': duration}
+        if trace_memory:
+            measurement['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    # ru_maxrss is in KB on Linux (and bytes on macOS).
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        max_rss *= 1024
+    measurement['max_rss_bytes'] = max_rss
+    return result, measurement
+
+
+def _source_version():
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'], cwd=here,
+            stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def environment():
+    """
+    A description of the environment that the benchmarks were run in.
+
+    """
+    git_version = subprocess.check_output(['git', '--version'])
+    return {'repohealth': _source_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'git': git_version.decode('ascii').strip(),
+            'date': datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')}
+
+
+def write_results(fname, suite, results):
+    """
+    Write the benchmark results (a list of dictionaries, each with at least
+    a "name" key) to the given JSON file.
+
+    """
+    content = {'suite': suite,
+               'environment': environment(),
+               'results': results}
+    dirname = os.path.dirname(os.path.abspath(fname))
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    with open(fname, 'w') as fh:
+        json.dump(content, fh, indent=2, sort_keys=True)
+    return content
+
+
+def report(result):
+    """
+    Print a one line, human readable, summary of a benchmark result.
+
+    """
+    line = '{name:<40} {seconds:>9.3f}s'.format(**result)
+    if 'peak_bytes' in result:
+        line += ' {:>9.1f}MB peak'.format(result['peak_bytes'] / 1e6)
+    line += ' {:>9.1f}MB max RSS'.format(result['max_rss_bytes'] / 1e6)
+    print(line)
+    sys.stdout.flush()
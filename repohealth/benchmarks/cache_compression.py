@@ -0,0 +1,95 @@
+"""
+Benchmark the compression of the cache files.
+
+For each scale of synthetic repository, and each compression (see
+``repohealth.generate.CACHE_COMPRESSION``), this writes and loads the
+commits and GitHub cache files, reporting their size (and the reduction
+relative to uncompressed files) alongside the write and load times::
+
+    python -m repohealth.benchmarks.cache_compression --scales 1000,100000
+
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+import git
+
+import repohealth.generate
+import repohealth.git
+from repohealth.benchmarks import measure, report, write_results
+from repohealth.benchmarks.synthetic import (
+    RepoShape, synthetic_github, synthetic_repo)
+
+
+def run(scale, workdir, compressions):
+    shape = RepoShape(scale, n_authors=max(10, scale // 200))
+    repo_dir = os.path.join(workdir, shape.key())
+    if not os.path.exists(repo_dir):
+        print('Generating synthetic repository {}'.format(shape))
+        synthetic_repo(shape, repo_dir)
+    uuid = 'synthetic/{}'.format(shape.key())
+    contents = [('commits', repohealth.git.commits(git.Repo(repo_dir))),
+                ('github', synthetic_github(uuid, n_issues=scale // 10,
+                                            n_stargazers=scale // 5))]
+
+    results = []
+    uncompressed = {}
+    cache_dir = tempfile.mkdtemp(dir=workdir)
+    try:
+        for compression in compressions:
+            repohealth.generate.CACHE_COMPRESSION = compression
+            for name, content in contents:
+                fname = os.path.join(cache_dir, '{}.{}.json'.format(
+                    name, compression))
+                _, write = measure(repohealth.generate.write_cache, fname,
+                                   content, trace_memory=False)
+                _, load = measure(repohealth.generate.load_cache, fname)
+                size = os.path.getsize(fname)
+                uncompressed.setdefault(name, size)
+                load.update(name='cache.{}.{}'.format(name, compression),
+                            scale=scale, shape=shape.key(),
+                            compression=compression, file_bytes=size,
+                            size_ratio=size / uncompressed[name],
+                            write_seconds=write['seconds'])
+                report(load)
+                print('{:>40} {:>9.1f}MB ({:.0%} of uncompressed), written '
+                      'in {:.3f}s'.format('', size / 1e6,
+                                          load['size_ratio'],
+                                          write['seconds']))
+                results.append(load)
+    finally:
+        shutil.rmtree(cache_dir)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scales', default='1000,100000',
+                        help='Comma separated numbers of commits.')
+    parser.add_argument('--compressions', default='none,gzip,zstd',
+                        help='Comma separated compressions to compare (the '
+                             'first being the baseline).')
+    parser.add_argument('--workdir',
+                        default=os.path.join(tempfile.gettempdir(),
+                                             'repohealth-benchmarks'),
+                        help='Where to keep the synthetic repositories.')
+    parser.add_argument('--output',
+                        default='bench_results/cache_compression.json',
+                        help='The JSON file to write the results to.')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.workdir):
+        os.makedirs(args.workdir)
+
+    results = []
+    for scale in [int(scale) for scale in args.scales.split(',')]:
+        results.extend(run(scale, args.workdir,
+                           args.compressions.split(',')))
+    write_results(args.output, 'cache_compression', results)
+    print('Results written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
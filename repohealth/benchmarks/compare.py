@@ -0,0 +1,73 @@
+"""
+Compare two sets of benchmark results, and flag any regressions.
+
+    python -m repohealth.benchmarks.compare old.json new.json
+
+Exits with a non-zero status if any benchmark got slower (or used more
+memory) by more than the given threshold.
+
+"""
+import argparse
+import json
+import sys
+
+
+METRICS = ['seconds', 'peak_bytes',
+           'p50_seconds', 'p95_seconds', 'p99_seconds']
+
+
+def _key(result):
+    return (result['name'], result.get('scale'))
+
+
+def compare(old, new, threshold=0.2):
+    """
+    Return a list of (name, scale, metric, old value, new value, ratio) for
+    each of the benchmarks found in both sets of results, and the subset of
+    those that are regressions.
+
+    """
+    old_results = {_key(result): result for result in old['results']}
+    rows, regressions = [], []
+    for result in new['results']:
+        previous = old_results.get(_key(result))
+        if previous is None:
+            continue
+        for metric in METRICS:
+            if metric not in result or not previous.get(metric):
+                continue
+            ratio = result[metric] / previous[metric]
+            row = _key(result) + (metric, previous[metric], result[metric],
+                                  ratio)
+            rows.append(row)
+            if ratio > 1 + threshold:
+                regressions.append(row)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='The fractional increase that is a regression.')
+    args = parser.parse_args()
+
+    with open(args.old, 'r') as fh:
+        old = json.load(fh)
+    with open(args.new, 'r') as fh:
+        new = json.load(fh)
+
+    print('Comparing {} ({}) with {} ({})'.format(
+        args.old, old['environment']['repohealth'],
+        args.new, new['environment']['repohealth']))
+    rows, regressions = compare(old, new, args.threshold)
+    for row in rows:
+        flag = ' <-- regression' if row in regressions else ''
+        print('{:<30} {:>8} {:<11} {:>12.4g} {:>12.4g} {:>6.2f}x{}'.format(
+            row[0], str(row[1]), *row[2:], flag))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
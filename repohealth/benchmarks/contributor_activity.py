@@ -0,0 +1,49 @@
+"""
+Benchmark the contributor activity engine on synthetic commit arrays.
+
+Run with ``python -m repohealth.benchmarks.contributor_activity``.
+
+"""
+import argparse
+
+import numpy as np
+
+from repohealth.analysis.contributor_activity import contributor_activity
+from repohealth.benchmarks import measure, report, write_results
+
+
+def synthetic_commits(n_commits, n_authors=5000, years=15, seed=0):
+    rng = np.random.RandomState(seed)
+    start = np.datetime64('2004-01-01', 's').astype(np.int64)
+    span = years * 365 * 24 * 60 * 60
+    dates = np.sort(start + rng.randint(0, span, n_commits))
+    # A Zipf-like spread of commits, as a handful of authors dominate.
+    authors = np.minimum(rng.zipf(1.3, n_commits), n_authors)
+    authors = np.array(['author{}@example.com'.format(i)
+                        for i in range(n_authors + 1)])[authors]
+    return dates.astype('datetime64[s]'), authors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scales', default='1000,100000,1000000',
+                        help='Comma separated numbers of commits.')
+    parser.add_argument('--output',
+                        default='bench_results/contributor_activity.json',
+                        help='The JSON file to write the results to.')
+    args = parser.parse_args()
+
+    results = []
+    for scale in [int(scale) for scale in args.scales.split(',')]:
+        dates, authors = synthetic_commits(scale)
+        activity, measurement = measure(contributor_activity, dates, authors)
+        measurement.update(name='contributor_activity', scale=scale,
+                           n_authors=len(activity['author']),
+                           n_months=len(activity['month']))
+        report(measurement)
+        results.append(measurement)
+    write_results(args.output, 'contributor_activity', results)
+
+
+if __name__ == '__main__':
+    main()
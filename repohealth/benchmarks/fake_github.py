@@ -0,0 +1,421 @@
+"""
+A fake GitHub API server, for benchmarking (and fault injecting) the
+GitHub fetch code without touching the real API.
+
+The server serves the repo, paginated issues and stargazers endpoints
+(including ``Link`` headers and the ``star+json`` media type) of any
+repos added to it, with configurable latency, error rates, rate-limit
+headers and secondary rate limits. It also answers the GraphQL queries of
+``repohealth.github.graphql`` (but not arbitrary GraphQL)::
+
+    fake = FakeGitHub(latency=0.05, error_rate=0.01)
+    fake.add_repo('org/repo', synthetic_github('org/repo', 5000, 5000))
+    base_url = fake.start_in_thread()
+    # Now point the fetch code at base_url (e.g. with GITHUB_API_URL).
+
+"""
+import asyncio
+import collections
+import json
+import math
+import random
+import threading
+import time
+from urllib.parse import urlencode
+
+import tornado.gen
+import tornado.httpserver
+import tornado.ioloop
+import tornado.netutil
+import tornado.web
+
+
+STAR_MEDIA_TYPE = 'application/vnd.github.v3.star+json'
+
+
+class FakeGitHub(object):
+    """
+    The state and configuration of a fake GitHub API.
+
+    Parameters
+    ----------
+    latency : float
+        The number of seconds each response is delayed by.
+    error_rate : float
+        The fraction of requests that fail with a 502.
+    rate_limit : int
+        The number of requests each token may make (per hour).
+    secondary_limit : int or None
+        The number of concurrent requests each token may make before
+        getting a secondary rate limit 403 (with a ``Retry-After`` header).
+    retry_after : int
+        The number of seconds in the ``Retry-After`` header of secondary
+        rate limit responses.
+
+    """
+    def __init__(self, latency=0, error_rate=0, rate_limit=5000,
+                 secondary_limit=None, retry_after=1, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.secondary_limit = secondary_limit
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+
+        self.repos = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        #: Counts of requests, keyed by endpoint and by response status.
+        self.stats = collections.Counter()
+        self.bytes_sent = 0
+        self.used = collections.Counter()
+        #: The GraphQL rate-limit points used, which are a separate quota.
+        self.graphql_used = collections.Counter()
+        self.in_flight = collections.Counter()
+        self.reset_time = int(time.time()) + 3600
+
+    def add_repo(self, uuid, github):
+        """
+        Add a repo, with the GitHub data in the form of a CACHE_GH file
+        (see ``repohealth.benchmarks.synthetic.synthetic_github``).
+
+        """
+        self.repos[uuid.lower()] = github
+
+    def app(self):
+        return tornado.web.Application([
+            (r'/repos/([\w\-\.]+/[\w\-\.]+)', RepoHandler, dict(fake=self)),
+            (r'/repos/([\w\-\.]+/[\w\-\.]+)/issues', IssuesHandler,
+             dict(fake=self)),
+            (r'/repos/([\w\-\.]+/[\w\-\.]+)/stargazers', StargazersHandler,
+             dict(fake=self)),
+            (r'/graphql', GraphQLHandler, dict(fake=self)),
+            (r'/rate_limit', RateLimitHandler, dict(fake=self)),
+        ])
+
+    def listen(self, port=0, address='127.0.0.1'):
+        """
+        Start serving on the current IOLoop, and return the base URL.
+
+        """
+        sockets = tornado.netutil.bind_sockets(port, address)
+        self.server = tornado.httpserver.HTTPServer(self.app())
+        self.server.add_sockets(sockets)
+        port = sockets[0].getsockname()[1]
+        self.base_url = 'http://{}:{}'.format(address, port)
+        return self.base_url
+
+    def start_in_thread(self, port=0, address='127.0.0.1'):
+        """
+        Start serving from a daemon thread (with its own IOLoop), so that
+        blocking clients (such as PyGithub) can be used against the server.
+        Returns the base URL.
+
+        """
+        started = threading.Event()
+
+        def serve():
+            asyncio.set_event_loop(asyncio.new_event_loop())
+            self.io_loop = tornado.ioloop.IOLoop.current()
+            self.listen(port, address)
+            started.set()
+            self.io_loop.start()
+
+        self.thread = threading.Thread(target=serve, daemon=True)
+        self.thread.start()
+        started.wait()
+        return self.base_url
+
+    def stop(self):
+        def stop():
+            self.server.stop()
+            self.io_loop.stop()
+        self.io_loop.add_callback(stop)
+        self.thread.join()
+
+
+class FakeHandler(tornado.web.RequestHandler):
+    endpoint = None
+
+    def initialize(self, fake):
+        self.fake = fake
+
+    def finish(self, chunk=None):
+        # The request is no longer in flight once its response is sent (and
+        # before the client can have received it).
+        token = getattr(self, '_in_flight', None)
+        if token is not None:
+            self.fake.in_flight[token] -= 1
+            self._in_flight = None
+        return super(FakeHandler, self).finish(chunk)
+
+    def token(self):
+        auth = self.request.headers.get('Authorization', '')
+        for scheme in ('token ', 'bearer '):
+            if auth.startswith(scheme):
+                return auth[len(scheme):]
+        return 'anonymous:{}'.format(self.request.remote_ip)
+
+    def error(self, status, message):
+        self.set_status(status)
+        self.finish({'message': message,
+                     'documentation_url': 'https://developer.github.com/v3'})
+
+    def quota(self):
+        """The counter of the quota used by each token."""
+        return self.fake.used
+
+    def get(self, *args):
+        return self.respond(args[0], *args)
+
+    @tornado.gen.coroutine
+    def respond(self, uuid, *args):
+        fake = self.fake
+        used = self.quota()
+        token = self.token()
+        fake.stats[self.endpoint] += 1
+
+        fake.in_flight[token] += 1
+        self._in_flight = token
+        try:
+            if fake.latency:
+                yield tornado.gen.sleep(fake.latency)
+            if (fake.secondary_limit is not None and
+                    fake.in_flight[token] > fake.secondary_limit):
+                fake.stats['403-secondary'] += 1
+                self.set_header('Retry-After', str(fake.retry_after))
+                self.error(403, 'You have exceeded a secondary rate limit. '
+                                'Please wait a few minutes before you try '
+                                'again.')
+                return
+
+            used[token] += 1
+            remaining = max(fake.rate_limit - used[token], 0)
+            self.set_header('X-RateLimit-Limit', str(fake.rate_limit))
+            self.set_header('X-RateLimit-Remaining', str(remaining))
+            self.set_header('X-RateLimit-Used', str(used[token]))
+            self.set_header('X-RateLimit-Reset', str(fake.reset_time))
+            if used[token] > fake.rate_limit:
+                fake.stats['403-rate-limit'] += 1
+                self.error(403, 'API rate limit exceeded.')
+                return
+
+            if fake.error_rate and fake.random.random() < fake.error_rate:
+                fake.stats['502'] += 1
+                self.error(502, 'Server Error')
+                return
+
+            repo = fake.repos.get(uuid.lower())
+            if repo is None:
+                fake.stats['404'] += 1
+                self.error(404, 'Not Found')
+                return
+
+            content = json.dumps(self.content(repo, *args)).encode('utf-8')
+            fake.stats['200'] += 1
+            fake.bytes_sent += len(content)
+            self.set_header('Content-Type', 'application/json; charset=utf-8')
+            self.finish(content)
+        finally:
+            if self._in_flight is not None:
+                # Failed before responding.
+                fake.in_flight[token] -= 1
+                self._in_flight = None
+
+    def base_url(self):
+        return '{}://{}'.format(self.request.protocol, self.request.host)
+
+    def paginate(self, items):
+        """
+        Return the requested page of items, and set the Link header in the
+        same way that GitHub does.
+
+        """
+        per_page = min(int(self.get_argument('per_page', 30)), 100)
+        page = int(self.get_argument('page', 1))
+        last = max(int(math.ceil(len(items) / per_page)), 1)
+
+        def url(page):
+            args = {key: values[-1].decode('utf-8')
+                    for key, values in self.request.query_arguments.items()}
+            args.update(page=page, per_page=per_page)
+            return '{}{}?{}'.format(self.base_url(), self.request.path,
+                                    urlencode(sorted(args.items())))
+
+        links = []
+        if page > 1:
+            links.append((url(page - 1), 'prev'))
+        if page < last:
+            links.extend([(url(page + 1), 'next'), (url(last), 'last')])
+        if page > 1:
+            links.append((url(1), 'first'))
+        if links:
+            self.set_header('Link', ', '.join('<{}>; rel="{}"'.format(*link)
+                                              for link in links))
+        return items[(page - 1) * per_page:page * per_page]
+
+
+def _user(login, user_id):
+    url = 'https://api.github.com/users/{}'.format(login)
+    return {'login': login, 'id': user_id,
+            'avatar_url': 'https://avatars.githubusercontent.com/u/{}?v=4'
+                          ''.format(user_id),
+            'gravatar_id': '', 'url': url, 'html_url': url,
+            'followers_url': url + '/followers', 'gists_url': url + '/gists',
+            'repos_url': url + '/repos', 'events_url': url + '/events',
+            'type': 'User', 'site_admin': False}
+
+
+class RepoHandler(FakeHandler):
+    endpoint = 'repo'
+
+    def content(self, github, uuid):
+        base = '{}/repos/{}'.format(self.base_url(), github['repo']['full_name'])
+        repo = dict(github['repo'])
+        repo.update(url=base,
+                    issues_url=base + '/issues{/number}',
+                    stargazers_url=base + '/stargazers',
+                    stargazers_count=len(github['stargazers']))
+        repo.setdefault('id', abs(hash(uuid)) % 10 ** 8)
+        repo.setdefault('owner', _user(uuid.split('/')[0], 1))
+        return repo
+
+
+class IssuesHandler(FakeHandler):
+    endpoint = 'issues'
+
+    def content(self, github, uuid):
+        issues = github['issues']
+        if self.get_argument('state', 'open') != 'all':
+            state = self.get_argument('state', 'open')
+            issues = [issue for issue in issues if issue['state'] == state]
+        since = self.get_argument('since', None)
+        if since is not None:
+            # The issues updated at or after the given (ISO 8601) time.
+            issues = [issue for issue in issues
+                      if (issue['closed_at'] or issue['created_at']) >= since]
+        # GitHub returns the newest issues first.
+        issues = self.paginate(issues[::-1])
+        base = '{}/repos/{}'.format(self.base_url(), github['repo']['full_name'])
+        return [{'url': '{}/issues/{}'.format(base, issue['number']),
+                 'number': issue['number'],
+                 'title': 'Issue number {}'.format(issue['number']),
+                 'user': _user(issue['user/login'], issue['user/id']),
+                 'labels': [{'name': 'label', 'color': 'ffffff',
+                             'default': False}],
+                 'state': issue['state'],
+                 'locked': False,
+                 'comments': issue['comments'],
+                 'created_at': issue['created_at'],
+                 'updated_at': issue['closed_at'] or issue['created_at'],
+                 'closed_at': issue['closed_at'],
+                 'author_association': 'NONE',
+                 # Issue bodies are often a few KB.
+                 'body': 'Something is broken. ' * 100}
+                for issue in issues]
+
+
+class StargazersHandler(FakeHandler):
+    endpoint = 'stargazers'
+
+    def content(self, github, uuid):
+        stargazers = self.paginate(github['stargazers'])
+        users = [_user(star['user/login'], star['user/id'])
+                 for star in stargazers]
+        if self.request.headers.get('Accept') != STAR_MEDIA_TYPE:
+            return users
+        return [{'starred_at': star['starred_at'], 'user': user}
+                for star, user in zip(stargazers, users)]
+
+
+def _node(issue, pull):
+    state = issue['state'].upper()
+    if pull and state == 'CLOSED':
+        state = 'MERGED'
+    return {'number': issue['number'], 'state': state,
+            'createdAt': issue['created_at'], 'closedAt': issue['closed_at'],
+            'updatedAt': issue['closed_at'] or issue['created_at'],
+            'comments': {'totalCount': issue['comments']},
+            'author': {'login': issue['user/login'],
+                       'databaseId': issue['user/id']}}
+
+
+class GraphQLHandler(FakeHandler):
+    """
+    Answers the queries of ``repohealth.github.graphql``, which are told
+    apart by their variables. Each query costs a point of the (separate)
+    GraphQL quota, as queries of up to 100 nodes per connection do on
+    GitHub. Every third issue is a pull request.
+
+    """
+    endpoint = 'graphql'
+
+    def quota(self):
+        return self.fake.graphql_used
+
+    def post(self):
+        self.variables = json.loads(self.request.body)['variables']
+        uuid = '{owner}/{name}'.format(**self.variables)
+        return self.respond(uuid, uuid)
+
+    def connection(self, items, first, after):
+        start = int(after or 0)
+        end = start + first
+        return {'pageInfo': {'hasNextPage': end < len(items),
+                             'endCursor': str(min(end, len(items)))},
+                'items': items[start:end]}
+
+    def content(self, github, uuid):
+        variables = self.variables
+        repository = {}
+        if 'cursor' in variables:
+            page = self.connection(github['stargazers'], 100,
+                                   variables['cursor'])
+            page['edges'] = [{'starredAt': star['starred_at'],
+                              'node': {'login': star['user/login'],
+                                       'databaseId': star['user/id']}}
+                             for star in page.pop('items')]
+            repository['stargazers'] = page
+        else:
+            # Newest first, like the issues of the REST API.
+            issues = github['issues'][::-1]
+            if variables['issues']:
+                since = variables.get('since')
+                selected = [issue for issue in issues
+                            if issue['number'] % 3 and
+                            (since is None or
+                             (issue['closed_at'] or issue['created_at']) >=
+                             since)]
+                page = self.connection(selected, 100,
+                                       variables['issuesCursor'])
+                page['nodes'] = [_node(issue, False)
+                                 for issue in page.pop('items')]
+                repository['issues'] = page
+            if variables['pulls']:
+                pulls = sorted(
+                    [issue for issue in issues if not issue['number'] % 3],
+                    key=lambda issue: (issue['closed_at'] or
+                                       issue['created_at']),
+                    reverse=True)
+                page = self.connection(pulls, 100, variables['pullsCursor'])
+                page['nodes'] = [_node(issue, True)
+                                 for issue in page.pop('items')]
+                repository['pullRequests'] = page
+        used = self.fake.graphql_used[self.token()]
+        return {'data': {'rateLimit': {
+                             'cost': 1,
+                             'remaining': max(self.fake.rate_limit - used, 0)},
+                         'repository': repository}}
+
+
+class RateLimitHandler(FakeHandler):
+    endpoint = 'rate_limit'
+
+    @tornado.gen.coroutine
+    def get(self):
+        token = self.token()
+        remaining = max(self.fake.rate_limit - self.fake.used[token], 0)
+        core = {'limit': self.fake.rate_limit, 'remaining': remaining,
+                'reset': self.fake.reset_time}
+        self.finish({'resources': {'core': core}, 'rate': core})
@@ -0,0 +1,48 @@
+"""
+An in-process fake of the (few) S3 client methods that the shared cache
+uses, for testing and benchmarking it without an object store::
+
+    fake = FakeS3()
+    store = S3Store('bucket', 'repohealth/', client=fake)
+
+A single fake may be shared by several local caches, standing in for the
+store that is shared by several instances of the service.
+
+"""
+import io
+import threading
+
+
+class ClientError(Exception):
+    """Like botocore's ClientError, with the error code in the response."""
+    def __init__(self, code, operation):
+        super(ClientError, self).__init__(
+            'An error occurred ({}) when calling the {} operation'.format(
+                code, operation))
+        self.response = {'Error': {'Code': code}}
+
+
+class FakeS3(object):
+    """
+    The objects of the fake's buckets, and the number of calls of each
+    operation (in ``stats``).
+
+    """
+    def __init__(self):
+        self.objects = {}
+        self.stats = {'get_object': 0, 'put_object': 0}
+        self._lock = threading.Lock()
+
+    def get_object(self, Bucket, Key):
+        with self._lock:
+            self.stats['get_object'] += 1
+            if (Bucket, Key) not in self.objects:
+                raise ClientError('NoSuchKey', 'GetObject')
+            return {'Body': io.BytesIO(self.objects[(Bucket, Key)])}
+
+    def put_object(self, Bucket, Key, Body):
+        if hasattr(Body, 'read'):
+            Body = Body.read()
+        with self._lock:
+            self.stats['put_object'] += 1
+            self.objects[(Bucket, Key)] = bytes(Body)
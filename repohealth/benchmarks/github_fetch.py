@@ -0,0 +1,147 @@
+"""
+Benchmark fetching issues and stargazers from a fake GitHub API.
+
+For each repo size, this reports the throughput of
+``repohealth.github.issues.repo_issues`` and
+``repohealth.github.stargazers.repo_stargazers``, along with the number of
+requests (and the rate-limit quota) that they used. Latency and faults
+(errors and secondary rate limits) can be injected to measure the retry
+behaviour::
+
+    python -m repohealth.benchmarks.github_fetch --sizes 1000,10000 \\
+        --latency 0.1 --error-rate 0.01 --output bench_results/github.json
+
+Note that the fake server runs in a thread of the benchmarking process, so
+the timings (and, with ``--memory``, the peak memory) include those of
+serving the responses. ``--no-projection`` keeps the items as they are
+returned by the API, rather than projecting each page as it arrives.
+
+``--backends rest,graphql`` compares the REST fetchers with those of
+``repohealth.github.graphql``, in requests, quota and time::
+
+    python -m repohealth.benchmarks.github_fetch --backends rest,graphql
+
+"""
+import argparse
+import logging
+from functools import partial
+
+from github import Github
+import tornado.ioloop
+
+import repohealth.github.graphql
+import repohealth.github.issues
+import repohealth.github.stargazers
+from repohealth.benchmarks import measure, report, write_results
+from repohealth.benchmarks.fake_github import FakeGitHub
+from repohealth.benchmarks.synthetic import synthetic_github
+
+
+TOKEN = 'benchmark-token'
+
+#: The fetchers of the issues and stargazers of each backend.
+BACKENDS = {
+    'rest': [('issues', repohealth.github.issues.repo_issues),
+             ('stargazers', repohealth.github.stargazers.repo_stargazers)],
+    'graphql': [('issues', repohealth.github.graphql.repo_issues),
+                ('stargazers', repohealth.github.graphql.repo_stargazers)],
+}
+
+
+def run(fake, base_url, size, trace_memory=False, projection=True,
+        backend='rest'):
+    uuid = 'benchmark/repo-{}'.format(size)
+    fake.add_repo(uuid, synthetic_github(uuid, n_issues=size,
+                                         n_stargazers=size))
+    repo = Github(TOKEN, base_url=base_url).get_repo(uuid)
+    loop = tornado.ioloop.IOLoop()
+
+    results = []
+    for endpoint, fetch in BACKENDS[backend]:
+        fake.reset_stats()
+        # GraphQL only ever requests the fields that are kept.
+        kwargs = {}
+        if not projection and backend == 'rest':
+            kwargs['project'] = None
+        items, measurement = measure(loop.run_sync,
+                                     partial(fetch, repo, TOKEN, **kwargs),
+                                     trace_memory=trace_memory)
+        stats = fake.stats
+        if backend == 'graphql':
+            requests, quota_used = stats['graphql'], fake.graphql_used[TOKEN]
+        else:
+            requests, quota_used = stats[endpoint], fake.used[TOKEN]
+        name = 'github.{}'.format(endpoint)
+        if backend != 'rest':
+            name += '.' + backend
+        elif not projection:
+            name += '.raw'
+        measurement.update(
+            name=name,
+            backend=backend,
+            size=size,
+            items=len(items),
+            items_per_second=len(items) / measurement['seconds'],
+            requests=requests,
+            requests_per_second=requests / measurement['seconds'],
+            quota_used=quota_used,
+            errors=stats['502'],
+            rate_limited=stats['403-rate-limit'],
+            secondary_rate_limited=stats['403-secondary'],
+            bytes_received=fake.bytes_sent)
+        report(measurement)
+        print('    {items} of {size} items, {items_per_second:.0f} items/s, '
+              '{requests} requests ({quota_used} quota), {errors} errors, '
+              '{secondary_rate_limited} secondary rate limited'
+              ''.format(**measurement))
+        results.append(measurement)
+    loop.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default='1000,10000,50000',
+                        help='Comma separated numbers of issues (and '
+                             'stargazers) per repo.')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='The latency (in seconds) of each response.')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='The fraction of requests that fail with a 502.')
+    parser.add_argument('--rate-limit', type=int, default=5000,
+                        help='The number of requests allowed per token.')
+    parser.add_argument('--secondary-limit', type=int, default=None,
+                        help='The number of concurrent requests allowed '
+                             'before secondary rate limiting.')
+    parser.add_argument('--memory', action='store_true',
+                        help='Trace the peak memory allocated (slower).')
+    parser.add_argument('--no-projection', action='store_true',
+                        help="Don't project the items of each page.")
+    parser.add_argument('--backends', default='rest',
+                        help='Comma separated fetch backends to compare '
+                             '({}).'.format(', '.join(sorted(BACKENDS))))
+    parser.add_argument('--output', default='bench_results/github_fetch.json',
+                        help='The JSON file to write the results to.')
+    args = parser.parse_args()
+
+    # The injected faults would otherwise be logged by the fake server.
+    logging.getLogger('tornado.access').setLevel(logging.CRITICAL)
+    fake = FakeGitHub(latency=args.latency, error_rate=args.error_rate,
+                      rate_limit=args.rate_limit,
+                      secondary_limit=args.secondary_limit)
+    base_url = fake.start_in_thread()
+
+    results = []
+    try:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            for backend in args.backends.split(','):
+                results.extend(run(fake, base_url, size, args.memory,
+                                   not args.no_projection, backend))
+    finally:
+        fake.stop()
+    write_results(args.output, 'github_fetch', results)
+    print('Results written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark the ingestion hot path against synthetic repositories.
+
+For each scale, this times (and memory profiles) parsing the git log with
+``repohealth.git.commits``, building the churn index, writing and loading
+the cache files, and rendering the visualisations.
+
+Run with, for example::
+
+    python -m repohealth.benchmarks.ingestion --scales 1000,100000 \\
+        --output bench_results/ingestion.json
+
+The synthetic repositories are kept in ``--workdir`` so that they only
+need to be generated once.
+
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+import git
+
+import repohealth.generate
+import repohealth.git
+from repohealth.benchmarks import measure, report, write_results
+from repohealth.benchmarks.synthetic import (
+    RepoShape, synthetic_github, synthetic_repo)
+
+
+def run(scale, workdir, trace_memory=True, visualisations=True):
+    shape = RepoShape(scale, n_authors=max(10, scale // 200))
+    results = []
+
+    def record(name, fn, *args):
+        result, measurement = measure(fn, *args, trace_memory=trace_memory)
+        measurement.update(name=name, scale=scale, shape=shape.key())
+        report(measurement)
+        results.append(measurement)
+        return result
+
+    repo_dir = os.path.join(workdir, shape.key())
+    if not os.path.exists(repo_dir):
+        print('Generating synthetic repository {}'.format(shape))
+        record('synthetic_repo', synthetic_repo, shape, repo_dir)
+    repo = git.Repo(repo_dir)
+
+    payload = record('git.commits', repohealth.git.commits, repo)
+    churn = record('git.churn', repohealth.git.churn, repo)
+
+    uuid = 'synthetic/{}'.format(shape.key())
+    github = synthetic_github(uuid, n_issues=scale // 10,
+                              n_stargazers=scale // 5)
+
+    cache_dir = tempfile.mkdtemp(dir=workdir)
+    commits_cache = os.path.join(cache_dir, 'commits.json')
+    github_cache = os.path.join(cache_dir, 'github.json')
+    for name, fname, content in [('commits', commits_cache, payload),
+                                 ('github', github_cache, github)]:
+        record('cache.write.' + name, repohealth.generate.write_cache,
+               fname, content)
+        results[-1]['file_bytes'] = os.path.getsize(fname)
+    payload = record('cache.load.commits', repohealth.generate.load_cache,
+                     commits_cache)
+    payload['github'] = record('cache.load.github',
+                               repohealth.generate.load_cache, github_cache)
+    shutil.rmtree(cache_dir)
+    payload['hotspots'] = repohealth.git.churn_hotspots(churn)
+
+    if visualisations:
+        record('generate.visualisations',
+               repohealth.generate.visualisations, payload)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scales', default='1000,100000,1000000',
+                        help='Comma separated numbers of commits.')
+    parser.add_argument('--workdir',
+                        default=os.path.join(tempfile.gettempdir(),
+                                             'repohealth-benchmarks'),
+                        help='Where to keep the synthetic repositories.')
+    parser.add_argument('--output', default='bench_results/ingestion.json',
+                        help='The JSON file to write the results to.')
+    parser.add_argument('--no-memory', action='store_true',
+                        help="Don't trace memory allocations (faster).")
+    parser.add_argument('--no-visualisations', action='store_true',
+                        help="Don't benchmark generate.visualisations.")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.workdir):
+        os.makedirs(args.workdir)
+
+    results = []
+    for scale in [int(scale) for scale in args.scales.split(',')]:
+        results.extend(run(scale, args.workdir,
+                           trace_memory=not args.no_memory,
+                           visualisations=not args.no_visualisations))
+    write_results(args.output, 'ingestion', results)
+    print('Results written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Benchmark the issue lifecycle engine on synthetic issue arrays.
+
+Run with ``python -m repohealth.benchmarks.issue_lifecycle``.
+
+"""
+import argparse
+
+import numpy as np
+
+from repohealth.analysis.issue_lifecycle import issue_lifecycle
+from repohealth.benchmarks import measure, report, write_results
+
+
+def synthetic_issues(n_issues, years=10, seed=0):
+    rng = np.random.RandomState(seed)
+    start = np.datetime64('2010-01-01', 's').astype(np.int64)
+    created = start + rng.randint(0, years * 365 * 24 * 3600, n_issues)
+    closed = (created + rng.randint(0, 365 * 24 * 3600, n_issues)).astype(
+        'datetime64[s]').astype('datetime64[ns]')
+    # A third of the issues are still open.
+    closed[::3] = np.datetime64('NaT')
+    return created.astype('datetime64[s]'), closed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scales', default='1000,100000,1000000',
+                        help='Comma separated numbers of issues.')
+    parser.add_argument('--output',
+                        default='bench_results/issue_lifecycle.json',
+                        help='The JSON file to write the results to.')
+    args = parser.parse_args()
+
+    results = []
+    for scale in [int(scale) for scale in args.scales.split(',')]:
+        created, closed = synthetic_issues(scale)
+        lifecycle, measurement = measure(issue_lifecycle, created, closed)
+        measurement.update(name='issue_lifecycle', scale=scale,
+                           n_months=len(lifecycle['monthly']))
+        report(measurement)
+        results.append(measurement)
+    write_results(args.output, 'issue_lifecycle', results)
+
+
+if __name__ == '__main__':
+    main()
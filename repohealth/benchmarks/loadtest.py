@@ -0,0 +1,302 @@
+"""
+Load test the web tier against a pre-populated cache.
+
+This starts the webapp (in a subprocess) with ``REPOHEALTH_CACHE_ROOT``
+pointing at a cache of synthetic repositories, and drives a weighted mix
+of routes at it from a number of concurrent clients. OAuth is stubbed out
+by signing the user cookie with the app's cookie secret. Throughput and
+p50/p95/p99 latency are reported per route::
+
+    python -m repohealth.benchmarks.loadtest --repos 4 --scale 10000 \\
+        --concurrency 50 --duration 30 --mix request=4,report=1,data=2
+
+The available routes are "request" (polling ``/api/request``), "report"
+(rendering ``/report``), "data" (``/api/data``) and "compare"
+(``/api/compare`` of all of the repos).
+
+"""
+import argparse
+import collections
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid as uuid_lib
+from urllib.parse import urlencode
+
+import numpy as np
+import tornado.gen
+import tornado.ioloop
+import tornado.web
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+
+from repohealth.benchmarks import write_results
+
+
+ROUTES = ['request', 'report', 'data', 'compare']
+TOKEN = 'loadtest-token'
+PERCENTILES = [50, 95, 99]
+
+
+def parse_mix(mix):
+    """
+    Parse a "route=weight,route=weight" mix into a list of (route, weight).
+
+    """
+    parsed = []
+    for item in mix.split(','):
+        route, _, weight = item.partition('=')
+        route = route.strip()
+        if route not in ROUTES:
+            raise ValueError('Unknown route "{}" (choose from {}).'
+                             ''.format(route, ', '.join(ROUTES)))
+        parsed.append((route, float(weight or 1)))
+    return parsed
+
+
+def user_cookie(cookie_secret):
+    """
+    A signed "user" cookie, as would be set by the GitHub OAuth handler.
+
+    """
+    from repohealth.auth.github import GithubAuthHandler
+    user = {'access_token': TOKEN, 'scope': 'user:email',
+            'token_type': 'bearer', 'login': 'loadtest',
+            'avatar_url': '', 'html_url': '',
+            'version': GithubAuthHandler.cookie_version}
+    value = tornado.web.create_signed_value(cookie_secret, 'user',
+                                            json.dumps(user))
+    return 'user={}'.format(value.decode('ascii'))
+
+
+def make_request(base_url, route, uuid, uuids, cookie):
+    headers = {'Cookie': cookie}
+    if route == 'request':
+        return HTTPRequest('{}/api/request/{}'.format(base_url, uuid),
+                           method='POST', body=urlencode({'token': TOKEN}))
+    elif route == 'report':
+        url = '{}/report/{}'.format(base_url, uuid)
+    elif route == 'data':
+        url = '{}/api/data/{}'.format(base_url, uuid)
+    elif route == 'compare':
+        url = '{}/api/compare?{}'.format(base_url,
+                                         urlencode({'repos': ','.join(uuids)}))
+    return HTTPRequest(url, headers=headers, follow_redirects=False)
+
+
+@tornado.gen.coroutine
+def drive(base_url, cookie, uuids, mix, concurrency, duration, seed=0):
+    """
+    Drive the weighted mix of routes from ``concurrency`` clients for
+    ``duration`` seconds. Returns a dictionary of route to a list of
+    (latency, HTTP status code), and the elapsed time.
+
+    """
+    client = AsyncHTTPClient(force_instance=True, max_clients=concurrency)
+    rng = random.Random(seed)
+    routes, weights = zip(*mix)
+    samples = collections.defaultdict(list)
+    start = time.perf_counter()
+    deadline = start + duration
+
+    @tornado.gen.coroutine
+    def client_loop():
+        while time.perf_counter() < deadline:
+            route = rng.choices(routes, weights)[0]
+            request = make_request(base_url, route, rng.choice(uuids),
+                                   uuids, cookie)
+            request_start = time.perf_counter()
+            response = yield client.fetch(request, raise_error=False)
+            samples[route].append((time.perf_counter() - request_start,
+                                   response.code))
+
+    yield [client_loop() for _ in range(concurrency)]
+    client.close()
+    return samples, time.perf_counter() - start
+
+
+def summarise(samples, elapsed, concurrency):
+    """
+    Compute the throughput and latency percentiles of each route.
+
+    """
+    results = []
+    for route, route_samples in sorted(samples.items()):
+        latency = np.array([sample[0] for sample in route_samples])
+        codes = collections.Counter(sample[1] for sample in route_samples)
+        result = {'name': 'loadtest.{}'.format(route),
+                  'scale': concurrency,
+                  'requests': len(route_samples),
+                  'errors': sum(count for code, count in codes.items()
+                                if not 200 <= code < 300),
+                  'codes': {str(code): count for code, count in codes.items()},
+                  'requests_per_second': len(route_samples) / elapsed}
+        for percentile, value in zip(PERCENTILES,
+                                     np.percentile(latency, PERCENTILES)):
+            result['p{}_seconds'.format(percentile)] = float(value)
+        results.append(result)
+    return results
+
+
+def report(result):
+    print('{name:<22} {requests:>7} requests {requests_per_second:>8.1f}/s '
+          'p50 {p50_seconds:>7.3f}s  p95 {p95_seconds:>7.3f}s  '
+          'p99 {p99_seconds:>7.3f}s  {errors} errors'.format(**result))
+    sys.stdout.flush()
+
+
+def populate(n_repos, scale, workdir):
+    """
+    Populate the cache (``REPOHEALTH_CACHE_ROOT``) with synthetic repos,
+    and return their uuids.
+
+    """
+    import git
+
+    import repohealth.generate
+    import repohealth.git
+    from repohealth.benchmarks.synthetic import (
+        RepoShape, synthetic_github, synthetic_repo)
+
+    generate = repohealth.generate
+    if not os.path.exists(generate.CACHE_ROOT):
+        os.makedirs(generate.CACHE_ROOT)
+
+    uuids = []
+    for seed in range(n_repos):
+        uuid = 'loadtest/repo{}'.format(seed)
+        uuids.append(uuid)
+        if generate.cache_available(uuid):
+            continue
+        shape = RepoShape(scale, n_authors=max(10, scale // 200), seed=seed)
+        repo = git.Repo(synthetic_repo(
+            shape, os.path.join(workdir, shape.key())))
+        if not os.path.exists(os.path.dirname(generate.CACHE_GH.format(uuid))):
+            os.makedirs(os.path.dirname(generate.CACHE_GH.format(uuid)))
+        generate.write_cache(generate.CACHE_GH.format(uuid),
+                             synthetic_github(uuid, n_issues=scale // 10,
+                                              n_stargazers=scale // 5,
+                                              seed=seed))
+        generate.write_cache(generate.CACHE_COMMITS.format(uuid),
+                             repohealth.git.commits(repo))
+        generate.write_cache(generate.CACHE_CHURN.format(uuid),
+                             repohealth.git.churn(repo))
+        # Compute the rollup and summary up-front.
+        generate.repo_data(uuid, TOKEN)
+    return uuids
+
+
+def serve(port, n_repos, scale, workdir, workers):
+    """
+    Populate the cache, and serve the webapp (with the same settings as
+    ``repohealth.webapp.__main__``) on the given port.
+
+    """
+    from repohealth.webapp.__main__ import make_app, make_executor
+    from repohealth.webapp.handlers import Error404
+
+    populate(n_repos, scale, workdir)
+    app = make_app(github_client_id='loadtest',
+                   github_client_secret='loadtest',
+                   cookie_secret=os.environ['COOKIE_SECRET'],
+                   github_scope=['user:email'],
+                   default_handler_class=Error404,
+                   datastore={},
+                   executor=make_executor(workers))
+    app.listen(port, address='127.0.0.1')
+    tornado.ioloop.IOLoop.current().start()
+
+
+def _free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait_for_server(proc, port, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('The webapp exited with code {}.'
+                               ''.format(proc.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError('The webapp did not start within {}s.'.format(timeout))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repos', type=int, default=4,
+                        help='The number of synthetic repos in the cache.')
+    parser.add_argument('--scale', type=int, default=10000,
+                        help='The number of commits in each repo.')
+    parser.add_argument('--concurrency', type=int, default=50,
+                        help='The number of concurrent clients.')
+    parser.add_argument('--duration', type=float, default=30,
+                        help='The number of seconds to drive load for.')
+    parser.add_argument('--mix', default='request=4,report=1,data=2',
+                        help='The weighted mix of routes.')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='The number of executor processes of the app.')
+    parser.add_argument('--workdir',
+                        default=os.path.join(tempfile.gettempdir(),
+                                             'repohealth-benchmarks'),
+                        help='Where to keep the synthetic repositories and '
+                             'the populated cache.')
+    parser.add_argument('--output', default='bench_results/loadtest.json',
+                        help='The JSON file to write the results to.')
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.repos, args.scale, args.workdir,
+                     args.workers)
+
+    mix = parse_mix(args.mix)
+    cache_root = os.path.join(args.workdir, 'cache-r{}-c{}'.format(
+        args.repos, args.scale))
+    cookie_secret = uuid_lib.uuid4().hex
+    env = dict(os.environ, REPOHEALTH_CACHE_ROOT=cache_root,
+               COOKIE_SECRET=cookie_secret,
+               # Nothing should need GitHub, so make sure nothing reaches it.
+               GITHUB_API_URL='http://127.0.0.1:9')
+
+    port = _free_port()
+    root = os.path.dirname(os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    cmd = [sys.executable, '-m', 'repohealth.benchmarks.loadtest',
+           '--serve', str(port), '--repos', str(args.repos),
+           '--scale', str(args.scale), '--workers', str(args.workers),
+           '--workdir', args.workdir]
+    proc = subprocess.Popen(cmd, env=env, cwd=root)
+    try:
+        print('Waiting for the webapp (and cache) to be ready...')
+        wait_for_server(proc, port, timeout=60 * 60)
+        uuids = ['loadtest/repo{}'.format(seed) for seed in range(args.repos)]
+        drive_fn = lambda: drive('http://127.0.0.1:{}'.format(port),
+                                 user_cookie(cookie_secret), uuids, mix,
+                                 args.concurrency, args.duration)
+        samples, elapsed = tornado.ioloop.IOLoop.current().run_sync(drive_fn)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    results = summarise(samples, elapsed, args.concurrency)
+    for result in results:
+        report(result)
+    write_results(args.output, 'loadtest', results)
+    print('Results written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark the cold start of the web app.
+
+This measures the import time of the web app (and of its heavy
+dependencies) in fresh interpreters, and the time-to-first-byte of ``/``
+from the moment the web app process is started::
+
+    python -m repohealth.benchmarks.startup --repeat 5
+
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+from repohealth.benchmarks import write_results
+
+
+MODULES = ['repohealth.webapp.__main__', 'repohealth.generate',
+           'pandas', 'plotly.graph_objs', 'github', 'git', 'nbformat']
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+
+def import_time(module):
+    """
+    The time taken to import the module in a fresh interpreter.
+
+    """
+    code = ('import time; start = time.perf_counter(); import {}; '
+            'print(time.perf_counter() - start)'.format(module))
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT)
+    return float(output.decode('ascii').strip().splitlines()[-1])
+
+
+def serve(port):
+    """
+    Serve the web app on the given port (with dummy OAuth settings).
+
+    """
+    from repohealth.webapp.__main__ import make_app
+    from repohealth.webapp.handlers import Error404
+    import tornado.ioloop
+
+    app = make_app(github_client_id='startup',
+                   github_client_secret='startup',
+                   cookie_secret='startup',
+                   github_scope=['user:email'],
+                   default_handler_class=Error404,
+                   datastore={})
+    app.listen(port, address='127.0.0.1')
+    tornado.ioloop.IOLoop.current().start()
+
+
+def _free_port():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def time_to_first_byte(path='/', timeout=60):
+    """
+    The time from starting the web app process until the first successful
+    response to the given path.
+
+    """
+    port = _free_port()
+    url = 'http://127.0.0.1:{}{}'.format(port, path)
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-m',
+                             'repohealth.benchmarks.startup',
+                             '--serve', str(port)], cwd=ROOT)
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError('The web app exited with code {}.'
+                                   ''.format(proc.returncode))
+            try:
+                with urllib.request.urlopen(url, timeout=timeout) as response:
+                    response.read(1)
+                    return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+        raise RuntimeError('No response from {} within {}s.'.format(url,
+                                                                     timeout))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def _result(name, timings):
+    return {'name': name, 'seconds': statistics.median(timings),
+            'min_seconds': min(timings), 'max_seconds': max(timings),
+            'repeat': len(timings)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='The number of times to repeat each measurement.')
+    parser.add_argument('--modules', default=','.join(MODULES),
+                        help='Comma separated modules to time the import of.')
+    parser.add_argument('--output', default='bench_results/startup.json',
+                        help='The JSON file to write the results to.')
+    parser.add_argument('--serve', type=int, metavar='PORT',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve)
+
+    results = []
+    for module in args.modules.split(','):
+        results.append(_result('import.{}'.format(module),
+                               [import_time(module)
+                                for _ in range(args.repeat)]))
+    results.append(_result('ttfb./', [time_to_first_byte('/')
+                                      for _ in range(args.repeat)]))
+
+    for result in results:
+        print('{name:<40} {seconds:>7.3f}s (min {min_seconds:.3f}s, '
+              'max {max_seconds:.3f}s)'.format(**result))
+    write_results(args.output, 'startup', results)
+    print('Results written to {}'.format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Deterministic synthetic repositories (and GitHub data) for benchmarking.
+
+The git history is streamed straight into ``git fast-import``, so even
+repositories with a million commits can be generated in a few minutes.
+
+"""
+import datetime
+import os
+import random
+import subprocess
+
+
+class RepoShape(object):
+    """
+    The parameters of a synthetic repository.
+
+    Each commit changes between 1 and ``max_files`` files (from a pool of
+    ``n_files``), each of which is rewritten with between 1 and
+    ``max_lines`` lines, which determines the shape of the ``--shortstat``
+    output. Commits are spread across ``n_branches`` topic branches, one of
+    which is merged back into master every ``merge_every`` commits.
+
+    """
+    def __init__(self, n_commits, n_authors=50, n_files=200, max_files=5,
+                 max_lines=20, n_branches=4, merge_every=20, seed=0):
+        self.n_commits = n_commits
+        self.n_authors = n_authors
+        self.n_files = n_files
+        self.max_files = max_files
+        self.max_lines = max_lines
+        self.n_branches = n_branches
+        self.merge_every = merge_every
+        self.seed = seed
+
+    def key(self):
+        """A unique (and filename friendly) identifier of this shape."""
+        return ('c{0.n_commits}-a{0.n_authors}-f{0.n_files}-'
+                'mf{0.max_files}-ml{0.max_lines}-b{0.n_branches}-'
+                'm{0.merge_every}-s{0.seed}'.format(self))
+
+    def __repr__(self):
+        return '<RepoShape {}>'.format(self.key())
+
+
+def _data(content):
+    content = content.encode('utf-8')
+    return b'data ' + str(len(content)).encode('ascii') + b'\n' + content + b'\n'
+
+
+def fast_import_stream(shape):
+    """
+    Generate the ``git fast-import`` stream for the given repo shape.
+
+    """
+    rng = random.Random(shape.seed)
+    authors = ['Author {0} <author{0}@example.com>'.format(i)
+               for i in range(shape.n_authors)]
+    paths = ['src/module{}/file{}.py'.format(i % 17, i)
+             for i in range(shape.n_files)]
+    branches = ['refs/heads/topic{}'.format(i)
+                for i in range(shape.n_branches)]
+
+    timestamp = 1230768000  # 2009-01-01
+    branch_tips = {}
+    master_tip = None
+
+    for mark in range(1, shape.n_commits + 1):
+        timestamp += rng.randint(60, 3 * 60 * 60)
+        # A Pareto spread of authors, as a handful tend to dominate.
+        author = authors[min(int(rng.paretovariate(1.2)) - 1,
+                             shape.n_authors - 1)]
+        signature = '{} {} +0000'.format(author, timestamp)
+
+        merge = (branches and master_tip is not None and
+                 mark % shape.merge_every == 0)
+        if merge:
+            branch = rng.choice([b for b in branches if b in branch_tips] or
+                                [None])
+            merge = branch is not None
+
+        if merge:
+            ref = 'refs/heads/master'
+            message = 'Merge {}'.format(branch)
+        elif branches and master_tip is not None and rng.random() < 0.5:
+            ref = rng.choice(branches)
+            message = 'Commit {} on {}'.format(mark, ref)
+        else:
+            ref = 'refs/heads/master'
+            message = 'Commit {}'.format(mark)
+
+        chunks = [b'commit ' + ref.encode('ascii') + b'\n',
+                  b'mark :' + str(mark).encode('ascii') + b'\n',
+                  b'author ' + signature.encode('utf-8') + b'\n',
+                  b'committer ' + signature.encode('utf-8') + b'\n',
+                  _data(message)]
+
+        if ref != 'refs/heads/master' and ref not in branch_tips:
+            # A new topic branch starts from the current master.
+            chunks.append(b'from :' + str(master_tip).encode('ascii') + b'\n')
+        if merge:
+            chunks.append(b'merge :' + str(branch_tips.pop(branch)).encode('ascii') + b'\n')
+        else:
+            for path in rng.sample(paths, rng.randint(1, shape.max_files)):
+                lines = ''.join('line {} of {}\n'.format(rng.randint(0, 9), path)
+                                for _ in range(rng.randint(1, shape.max_lines)))
+                chunks.append(b'M 100644 inline ' + path.encode('utf-8') + b'\n')
+                chunks.append(_data(lines))
+
+        if ref == 'refs/heads/master':
+            master_tip = mark
+        else:
+            branch_tips[ref] = mark
+        yield b''.join(chunks) + b'\n'
+
+
+def synthetic_repo(shape, target):
+    """
+    Create the synthetic repository of the given shape at ``target``
+    (if it doesn't already exist), and return the path to it.
+
+    """
+    if os.path.exists(os.path.join(target, '.git')):
+        return target
+    os.makedirs(target)
+    subprocess.check_call(['git', 'init', '--quiet', target])
+    proc = subprocess.Popen(['git', 'fast-import', '--quiet'], cwd=target,
+                            stdin=subprocess.PIPE)
+    try:
+        for chunk in fast_import_stream(shape):
+            proc.stdin.write(chunk)
+    finally:
+        proc.stdin.close()
+        if proc.wait() != 0:
+            raise RuntimeError('git fast-import failed for {}'.format(shape))
+    subprocess.check_call(['git', 'checkout', '--quiet', 'master'], cwd=target)
+    return target
+
+
+def synthetic_github(uuid, n_issues, n_stargazers, seed=0):
+    """
+    Generate the GitHub part of a payload (as stored in the CACHE_GH file).
+
+    """
+    rng = random.Random(seed)
+    start = datetime.datetime(2009, 1, 1)
+
+    def date(seconds):
+        return (start + datetime.timedelta(seconds=seconds)).strftime(
+            '%Y-%m-%dT%H:%M:%SZ')
+
+    span = 10 * 365 * 24 * 60 * 60
+    issues = []
+    for number in range(1, n_issues + 1):
+        created = rng.randint(0, span)
+        closed = None
+        if rng.random() < 0.8:
+            closed = date(created + int(rng.expovariate(1 / (14 * 86400))))
+        issues.append({'user/login': 'user{}'.format(number % 97),
+                       'user/id': number % 97,
+                       'number': number,
+                       'comments': rng.randint(0, 10),
+                       'created_at': date(created),
+                       'state': 'open' if closed is None else 'closed',
+                       'closed_at': closed})
+    stargazers = [{'user/login': 'stargazer{}'.format(i),
+                   'user/id': i,
+                   'starred_at': date(rng.randint(0, span))}
+                  for i in range(n_stargazers)]
+
+    org, name = uuid.split('/')
+    repo = {'name': name, 'full_name': uuid, 'description': 'Synthetic',
+            'html_url': 'https://github.com/{}'.format(uuid),
+            'clone_url': 'https://github.com/{}.git'.format(uuid),
+            'owner': {'login': org, 'avatar_url': ''},
+            'stargazers_count': n_stargazers, 'forks_count': 0,
+            'open_issues_count': sum(issue['closed_at'] is None
+                                     for issue in issues),
+            'fork': False}
+    return {'repo': repo, 'issues': issues, 'stargazers': stargazers}
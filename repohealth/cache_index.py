@@ -0,0 +1,289 @@
+"""
+An SQLite index of the cache, holding the state of each cached repo.
+
+The payloads (the GitHub data, commits, churn and rollups) are files in the
+cache, but what is known about them (whether a repo is partially ingested,
+ready or has failed, when that happened, the sizes of its files, the version
+of its rollup and its summary) and the status of its job are held in a
+single database (along with the quota of each GitHub token, and the tokens
+that users have shared, see ``repohealth.github.tokens``). Listing the cache, and checking whether a
+repo is available, are then indexed queries rather than globs and stats::
+
+    index = CacheIndex(os.path.join(CACHE_ROOT, 'index.sqlite'))
+    index.update('org/repo', state='ready', updated=time.time())
+    index.entry('org/repo')['state']
+
+The database is created on first use, when it can be populated from any
+cache files that predate it. Each process (and thread) has a connection of
+its own.
+
+"""
+from contextlib import contextmanager
+import json
+import os
+import sqlite3
+import threading
+
+import fasteners
+
+
+SCHEMA = """
+CREATE TABLE entries (
+    uuid TEXT PRIMARY KEY,
+    -- "partial" (the line stats are pending), "ready" or "failed".
+    state TEXT,
+    -- When the payload was written (or the job failed), in seconds since
+    -- the epoch.
+    updated REAL,
+    github_bytes INTEGER,
+    commits_bytes INTEGER,
+    rollup_version INTEGER,
+    failure TEXT,
+    refresh_failure TEXT,
+    refresh_failed REAL,
+    summary TEXT
+);
+CREATE TABLE status (
+    uuid TEXT PRIMARY KEY,
+    status TEXT NOT NULL
+);
+"""
+
+# Created in existing indexes too (on connecting), as it came later.
+TOKENS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    -- The token's fingerprint (the token itself isn't stored).
+    fingerprint TEXT PRIMARY KEY,
+    label TEXT,
+    quota_limit INTEGER,
+    remaining INTEGER,
+    -- When the quota is reset, and when it was seen, in seconds since the
+    -- epoch.
+    reset REAL,
+    updated REAL
+);
+-- The tokens that users have opted in to sharing with the jobs of every
+-- process (until they opt out).
+CREATE TABLE IF NOT EXISTS shared_tokens (
+    token TEXT PRIMARY KEY,
+    label TEXT
+);
+"""
+
+#: The columns of an entry (other than its uuid).
+COLUMNS = ('state', 'updated', 'github_bytes', 'commits_bytes',
+           'rollup_version', 'failure', 'refresh_failure', 'refresh_failed',
+           'summary')
+
+#: The columns that hold JSON.
+JSON_COLUMNS = ('failure', 'refresh_failure', 'summary')
+
+
+def _encode(columns):
+    encoded = {}
+    for name, value in columns.items():
+        if name not in COLUMNS:
+            raise ValueError('Unknown cache index column "{}"'.format(name))
+        if name in JSON_COLUMNS and value is not None:
+            value = json.dumps(value)
+        encoded[name] = value
+    return encoded
+
+
+def _decode(row):
+    entry = dict(zip(row.keys(), row))
+    for name in JSON_COLUMNS:
+        if entry[name] is not None:
+            entry[name] = json.loads(entry[name])
+    return entry
+
+
+def _update(connection, uuid, columns):
+    columns = _encode(columns)
+    connection.execute('INSERT OR IGNORE INTO entries (uuid) VALUES (?)',
+                       (uuid,))
+    if columns:
+        assignments = ', '.join('{} = ?'.format(name) for name in columns)
+        connection.execute(
+            'UPDATE entries SET {} WHERE uuid = ?'.format(assignments),
+            list(columns.values()) + [uuid])
+
+
+class CacheIndex(object):
+    """
+    The index database at the given path.
+
+    Parameters
+    ----------
+    path : str
+        The database file (created, along with its directory, if it doesn't
+        exist).
+    populate : callable or None
+        Called when the database is created, returning the ``(uuid,
+        columns)`` of the entries that it should start with.
+
+    """
+    def __init__(self, path, populate=None):
+        self.path = path
+        self.populate = populate
+        self._local = threading.local()
+
+    def connection(self):
+        """
+        The connection of this thread (a forked process gets a new one, as
+        SQLite connections mustn't be shared with a child process).
+
+        """
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            if not os.path.exists(self.path):
+                self._create()
+            # Transactions are begun explicitly (see ``transaction``).
+            local.connection = sqlite3.connect(self.path, timeout=60,
+                                               isolation_level=None)
+            local.connection.row_factory = sqlite3.Row
+            local.connection.executescript(TOKENS_SCHEMA)
+            local.pid = os.getpid()
+        return local.connection
+
+    def _create(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with fasteners.InterProcessLock(self.path + '.lock'):
+            if os.path.exists(self.path):
+                return
+            # Built aside, so that nobody sees a partially populated index.
+            tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            connection = sqlite3.connect(tmp_path, isolation_level=None)
+            try:
+                connection.executescript(SCHEMA)
+                connection.execute('BEGIN')
+                for uuid, columns in (self.populate or list)():
+                    _update(connection, uuid, columns)
+                connection.execute('COMMIT')
+                # Readers don't block the writer (or vice versa).
+                connection.execute('PRAGMA journal_mode=WAL')
+            finally:
+                connection.close()
+            os.replace(tmp_path, self.path)
+
+    @contextmanager
+    def transaction(self):
+        """
+        A transaction that holds the database's write lock from the start,
+        so that what is read in it can't change before it is written.
+
+        """
+        connection = self.connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def entry(self, uuid):
+        """
+        The repo's entry (a dict of its columns), or None.
+
+        """
+        row = self.connection().execute(
+            'SELECT * FROM entries WHERE uuid = ?', (uuid,)).fetchone()
+        return None if row is None else _decode(row)
+
+    def update(self, uuid, **columns):
+        """
+        Set the given columns of the repo's entry (creating it if needed).
+
+        """
+        with self.transaction() as connection:
+            _update(connection, uuid, columns)
+
+    def remove(self, uuid):
+        self.connection().execute('DELETE FROM entries WHERE uuid = ?',
+                                  (uuid,))
+
+    def summaries(self):
+        """
+        The summaries of the repos that have one, keyed by uuid (in order).
+
+        """
+        rows = self.connection().execute(
+            'SELECT uuid, summary FROM entries WHERE summary IS NOT NULL '
+            'ORDER BY uuid')
+        return {uuid: json.loads(summary) for uuid, summary in rows}
+
+    def status(self, uuid):
+        """
+        The status of the repo's (most recent) job, or None.
+
+        """
+        row = self.connection().execute(
+            'SELECT status FROM status WHERE uuid = ?', (uuid,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def update_status(self, uuid, update):
+        """
+        Replace the status of the repo's job with ``update(status)`` (where
+        ``status`` is None if there isn't one yet).
+
+        """
+        with self.transaction() as connection:
+            row = connection.execute(
+                'SELECT status FROM status WHERE uuid = ?', (uuid,)).fetchone()
+            status = update(None if row is None else json.loads(row[0]))
+            connection.execute(
+                'INSERT OR REPLACE INTO status (uuid, status) VALUES (?, ?)',
+                (uuid, json.dumps(status)))
+
+    def update_quota(self, fingerprint, updated, **columns):
+        """
+        Record the quota of a GitHub token, unless a more recent one has
+        already been recorded (e.g. by another process).
+
+        """
+        columns['updated'] = updated
+        names = ', '.join(columns)
+        with self.transaction() as connection:
+            row = connection.execute(
+                'SELECT updated FROM tokens WHERE fingerprint = ?',
+                (fingerprint,)).fetchone()
+            if row is not None and row[0] is not None and row[0] > updated:
+                return
+            connection.execute(
+                'INSERT OR REPLACE INTO tokens (fingerprint, {}) '
+                'VALUES (?, {})'.format(names, ', '.join('?' * len(columns))),
+                [fingerprint] + list(columns.values()))
+
+    def quotas(self):
+        """
+        The latest quota of each GitHub token (as dicts of their columns).
+
+        """
+        rows = self.connection().execute(
+            'SELECT * FROM tokens ORDER BY label, fingerprint')
+        return [dict(zip(row.keys(), row)) for row in rows]
+
+    def share_token(self, token, label):
+        """
+        Record that the GitHub token is shared with every job.
+
+        """
+        self.connection().execute(
+            'INSERT OR REPLACE INTO shared_tokens (token, label) '
+            'VALUES (?, ?)', (token, label))
+
+    def unshare_token(self, token):
+        self.connection().execute(
+            'DELETE FROM shared_tokens WHERE token = ?', (token,))
+
+    def shared_tokens(self):
+        """
+        The GitHub tokens that are shared with every job, and their labels.
+
+        """
+        rows = self.connection().execute(
+            'SELECT token, label FROM shared_tokens')
+        return {token: label for token, label in rows}
@@ -0,0 +1,286 @@
+"""
+A process pool whose workers are recycled to keep memory predictable.
+
+``ProcessPoolExecutor`` workers live forever, and keep hold of the memory
+of the biggest repo that they have processed. The ``RecyclingExecutor``
+replaces its pool of workers once they have run a given number of jobs, or
+as soon as a worker's resident memory exceeds a threshold after a job. The
+retired workers finish their in-flight jobs and then exit.
+
+Each job can also be given a memory ceiling, so that a job that grows too
+large fails with a ``MemoryError`` rather than taking the whole machine
+down with it. The ceiling is on the resident memory of the worker itself
+(checked while the job runs), so the subprocesses of the job (e.g. git,
+whose address space can be far bigger than its footprint) aren't bound by
+it.
+
+"""
+import collections
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+import datetime
+import logging
+import os
+import resource
+import signal
+import sys
+import threading
+import time
+
+import repohealth.metrics
+
+
+#: The number of seconds between checks of a job's resident memory.
+MEMORY_CHECK_INTERVAL = 0.05
+
+
+def _proc_status(field):
+    """
+    The given field (in bytes) of /proc/self/status, or None if unavailable.
+
+    """
+    try:
+        with open('/proc/self/status', 'r') as fh:
+            for line in fh:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def rss():
+    """The resident memory of this process, in bytes."""
+    value = _proc_status('VmRSS')
+    if value is None:
+        value = peak_rss()
+    return value
+
+
+def peak_rss():
+    """
+    The peak resident memory of this process (since the last call to
+    ``reset_peak_rss``), in bytes.
+
+    """
+    value = _proc_status('VmHWM')
+    if value is None:
+        # ru_maxrss is in KB on Linux (and bytes on macOS).
+        value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            value *= 1024
+    return value
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident memory of this process (only possible on Linux).
+
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as fh:
+            fh.write('5')
+    except (IOError, OSError):
+        pass
+
+
+@contextmanager
+def memory_ceiling(limit):
+    """
+    Raise a ``MemoryError`` (in the main thread) if the resident memory of
+    this process grows by more than ``limit`` bytes during the with
+    statement (no limit if ``limit`` is falsy).
+
+    The memory is checked every ``MEMORY_CHECK_INTERVAL`` seconds, and once
+    more (as the peak since ``reset_peak_rss``) at the end, so a job that
+    briefly exceeded the limit between checks still fails.
+
+    """
+    if not limit:
+        yield
+        return
+    ceiling = rss() + limit
+    done = threading.Event()
+
+    def watch():
+        while not done.wait(MEMORY_CHECK_INTERVAL):
+            if rss() > ceiling:
+                os.kill(os.getpid(), signal.SIGUSR1)
+                return
+
+    def interrupt(signum, frame):
+        if not done.is_set():
+            raise MemoryError('The job exceeded its memory limit '
+                              '({:.0f}MB)'.format(limit / 1e6))
+
+    previous = signal.signal(signal.SIGUSR1, interrupt)
+    watchdog = threading.Thread(target=watch, daemon=True)
+    watchdog.start()
+    try:
+        yield
+    finally:
+        done.set()
+        watchdog.join()
+        signal.signal(signal.SIGUSR1, previous)
+    if peak_rss() > ceiling:
+        raise MemoryError('The job exceeded its memory limit '
+                          '({:.0f}MB)'.format(limit / 1e6))
+
+
+def _run_job(fn, args, kwargs, memory_limit):
+    # Runs in the worker process.
+    reset_peak_rss()
+    start = time.perf_counter()
+    with memory_ceiling(memory_limit):
+        result = fn(*args, **kwargs)
+    stats = {'pid': os.getpid(),
+             'seconds': time.perf_counter() - start,
+             'peak_rss_bytes': peak_rss(),
+             'rss_bytes': rss()}
+    return result, stats
+
+
+class RecyclingExecutor(object):
+    """
+    A ``ProcessPoolExecutor`` (with the same ``submit`` interface) whose
+    workers are recycled.
+
+    Parameters
+    ----------
+    max_workers : int
+        The number of worker processes.
+    max_jobs : int or None
+        Recycle the workers once they have run (on average) this many jobs
+        each.
+    max_rss : int or None
+        Recycle the workers when any of them has more than this many bytes
+        of resident memory after a job.
+    memory_limit : int or None
+        The number of bytes that the address space of a worker may grow by
+        during a job, beyond which the job raises a ``MemoryError``.
+    initializer : callable or None
+        Called in each new worker process.
+
+    """
+    def __init__(self, max_workers, max_jobs=None, max_rss=None,
+                 memory_limit=None, initializer=None):
+        self.max_workers = max_workers
+        self.max_jobs = max_jobs
+        self.max_rss = max_rss
+        self.memory_limit = memory_limit
+        self.initializer = initializer
+        #: The stats of the most recent jobs.
+        self.recent_jobs = collections.deque(maxlen=50)
+        self.generation = 0
+        self._lock = threading.Lock()
+        # The number of unfinished jobs of each (current or retired) pool.
+        self._in_flight = {}
+        # The threads shutting down the retired pools.
+        self._retiring = []
+        self._new_pool()
+
+    def _new_pool(self):
+        self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                         initializer=self.initializer)
+        self._in_flight[self._pool] = 0
+        self._pool_jobs = 0
+        self.generation += 1
+
+    def _recycle(self, pool, reason):
+        with self._lock:
+            if pool is not self._pool:
+                # This pool has already been retired.
+                return
+            logging.info('Recycling the executor workers ({})'.format(reason))
+            repohealth.metrics.increment('repohealth_worker_recycles_total',
+                                         reason=reason)
+            self._new_pool()
+        self._release(pool, 0)
+
+    def _release(self, pool, n_jobs=1):
+        """
+        Account for ``n_jobs`` finished jobs of the pool, and shut the pool
+        down if it is retired and has no unfinished jobs.
+
+        """
+        with self._lock:
+            self._in_flight[pool] -= n_jobs
+            if pool is self._pool or self._in_flight[pool]:
+                return
+            del self._in_flight[pool]
+        # A pool mustn't be shut down while it has pending jobs (before
+        # Python 3.9, shutdown(wait=False) closes the call queue, stranding
+        # any job that hasn't been handed to a worker yet). This may be
+        # called from the pool's own management thread, so the workers are
+        # joined in a thread of their own.
+        thread = threading.Thread(target=pool.shutdown, daemon=True)
+        thread.start()
+        with self._lock:
+            self._retiring = [retiring for retiring in self._retiring
+                              if retiring.is_alive()] + [thread]
+
+    def _submit(self, fn, args, kwargs, count=True):
+        with self._lock:
+            pool = self._pool
+            self._in_flight[pool] += 1
+            if count:
+                self._pool_jobs += 1
+            exhausted = (count and self.max_jobs and
+                         self._pool_jobs >= self.max_jobs * self.max_workers)
+        inner = pool.submit(_run_job, fn, args, kwargs, self.memory_limit)
+        if exhausted:
+            self._recycle(pool, 'max_jobs')
+        return pool, inner
+
+    def prewarm(self):
+        """
+        Start the workers (running the initializer) ahead of the first job.
+        This doesn't count towards ``max_jobs``.
+
+        """
+        pool, inner = self._submit(int, (), {}, count=False)
+        inner.add_done_callback(lambda inner: self._release(pool))
+
+    def submit(self, fn, *args, **kwargs):
+        pool, inner = self._submit(fn, args, kwargs)
+
+        future = Future()
+        description = '{}({})'.format(
+            getattr(fn, '__name__', fn), ', '.join(repr(arg) for arg in args[:1]))
+
+        def done(inner):
+            # Not inner.result(), as raising here would keep this (pool
+            # management) thread alive in the exception's traceback.
+            err = inner.exception()
+            if err is not None:
+                self._release(pool)
+                future.set_exception(err)
+                return
+            result, stats = inner.result()
+            stats.update(job=description,
+                         finished=datetime.datetime.utcnow())
+            self.recent_jobs.append(stats)
+            repohealth.metrics.observe('repohealth_job_peak_rss_bytes',
+                                       stats['peak_rss_bytes'],
+                                       repohealth.metrics.MEMORY_BUCKETS,
+                                       job=getattr(fn, '__name__', str(fn)))
+            logging.info('{job} took {seconds:.1f}s in worker {pid}, peak '
+                         'RSS {peak:.0f}MB (now {rss:.0f}MB)'.format(
+                             peak=stats['peak_rss_bytes'] / 1e6,
+                             rss=stats['rss_bytes'] / 1e6, **stats))
+            if self.max_rss and stats['rss_bytes'] > self.max_rss:
+                self._recycle(pool, 'max_rss')
+            self._release(pool)
+            future.set_result(result)
+
+        inner.add_done_callback(done)
+        return future
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pool = self._pool
+            retiring = list(self._retiring)
+        pool.shutdown(wait=wait)
+        if wait:
+            for thread in retiring:
+                thread.join()
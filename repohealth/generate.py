@@ -2,81 +2,642 @@
 Compute the data that is used for producing the health report.
 
 """
+import asyncio
 from collections import OrderedDict
+from contextlib import contextmanager
 import datetime
 from functools import partial
 import glob
+import gzip
+import io
 import json
 import os
 import logging
 import shutil
+import threading
+import time
 import traceback
 
 import fasteners
 import tornado.ioloop
 
-import git
-from github import Github
-import plotly.graph_objs as go
-import plotly.offline.offline as pl_offline
-
 import repohealth
-import repohealth.git
+import repohealth.cache_index
 import repohealth.github.stargazers
+import repohealth.github.graphql
 import repohealth.github.issues
+import repohealth.github.tokens
 import repohealth.github.emojis
-from repohealth.analysis import PLOTLY_PLOTS
+import repohealth.metrics
+import repohealth.profiling
+import repohealth.shared_cache
 
+# GitPython, PyGithub, pandas and plotly (through repohealth.git,
+# repohealth.rollup and repohealth.analysis) are slow to import, so they are
+# only imported by the functions that need them. This keeps the web app's
+# cold start fast; see warm_imports for the executor workers.
 
-CACHE_ROOT = os.path.join(os.path.abspath(os.path.dirname(os.path.dirname(repohealth.__file__))),
-                          'ephemeral_storage')
 
+def warm_imports():
+    """
+    Import the heavy dependencies up-front (e.g. as the initializer of the
+    executor workers), rather than on the first job that needs them.
 
-CACHE_EXCEPTION = os.path.join(CACHE_ROOT, '{}.exception.json')
+    """
+    import git
+    import github
+    import plotly.graph_objs
+    import plotly.offline.offline
+    import repohealth.analysis
+    import repohealth.git
+    import repohealth.rollup
+
+
+CACHE_ROOT = os.environ.get(
+    'REPOHEALTH_CACHE_ROOT',
+    os.path.join(os.path.abspath(os.path.dirname(os.path.dirname(repohealth.__file__))),
+                 'ephemeral_storage'))
+
+
+CACHE_INDEX = os.path.join(CACHE_ROOT, 'index.sqlite')
 CACHE_GH = os.path.join(CACHE_ROOT, '{}.github.json')
 CACHE_COMMITS = os.path.join(CACHE_ROOT, '{}.commits.json')
+CACHE_CHURN = os.path.join(CACHE_ROOT, '{}.churn.json')
+CACHE_ROLLUP = os.path.join(CACHE_ROOT, '{}.rollup.json')
 CACHE_CLONE = os.path.join(CACHE_ROOT, '{}')
+CACHE_MIRROR = os.path.join(CACHE_ROOT, 'mirrors', '{}.git')
 CACHE_PLOTS = os.path.join(CACHE_ROOT, '{}.plots.json')
-STATUS_FILE = os.path.join(CACHE_ROOT, '{}.status.json')
-STATUS_LOCK_FILE = os.path.join(CACHE_ROOT, '{}.status.lock.json')
+CACHE_METRICS = os.path.join(CACHE_ROOT, 'metrics')
+CACHE_PROFILES = os.path.join(CACHE_ROOT, 'profiles')
+CACHE_GITHUB_SLOTS = os.path.join(CACHE_ROOT, 'github-slots')
+
+#: The key (in the shared cache) of the manifest of a repo's shared files.
+SHARED_MANIFEST = '{}.manifest.json'
+
+# The cache files of failures and summaries, from before they were held in
+# the index (see _indexed_cache_files).
+CACHE_EXCEPTION = os.path.join(CACHE_ROOT, '{}.exception.json')
+CACHE_SUMMARY = os.path.join(CACHE_ROOT, '{}.summary.json')
+
+#: Whether to build the per-path churn index (an extra ``git log --numstat``
+#: pass over the clone) during ingestion.
+CHURN_ENABLED = os.environ.get('REPOHEALTH_CHURN', '1') != '0'
+
+#: Whether to clone forks with reference to a (cached) mirror of the repo
+#: that they were forked from, so that only their own objects are fetched.
+FORK_MIRRORS = os.environ.get('REPOHEALTH_FORK_MIRRORS', '1') != '0'
+
+#: The number of days after which a mirror that no clone has referenced is
+#: removed (0 for never).
+MIRROR_MAX_AGE_DAYS = float(os.environ.get('REPOHEALTH_MIRROR_MAX_AGE_DAYS',
+                                           7))
+
+#: Whether to make blobless clones, from which the commit metadata (and so a
+#: first, partial, report) is available sooner. The file contents that the
+#: line stats need are fetched once the partial report is published.
+BLOBLESS_CLONES = os.environ.get('REPOHEALTH_BLOBLESS_CLONES', '1') != '0'
+
+#: The plots that need the line stats of the commits (or the churn index),
+#: which are pending until the second stage of ingestion has finished.
+LINE_STATS_PLOTS = ('all_commits', 'commit_LOC_delta', 'hotspots')
+
+#: The number of hours for which a report is fresh. A report that is older
+#: is still served, but is refreshed in the background (0 for never).
+FRESHNESS_HOURS = float(os.environ.get('REPOHEALTH_FRESHNESS_HOURS', 24))
+
+#: The number of seconds before a transient failure (e.g. a GitHub 502, or
+#: a clone timing out) is retried, which is doubled for each consecutive
+#: failure of the repo, up to FAILURE_RETRY_MAX_SECONDS.
+FAILURE_RETRY_SECONDS = float(os.environ.get(
+    'REPOHEALTH_FAILURE_RETRY_SECONDS', 60))
+FAILURE_RETRY_MAX_SECONDS = float(os.environ.get(
+    'REPOHEALTH_FAILURE_RETRY_MAX_SECONDS', 6 * 3600))
+
+#: The number of seconds for which a permanent failure (e.g. the repo not
+#: being found) is cached.
+PERMANENT_FAILURE_SECONDS = float(os.environ.get(
+    'REPOHEALTH_PERMANENT_FAILURE_SECONDS', 24 * 3600))
+
+#: The statuses of the failures that are down to the repo itself (not
+#: found, gone, unavailable for legal reasons, or too large), rather than
+#: being transient.
+PERMANENT_FAILURES = (404, 410, 451, 507)
+
+#: How the cache files are compressed: "gzip", "zstd" (which needs the
+#: zstandard package) or "none". The files are read whatever their
+#: compression (e.g. those that were written before it was changed).
+CACHE_COMPRESSION = os.environ.get('REPOHEALTH_CACHE_COMPRESSION', 'gzip')
+
+#: The magic numbers at the start of gzip and zstd compressed files.
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+#: The GitHub API to fetch from (e.g. a fake GitHub server when benchmarking,
+#: see ``repohealth.benchmarks.fake_github``).
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
+
+#: The API that the issues and stargazers are fetched from: "rest" (pages of
+#: 100 items, fetched concurrently) or "graphql" (only the fields that are
+#: kept, a page at a time, see ``repohealth.github.graphql``).
+GITHUB_BACKEND = os.environ.get('REPOHEALTH_GITHUB_BACKEND', 'rest')
+
+
+def write_cache(fname, content):
+    """
+    Write the given (JSON serialisable) content to the cache file,
+    compressed as per CACHE_COMPRESSION. The file is replaced atomically,
+    so that it can be refreshed while it is read.
+
+    """
+    _write_json_atomic(fname, content)
+
+
+def load_cache(fname):
+    """
+    Read the content of the cache file, which is decompressed (according to
+    its magic number, if it has one) as it is read.
+
+    """
+    with open(fname, 'rb') as raw:
+        magic = raw.read(len(ZSTD_MAGIC))
+        raw.seek(0)
+        if magic.startswith(GZIP_MAGIC):
+            fh = gzip.GzipFile(fileobj=raw, mode='rb')
+        elif magic == ZSTD_MAGIC:
+            import zstandard
+            fh = zstandard.ZstdDecompressor().stream_reader(raw)
+        else:
+            fh = raw
+        return json.load(io.TextIOWrapper(fh, encoding='utf-8'))
+
+
+@contextmanager
+def _compressed(raw):
+    # A binary file object that compresses what is written to the raw file.
+    if CACHE_COMPRESSION == 'gzip':
+        # A low level, as most of the reduction comes from the first few.
+        with gzip.GzipFile(filename='', fileobj=raw, mode='wb',
+                           compresslevel=3, mtime=0) as fh:
+            yield fh
+    elif CACHE_COMPRESSION == 'zstd':
+        import zstandard
+        with zstandard.ZstdCompressor().stream_writer(raw) as fh:
+            yield fh
+    else:
+        yield raw
 
 
 def clear_cache(uuid):
     logging.info("Spoiling the cache for {}".format(uuid))
-    if os.path.exists(CACHE_EXCEPTION.format(uuid)):
-        os.remove(CACHE_EXCEPTION.format(uuid))
     if os.path.exists(CACHE_GH.format(uuid)):
         os.remove(CACHE_GH.format(uuid))
     if os.path.exists(CACHE_COMMITS.format(uuid)):
         os.remove(CACHE_COMMITS.format(uuid))
+    if os.path.exists(CACHE_CHURN.format(uuid)):
+        os.remove(CACHE_CHURN.format(uuid))
+    if os.path.exists(CACHE_ROLLUP.format(uuid)):
+        os.remove(CACHE_ROLLUP.format(uuid))
+    cache_index().remove(uuid)
     if os.path.exists(CACHE_CLONE.format(uuid)):
         shutil.rmtree(CACHE_CLONE.format(uuid))
+    remove_mirror(CACHE_MIRROR.format(uuid))
 
 
-from contextlib import contextmanager
+_CACHE_INDEXES = {}
+_TOKEN_POOLS = {}
+
+
+def cache_index():
+    """
+    The index of the cache (see ``repohealth.cache_index``), which holds the
+    state of each repo's entry, its failures, its summary and the status of
+    its job. The payloads themselves are in the cache files.
+
+    """
+    index = _CACHE_INDEXES.get(CACHE_INDEX)
+    if index is None:
+        index = _CACHE_INDEXES.setdefault(
+            CACHE_INDEX, repohealth.cache_index.CacheIndex(
+                CACHE_INDEX, populate=_indexed_cache_files))
+    return index
+
+
+def token_pool():
+    """
+    The pool of GitHub tokens that the jobs of this process fetch through
+    (see ``repohealth.github.tokens``), with the service tokens. The cap on
+    its requests in flight is shared by every process of this cache, and
+    the quota of its tokens is recorded in the cache index.
+
+    """
+    pool = _TOKEN_POOLS.get(CACHE_GITHUB_SLOTS)
+    if pool is None:
+        pool = _TOKEN_POOLS.setdefault(
+            CACHE_GITHUB_SLOTS, repohealth.github.tokens.TokenPool(
+                repohealth.github.tokens.SERVICE_TOKENS,
+                repohealth.github.tokens.MAX_REQUESTS,
+                slots_dir=CACHE_GITHUB_SLOTS, store=cache_index()))
+    return pool
+
+
+def _indexed_cache_files():
+    """
+    Generate the index entries of the cache files, for an index that is
+    created over an existing cache.
+
+    """
+    prefix, suffix = CACHE_GH.split('{}')
+    for fname in glob.glob(CACHE_GH.format('*/*')):
+        uuid = fname[len(prefix):-len(suffix)]
+        commits_cache = CACHE_COMMITS.format(uuid)
+        if not os.path.exists(commits_cache):
+            continue
+        try:
+            payload = load_cache(commits_cache)
+            entry = {'updated': os.path.getmtime(commits_cache),
+                     'github_bytes': os.path.getsize(fname),
+                     'commits_bytes': os.path.getsize(commits_cache)}
+            if payload.get('pending'):
+                entry['state'] = 'partial'
+            elif os.path.exists(CACHE_SUMMARY.format(uuid)):
+                entry.update(state='ready',
+                             summary=load_cache(CACHE_SUMMARY.format(uuid)))
+            else:
+                # Cached before the summaries existed.
+                payload['github'] = load_cache(fname)
+                updated = datetime.datetime.utcfromtimestamp(entry['updated'])
+                entry.update(state='ready',
+                             summary=summary(uuid, payload, updated))
+            if os.path.exists(CACHE_ROLLUP.format(uuid)):
+                entry['rollup_version'] = load_cache(
+                    CACHE_ROLLUP.format(uuid)).get('version')
+        except Exception:
+            logging.exception('Unable to index the cache of {}'.format(uuid))
+            continue
+        yield uuid, entry
+
+    prefix, suffix = CACHE_EXCEPTION.split('{}')
+    for fname in glob.glob(CACHE_EXCEPTION.format('*/*')):
+        uuid = fname[len(prefix):-len(suffix)]
+        try:
+            failure = load_cache(fname)
+        except ValueError:
+            continue
+        yield uuid, {'state': 'failed', 'updated': os.path.getmtime(fname),
+                     'failure': failure}
+
+
+def _size(fname):
+    return os.path.getsize(fname) if os.path.exists(fname) else None
+
+
+def index_payload(uuid, state, **columns):
+    """
+    Record in the index that the repo's payload (as it is now in the cache
+    files) is "partial" or "ready", along with any other given columns.
+
+    """
+    columns.setdefault('updated', time.time())
+    cache_index().update(uuid, state=state,
+                         github_bytes=_size(CACHE_GH.format(uuid)),
+                         commits_bytes=_size(CACHE_COMMITS.format(uuid)),
+                         failure=None, **columns)
+
+
+def _shared_files(uuid):
+    # The cache files of a payload that are shared (see
+    # repohealth.shared_cache), of which the first two are always there.
+    return [CACHE_GH.format(uuid), CACHE_COMMITS.format(uuid),
+            CACHE_CHURN.format(uuid), CACHE_ROLLUP.format(uuid)]
+
+
+def share_payload(uuid, updated):
+    """
+    Write the files of the repo's finished payload (ingested at the
+    ``updated`` time) through to the shared cache, if it is enabled. The
+    manifest of the files is written last, so that the payload isn't read
+    until all of its files are there.
+
+    """
+    store = repohealth.shared_cache.store()
+    if store is None:
+        return
+    try:
+        keys = []
+        for fname in _shared_files(uuid):
+            if os.path.exists(fname):
+                key = os.path.relpath(fname, CACHE_ROOT)
+                with open(fname, 'rb') as fh:
+                    store.put(key, fh)
+                keys.append(key)
+        manifest = {'uuid': uuid, 'updated': updated, 'files': keys}
+        store.put(SHARED_MANIFEST.format(uuid),
+                  json.dumps(manifest).encode('utf-8'))
+    except Exception:
+        # The payload is still in the local cache.
+        logging.exception('Unable to share the payload of {}'.format(uuid))
+
+
+def fetch_shared(uuid, newer_than=None):
+    """
+    Read the repo's payload through from the shared cache (if it is enabled
+    and has a fresh copy, ingested after ``newer_than`` if given) into the
+    local cache, returning when the copy was ingested, or None.
+
+    """
+    store = repohealth.shared_cache.store()
+    if store is None:
+        return None
+    fnames = _shared_files(uuid)
+    fnames = {os.path.relpath(fname, CACHE_ROOT): fname for fname in fnames}
+    downloaded = {}
+    try:
+        content = store.get(SHARED_MANIFEST.format(uuid))
+        manifest = None
+        if content is not None:
+            manifest = json.loads(content.decode('utf-8'))
+            age = time.time() - manifest['updated']
+            if ((FRESHNESS_HOURS and age >= FRESHNESS_HOURS * 3600) or
+                    (newer_than is not None and
+                     manifest['updated'] <= newer_than)):
+                manifest = None
+        if manifest is not None:
+            for key in manifest['files']:
+                # Only the files that we would have shared.
+                content = store.get(key) if key in fnames else None
+                if content is None:
+                    # Replaced part way through reading it.
+                    manifest = None
+                    break
+                tmp_fname = '{}.{}.tmp'.format(fnames[key], os.getpid())
+                os.makedirs(os.path.dirname(tmp_fname), exist_ok=True)
+                with open(tmp_fname, 'wb') as fh:
+                    fh.write(content)
+                downloaded[fnames[key]] = tmp_fname
+            commits = downloaded.get(CACHE_COMMITS.format(uuid))
+            if (manifest is not None and commits is not None and
+                    load_cache(commits).get('pending')):
+                # Only finished payloads are shared, but be sure of it.
+                manifest = None
+    except Exception:
+        logging.exception('Unable to read {} from the shared '
+                          'cache'.format(uuid))
+        manifest = None
+
+    hit = manifest is not None and all(fname in downloaded
+                                       for fname in _shared_files(uuid)[:2])
+    repohealth.metrics.increment('repohealth_cache_requests_total',
+                                 kind='shared',
+                                 result='hit' if hit else 'miss')
+    for fname, tmp_fname in downloaded.items():
+        if hit:
+            os.replace(tmp_fname, fname)
+        else:
+            os.remove(tmp_fname)
+    if not hit:
+        return None
+    rollup_cache = CACHE_ROLLUP.format(uuid)
+    if rollup_cache in downloaded:
+        cache_index().update(
+            uuid, rollup_version=load_cache(rollup_cache).get('version'))
+    return manifest['updated']
+
+
+def write_failure(uuid, result, attempts=1, refresh=False):
+    """
+    Cache the failure of the repo's job (or, with ``refresh``, of the
+    refresh of its stale payload) in the index, which expires (so that the
+    job is retried) after a period that depends on whether the failure is
+    transient, and on how many times in a row the job has failed.
+
+    """
+    result = dict(result, attempts=attempts,
+                  transient=result['status'] not in PERMANENT_FAILURES)
+    result['retry_in'] = failure_ttl(result)
+    if refresh:
+        cache_index().update(uuid, refresh_failure=result,
+                             refresh_failed=time.time())
+    else:
+        cache_index().update(uuid, state='failed', updated=time.time(),
+                             failure=result)
+    return result
+
+
+def failure_ttl(result):
+    """
+    The number of seconds for which the cached failure stands.
+
+    """
+    # Failures cached before they were classified are taken as permanent.
+    if not result.get('transient', False):
+        return PERMANENT_FAILURE_SECONDS
+    return min(FAILURE_RETRY_SECONDS * 2 ** (result.get('attempts', 1) - 1),
+               FAILURE_RETRY_MAX_SECONDS)
+
+
+def _failure(entry, refresh=False):
+    # The failure of the index entry, and its age in seconds.
+    if entry is None:
+        return None, None
+    if refresh:
+        if entry['refresh_failure'] is None:
+            return None, None
+        return entry['refresh_failure'], time.time() - entry['refresh_failed']
+    if entry['state'] != 'failed':
+        return None, None
+    return entry['failure'], time.time() - entry['updated']
+
+
+def load_failure(uuid, refresh=False):
+    """
+    The cached failure of the repo's job (or, with ``refresh``, of the
+    refresh of its stale payload), and its age in seconds, or (None, None)
+    if there isn't one.
+
+    """
+    return _failure(cache_index().entry(uuid), refresh)
+
+
+def cached_failure(uuid):
+    """
+    The cached failure of the repo's job, or None if there isn't one (or it
+    has expired, and so the job should be retried).
+
+    """
+    result, age = load_failure(uuid)
+    if result is None or age >= failure_ttl(result):
+        return None
+    return result
 
 
 @contextmanager
-def no_raise(uuid):
-    cache_file = CACHE_EXCEPTION.format(uuid)
+def no_raise(uuid, attempts=1, refresh=False):
+    """
+    Cache (see ``write_failure``) any exception that is raised by the body of
+    the with statement, which is the given attempt in a row to prepare
+    the repo.
+
+    """
     try:
         yield
     except (KeyboardInterrupt, SystemExit):
         raise
     except Exception as err:
-        result = {'status': getattr(err, 'code', 500),
+        # PyGithub's exceptions have a status, tornado's HTTPErrors a code
+        # (and git's errors an exit status, which isn't one of ours).
+        status = getattr(err, 'code', getattr(err, 'status', None))
+        if not isinstance(status, int) or not 400 <= status < 600:
+            status = 500
+        result = {'status': status,
                   'message': str(err),
                   'traceback': traceback.format_exc()}
-        with open(cache_file, 'w') as fh:
-            json.dump(result, fh)
-        return result
+        if isinstance(err, MemoryError):
+            # The job exceeded its memory ceiling (see repohealth.executor).
+            result.update(status=507,
+                          message='The repository is too large to analyse '
+                                  '(the job exceeded its memory limit).')
+        return write_failure(uuid, result, attempts, refresh)
 
 
 def cache_available(uuid):
-    avail = ((os.path.exists(CACHE_GH.format(uuid)) and
-              os.path.exists(CACHE_COMMITS.format(uuid))) or
-             os.path.exists(CACHE_EXCEPTION.format(uuid)))
-    return avail
+    entry = cache_index().entry(uuid)
+    if entry is None:
+        return False
+    if entry['state'] == 'failed':
+        result, age = _failure(entry)
+        return age < failure_ttl(result)
+    return entry['state'] in ('partial', 'ready')
+
+
+#: Serialises the mirror updates of this process (the inter-process lock
+#: doesn't exclude the threads of a process).
+_MIRROR_LOCK = threading.Lock()
+
+
+def clone_reference(repo):
+    """
+    The path of a mirror that the repo (its GitHub API data) can be cloned
+    with reference to, or None.
+
+    A fork is cloned with reference to the mirror of the root of its fork
+    network, which is created (or brought up to date) here. Any other repo
+    uses its own mirror, if a fork of it has previously been cloned. The
+    mirrors that haven't been referenced for ``MIRROR_MAX_AGE_DAYS`` are
+    removed along the way.
+
+    """
+    if not FORK_MIRRORS:
+        return None
+    evict_mirrors()
+    source = repo.get('source') or repo.get('parent')
+    if not repo.get('fork') or not source:
+        target = CACHE_MIRROR.format(repo['full_name'].lower())
+        if not os.path.isdir(target):
+            return None
+        # Mark the mirror as used, which keeps it from being evicted.
+        os.utime(target)
+        return target
+
+    import repohealth.git
+    target = CACHE_MIRROR.format(source['full_name'].lower())
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        with _MIRROR_LOCK, fasteners.InterProcessLock(target + '.lock'):
+            asyncio.run(repohealth.git.mirror(source['clone_url'], target))
+            os.utime(target)
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except Exception:
+        # The fork can still be cloned in full.
+        logging.exception('Unable to mirror {}'.format(source['full_name']))
+        return None
+    return target
+
+
+def remove_mirror(target):
+    """
+    Remove the mirror (unless it is being updated), returning whether it
+    is gone.
+
+    """
+    if not os.path.isdir(target):
+        return True
+    lock = fasteners.InterProcessLock(target + '.lock')
+    with _MIRROR_LOCK:
+        if not lock.acquire(blocking=False):
+            return False
+        try:
+            logging.info('Removing the mirror {}'.format(target))
+            shutil.rmtree(target)
+        finally:
+            lock.release()
+    return True
+
+
+def evict_mirrors(max_age=None):
+    """
+    Remove the mirrors that no clone has referenced for ``max_age`` seconds
+    (by default, ``MIRROR_MAX_AGE_DAYS``).
+
+    """
+    if max_age is None:
+        if not MIRROR_MAX_AGE_DAYS:
+            return
+        max_age = MIRROR_MAX_AGE_DAYS * 24 * 3600
+    now = time.time()
+    for target in glob.glob(CACHE_MIRROR.format('*/*')):
+        try:
+            age = now - os.path.getmtime(target)
+        except OSError:
+            # Removed by another process.
+            continue
+        if age > max_age:
+            remove_mirror(target)
+
+
+def pending_plots(payload):
+    """
+    The keys of the plots that can't be drawn from the (partial) payload
+    yet, as its line stats are still being computed.
+
+    """
+    if 'line_stats' in payload.get('pending', []):
+        return list(LINE_STATS_PLOTS)
+    return []
+
+
+def needs_refresh(uuid):
+    """
+    Whether the repo's (successfully) cached data is older than
+    FRESHNESS_HOURS, and so should be refreshed. A refresh that failed is
+    retried once its failure has expired.
+
+    """
+    if not FRESHNESS_HOURS:
+        return False
+    entry = cache_index().entry(uuid)
+    if entry is None or entry['state'] not in ('partial', 'ready'):
+        return False
+    if time.time() - entry['updated'] < FRESHNESS_HOURS * 3600:
+        return False
+    failure, age = _failure(entry, refresh=True)
+    return failure is None or age >= failure_ttl(failure)
+
+
+def cache_age(uuid):
+    """
+    The number of seconds since the repo was ingested (or since its
+    ingestion failed, unless the failure has expired), or None if it isn't
+    in the cache.
+
+    """
+    entry = cache_index().entry(uuid)
+    if entry is None or entry['state'] is None:
+        return None
+    age = time.time() - entry['updated']
+    if entry['state'] == 'failed' and age >= failure_ttl(entry['failure']):
+        return None
+    return age
 
 
 def in_cache():
@@ -84,54 +645,111 @@ def in_cache():
     Return all of the uuids of packages with sucessful & valid caches.
 
     """
-    patterns = [CACHE_GH.format('*/*'), CACHE_COMMITS.format('*/*')]
+    return list(summaries())
+
+
+#: The keys of the GitHub repo data that are kept in the repo summary.
+SUMMARY_REPO_KEYS = ['name', 'full_name', 'description', 'html_url',
+                     'stargazers_count', 'forks_count', 'open_issues_count',
+                     'fork', 'language']
+
+
+def summary(uuid, payload, updated=None):
+    """
+    Build the small summary record of a repo's payload.
 
-    gh = sorted(glob.glob(patterns[0]))
-    cm = sorted(glob.glob(patterns[1]))
+    """
+    if updated is None:
+        updated = datetime.datetime.utcnow()
+    github = payload['github']
+    return {'uuid': uuid,
+            'repo': {key: github['repo'].get(key)
+                     for key in SUMMARY_REPO_KEYS},
+            'counts': {'commits': len(payload['commits']),
+                       'contributors': len({commit['email']
+                                            for commit in payload['commits']}),
+                       'issues': len(github['issues']),
+                       'stargazers': len(github['stargazers'])},
+            'updated': updated.strftime('%Y-%m-%dT%H:%M:%SZ')}
+
+
+def _write_json_atomic(fname, content):
+    tmp_fname = '{}.{}.tmp'.format(fname, os.getpid())
+    with open(tmp_fname, 'wb') as raw, _compressed(raw) as fh:
+        text = io.TextIOWrapper(fh, encoding='utf-8')
+        json.dump(content, text)
+        # Flush, without closing the compressed stream before it is ended.
+        text.detach()
+    os.replace(tmp_fname, fname)
+
+
+def write_summary(uuid, payload, updated=None):
+    record = summary(uuid, payload, updated)
+    cache_index().update(uuid, summary=record)
+    return record
+
+
+def summaries():
+    """
+    Return the summary records of all of the successfully cached repos,
+    keyed by uuid (in order).
 
-    # One particularly sneaky (and unpleasant) way of getting the uuid from the
-    # filename is to inject something that shouldn't be there, and then
-    # figure out the indices that we need to pick off...
-    split_char = '&/&/&/&'
-    gh_pick = CACHE_GH.format(split_char).split(split_char)
-    gh = [path[len(gh_pick[0]) : -len(gh_pick[1])] for path in gh]
-    cm_pick = CACHE_COMMITS.format(split_char).split(split_char)
-    cm = [path[len(gh_pick[0]) : -len(cm_pick[1])] for path in cm]
-  
-    available = set(gh) & set(cm)
-    return sorted(available)
+    """
+    return cache_index().summaries()
 
 
 def job_status(uuid):
-    status_file = STATUS_FILE.format(uuid)
-    if not os.path.exists(status_file):
+    status = cache_index().status(uuid)
+    if status is None:
         status = {}
-    else:
-        with fasteners.InterProcessLock(STATUS_LOCK_FILE.format(uuid)):
-            with open(status_file, 'r') as fh:
-                status = json.load(fh)
     return status
 
 
-def prepare_repo_data(uuid, token):
+def prepare_repo_data(uuid, token, profile=False, refresh=False,
+                      shared_by=None, fresh_clone=False):
     # A function that doesn't give you the data, it just makes
     # sure it is all available in the cache.
-    result = repo_data(uuid, token)
+    if shared_by:
+        # The user has opted in to sharing their token with the other jobs
+        # (e.g. after logging in again, with a new token).
+        token_pool().share(token, 'user {}'.format(shared_by))
+    try:
+        with repohealth.profiling.job(CACHE_PROFILES, uuid, 'repo_data',
+                                      profile=profile):
+            result = repo_data(uuid, token, refresh=refresh,
+                               fresh_clone=fresh_clone)
+    finally:
+        # Make this worker's metrics available to the /metrics endpoint,
+        # and its tokens' quotas to the Status page.
+        repohealth.metrics.flush(CACHE_METRICS)
+        token_pool().flush()
     status = result.get('status', 200)
     return status
 
 
-def repo_data(uuid, token):
-    def update_status(message=None, clear=False, update=False):
-        status_file = STATUS_FILE.format(uuid)
-        status_lock = fasteners.InterProcessLock(STATUS_LOCK_FILE.format(uuid))
+def repo_data(uuid, token, refresh=False, fresh_clone=False):
+    """
+    The payload of the repo's report, which is prepared (and cached) if it
+    isn't already in the cache.
+
+    With ``fresh_clone``, the clone of the repo in the cache has only just
+    been made (e.g. by the warm command), so it isn't fetched again.
+
+    With ``refresh``, the cached payload is recomputed (fetching only the
+    issues that have changed since it was fetched), and each cache file is
+    swapped for the new one as it is ready, so that the stale payload can be
+    served in the meantime. A failed refresh leaves the stale payload as it
+    is (see ``needs_refresh``).
 
-        with status_lock:
-            if not os.path.exists(status_file) or clear:
+    """
+    import git
+    from github import Github
+    import repohealth.git
+
+    def update_status(message=None, clear=False, update=False):
+        def updated(status):
+            if status is None or clear:
                 status = []
-            else:
-                with open(status_file, 'r') as fh:
-                    status = json.load(fh)
 
             if status and not update:
                 # Log the last status item as complete.
@@ -148,110 +766,214 @@ def repo_data(uuid, token):
                     now = datetime.datetime.utcnow()
                     status.append(dict(start=now.strftime('%Y-%m-%dT%H:%M:%SZ'),
                                        status=message))
-
-            with open(status_file, 'w') as fh:
-                json.dump(status, fh)
-
-    cache_file = CACHE_EXCEPTION.format(uuid)
-    if os.path.exists(cache_file):
-        with open(cache_file, 'r') as fh:
-            result = json.load(fh)
-            return result
-
-    with no_raise(uuid):
+            return status
+
+        cache_index().update_status(uuid, updated)
+
+    def cache_lookup(kind, fname):
+        hit = os.path.exists(fname)
+        repohealth.metrics.increment('repohealth_cache_requests_total',
+                                     kind=kind,
+                                     result='hit' if hit else 'miss')
+        return hit
+
+    failure, age = load_failure(uuid)
+    attempts = 1
+    if failure is not None:
+        if age < failure_ttl(failure):
+            return failure
+        # Retry from scratch, remembering the failures for the backoff.
+        logging.info('Retrying {} after {} failed attempt(s)'
+                     ''.format(uuid, failure.get('attempts', 1)))
+        attempts = failure.get('attempts', 1) + 1
+        clear_cache(uuid)
+        refresh = False
+    elif refresh:
+        failure, _ = load_failure(uuid, refresh=True)
+        if failure is not None:
+            attempts = failure.get('attempts', 1) + 1
+
+    # A fresh payload from another instance (through the shared cache) is
+    # as good as one that we would ingest (or refresh) ourselves.
+    timer = repohealth.metrics.StageTimer()
+    shared = None
+    entry = cache_index().entry(uuid)
+    if refresh or entry is None or entry['state'] is None:
+        if repohealth.shared_cache.store() is not None:
+            update_status('Fetching from the shared cache', clear=True)
+        newer_than = entry['updated'] if refresh and entry else None
+        with timer.stage('shared_fetch'):
+            shared = fetch_shared(uuid, newer_than)
+        if shared is not None:
+            refresh = False
+
+    with no_raise(uuid, attempts, refresh):
         cache = CACHE_GH.format(uuid)
         dirname = os.path.dirname(cache)
         # Ensure the storage location exists.
         if not os.path.exists(dirname):
             os.makedirs(dirname)
 
-        if os.path.exists(cache):
+        previous = None
+        if refresh and os.path.exists(cache):
+            previous = load_cache(cache)
+
+        if not refresh and cache_lookup('github', cache):
             update_status('Load GitHub API data from ephemeral cache', clear=True)
-            with open(cache, 'r') as fh:
-                report = json.load(fh)
+            with timer.stage('cache_load'):
+                report = load_cache(cache)
             # We don't stop here - there is more to the report to add...
         else:
             update_status('Initial validation of repo', clear=True)
-            g = Github(token)
-            gh_repo = g.get_repo(uuid)
+            g = Github(token, base_url=GITHUB_API_URL)
+            repohealth.metrics.increment('repohealth_github_requests_total',
+                                         endpoint='repo')
+            with timer.stage('validate'):
+                gh_repo = g.get_repo(uuid)
 
             # Check that this is actually a valid repository. If not, return a known
             # status so that our report can deal with it with more grace than simply
             # catching the exception.
             try:
                 gh_repo.raw_data
-            except Exception:
-                report = {'status': 404,
-                          'message': 'Repository "{}" not found.'.format(uuid)}
-                with open(CACHE_EXCEPTION.format(uuid), 'w') as fh:
-                    json.dump(report, fh)
-                return report
+            except Exception as err:
+                if getattr(err, 'status', 404) != 404:
+                    # e.g. GitHub having a bad moment, which is transient.
+                    raise
+                return write_failure(
+                    uuid, {'status': 404,
+                           'message': 'Repository "{}" not found.'.format(uuid)},
+                    attempts)
 
             report = {}
 
             loop = tornado.ioloop.IOLoop()
 
             update_status('Fetching GitHub API data')
+            report['fetched'] = datetime.datetime.utcnow().strftime(
+                '%Y-%m-%dT%H:%M:%SZ')
             report['repo'] = gh_repo.raw_data
 
             update_status('Fetching GitHub issues data')
 
-            issues_fn = partial(repohealth.github.issues.repo_issues, gh_repo, token)
-            issues = loop.run_sync(issues_fn)
-            user_keys = ['login', 'id']
-            issue_keys = ['number', 'comments', 'created_at', 'state', 'closed_at']
-
-            def handle_issue(issue):
-                return dict(**{'user/{}'.format(key): issue['user'][key]
-                               for key in user_keys},
-                            **{key: issue[key] for key in issue_keys})
-            report['issues'] = [handle_issue(issue) for issue in issues]
+            # When refreshing, only the issues that have changed since they
+            # were last fetched are needed.
+            since = None
+            if previous is not None:
+                since = previous.get('fetched')
+            # The issues (and stargazers) are projected down to the keys
+            # that the report needs as each page arrives.
+            if GITHUB_BACKEND == 'graphql':
+                repo_issues = repohealth.github.graphql.repo_issues
+                repo_stargazers = repohealth.github.graphql.repo_stargazers
+            else:
+                repo_issues = repohealth.github.issues.repo_issues
+                repo_stargazers = repohealth.github.stargazers.repo_stargazers
+            # The pages are fetched through the token pool, which may make
+            # them with other tokens than the user's.
+            pool = token_pool()
+            issues_fn = partial(repo_issues, gh_repo, token, since=since,
+                                pool=pool)
+            with timer.stage('issues_fetch'):
+                report['issues'] = loop.run_sync(issues_fn)
+            if since is not None:
+                issues = OrderedDict((issue['number'], issue)
+                                     for issue in previous['issues'])
+                issues.update((issue['number'], issue)
+                              for issue in report['issues'])
+                report['issues'] = sorted(issues.values(), reverse=True,
+                                          key=lambda issue: issue['number'])
 
             update_status('Fetching GitHub stargazer data')
-            stargazers_fn = partial(repohealth.github.stargazers.repo_stargazers,
-                                    gh_repo, token)
-            stargazers = loop.run_sync(stargazers_fn)
-
-            star_keys = ['starred_at']
-
-            def handle_star(star):
-                return dict(**{'user/{}'.format(key): star['user'][key]
-                               for key in user_keys},
-                            **{key: star[key] for key in star_keys})
-
-            report['stargazers'] = [handle_star(stargazer)
-                                    for stargazer in stargazers
-                                    if isinstance(stargazer, dict)]
+            stargazers_fn = partial(repo_stargazers, gh_repo, token,
+                                    pool=pool)
+            with timer.stage('stargazers_fetch'):
+                report['stargazers'] = loop.run_sync(stargazers_fn)
 
-            with open(cache, 'w') as fh:
-                json.dump(report, fh)
+            with timer.stage('cache_write'):
+                write_cache(cache, report)
 
         cache = CACHE_COMMITS.format(uuid)
-        if not os.path.exists(cache):
+        ingested = refresh or not cache_lookup('commits', cache)
+        if ingested:
             clone_target = CACHE_CLONE.format(uuid)
             clone_exists = os.path.exists(clone_target)
 
-            if clone_exists:
+            def progress(action):
+                last_update = [0]
+
+                def update(line):
+                    # Git reports progress many times a second.
+                    if time.time() - last_update[0] > 1:
+                        last_update[0] = time.time()
+                        update_status('{}: {}'.format(action, line),
+                                      update=True)
+                return update
+
+            # The git stage of a job runs one step at a time, so each
+            # (asyncio) git command is simply run to completion. It is the
+            # warm command that overlaps the clones of many repos.
+            if clone_exists and fresh_clone:
+                update_status('Using the prefetched clone')
+            elif clone_exists:
                 # For local dev, we just fetch anything that already sits in the ephemeral cache.
                 update_status('Fetching remotes from cached clone')
-                repo = git.Repo(clone_target)
-                for remote in repo.remotes:
-                    remote.fetch()
+                with timer.stage('fetch'):
+                    asyncio.run(repohealth.git.fetch(
+                        clone_target, progress('Fetching remotes')))
             else:
+                if report['repo'].get('fork'):
+                    update_status('Updating the mirror of the forked repo')
+                with timer.stage('mirror'):
+                    reference = clone_reference(report['repo'])
                 update_status('Cloning repo')
-
-                class Progress(git.remote.RemoteProgress):
-                    def update(self, op_code, cur_count, max_count=None, message=''):
-                        if message:
-                            update_status('Cloning repo: {}'.format(message), update=True)
-
-                repo = git.Repo.clone_from(report['repo']['clone_url'], clone_target,
-                                           progress=Progress())
-
-            update_status('Analysing commits')
-            repo_data = repohealth.git.commits(repo)
-            with open(cache, 'w') as fh:
-                json.dump(repo_data, fh)
+                with timer.stage('clone'):
+                    asyncio.run(repohealth.git.clone(
+                        report['repo']['clone_url'], clone_target,
+                        progress('Cloning repo'), reference=reference,
+                        blobless=BLOBLESS_CLONES))
+            repo = git.Repo(clone_target)
+
+            if not refresh:
+                # Publish a partial payload (without the line stats, which
+                # need every commit to be diffed) as soon as possible, so
+                # that the report of a big repo can be seen while the rest
+                # is computed. (When refreshing, the stale payload is
+                # served in the meantime.)
+                update_status('Analysing commits')
+                with timer.stage('log_parse'):
+                    first_data = repohealth.git.commits(repo, stats=False)
+                first_data['pending'] = ['line_stats']
+                with timer.stage('cache_write'):
+                    _write_json_atomic(cache, first_data)
+                index_payload(uuid, 'partial')
+
+            if repohealth.git.is_partial(repo):
+                update_status('Fetching file contents')
+                with timer.stage('fetch_blobs'):
+                    try:
+                        asyncio.run(repohealth.git.fetch_blobs(
+                            clone_target, progress('Fetching file contents')))
+                    except git.GitCommandError:
+                        # e.g. git < 2.29, in which case git fetches the
+                        # blobs as it needs them.
+                        logging.exception('Unable to fetch the blobs of '
+                                          '{}'.format(uuid))
+
+            update_status('Analysing lines of change')
+            with timer.stage('log_parse'):
+                repo_data = repohealth.git.commits(repo)
+
+            if CHURN_ENABLED:
+                update_status('Analysing file churn')
+                with timer.stage('churn'):
+                    churn = repohealth.git.churn(repo)
+                with timer.stage('cache_write'):
+                    write_cache(CACHE_CHURN.format(uuid), churn)
+
+            # The line stats are no longer pending.
+            with timer.stage('cache_write'):
+                _write_json_atomic(cache, repo_data)
 
             if not clone_exists and os.path.exists(clone_target):
                 # This was ours to clone, so nuke it now.
@@ -259,33 +981,175 @@ def repo_data(uuid, token):
 
         else:
             update_status('Load commit from ephemeral cache')
-            with open(cache, 'r') as fh:
-                repo_data = json.load(fh)
+            with timer.stage('cache_load'):
+                repo_data = load_cache(cache)
+
+        # The full churn index can be large, so only the hotspots make it
+        # into the payload.
+        churn_cache = CACHE_CHURN.format(uuid)
+        if cache_lookup('churn', churn_cache):
+            with timer.stage('cache_load'):
+                churn = load_cache(churn_cache)
+            repo_data['hotspots'] = repohealth.git.churn_hotspots(churn)
 
         # Round off the status so that the last task has an end time.
         update_status()
 
         repo_data['github'] = report
+        timer.record(size=repohealth.metrics.size_class(
+            len(repo_data['commits'])))
+
+        if repo_data.get('pending'):
+            # The partial payload of a job that is still running, which
+            # indexes (and shares) the payload once it is finished.
+            return repo_data
+
+        if ingested or repo_rollup(uuid) is None:
+            write_rollup(uuid, repo_data)
+        entry = cache_index().entry(uuid)
+        if (ingested or shared is not None or entry is None or
+                entry['state'] != 'ready' or entry['summary'] is None):
+            updated = time.time() if shared is None else shared
+            record = summary(uuid, repo_data,
+                             datetime.datetime.utcfromtimestamp(updated))
+            index_payload(uuid, 'ready', summary=record, updated=updated,
+                          refresh_failure=None, refresh_failed=None)
+            if shared is None:
+                share_payload(uuid, updated)
         return repo_data
 
+    # The job failed, and no_raise recorded the exception.
+    return load_failure(uuid, refresh)[0]
 
-def visualisations(payload):
-    def html(fig):
-        config = dict(showLink=False, displaylogo=False)
-        plot_html, plotdivid, w, h = pl_offline._plot_html(
-            fig, config, validate=True,
-            default_width='100%', default_height='100%',
-            global_requirejs=False)
 
-        script_split = plot_html.find('<script ')
-        plot_content = {'div': plot_html[:script_split],
-                        'script': plot_html[script_split:],
-                        'id': plotdivid}
-        return plot_content
+def write_rollup(uuid, payload):
+    import repohealth.rollup
+    try:
+        rollup = repohealth.rollup.rollup(uuid, payload)
+    except (KeyboardInterrupt, SystemExit):
+        raise
+    except Exception:
+        logging.exception('Unable to compute the rollup for {}'.format(uuid))
+        return
+    write_cache(CACHE_ROLLUP.format(uuid), rollup)
+    cache_index().update(uuid, rollup_version=rollup['version'])
+
+
+def repo_rollup(uuid):
+    """
+    Return the cached rollup for the given repo, or None if there isn't a
+    current one.
+
+    """
+    import repohealth.rollup
+    entry = cache_index().entry(uuid)
+    if (entry is None or
+            entry['rollup_version'] != repohealth.rollup.ROLLUP_VERSION):
+        return None
+    return load_cache(CACHE_ROLLUP.format(uuid))
+
+
+def html(fig):
+    import plotly.offline.offline as pl_offline
+    config = dict(showLink=False, displaylogo=False)
+    plot_html, plotdivid, w, h = pl_offline._plot_html(
+        fig, config, validate=True,
+        default_width='100%', default_height='100%',
+        global_requirejs=False)
+
+    script_split = plot_html.find('<script ')
+    plot_content = {'div': plot_html[:script_split],
+                    'script': plot_html[script_split:],
+                    'id': plotdivid}
+    return plot_content
+
+
+def _layout(fig):
+    import plotly.graph_objs as go
+    if not isinstance(fig, go.Figure):
+        fig = go.Figure(fig)
+    fig.layout.margin = go.Margin(t=4, b=40, l=40, r=20, pad=1)
+    fig.layout.legend = dict(x=0.1, y=1)
+    return fig
+
+
+def comparison(uuids):
+    """
+    Build the comparison visualisations of the given repos, using only their
+    cached rollups.
+
+    Returns the rollups that were found, the uuids that don't have one,
+    and the visualisations (one per rollup series, with a trace per repo).
+
+    """
+    import plotly.graph_objs as go
+    import repohealth.rollup
+
+    rollups, missing = [], []
+    for uuid in uuids:
+        rollup = repo_rollup(uuid)
+        if rollup is None:
+            missing.append(uuid)
+        else:
+            rollups.append(rollup)
 
     visualisations = OrderedDict()
+    for key, title in repohealth.rollup.SERIES:
+        traces = []
+        for rollup in rollups:
+            series = rollup['series'][key]
+            traces.append(go.Scatter(x=repohealth.rollup.series_dates(series),
+                                     y=series['values'],
+                                     name=rollup['name']))
+        visualisation = html(_layout(go.Figure(data=traces)))
+        visualisation['title'] = title
+        visualisations[key] = visualisation
+    return rollups, missing, visualisations
+
+
+def visualisations(payload, uuid=None, profile=False):
+    """
+    Render the visualisations of the payload. If the repo's uuid is given,
+    the render may be profiled (see ``repohealth.profiling.job``).
+
+    """
+    return OrderedDict(iter_visualisations(payload, uuid, profile))
+
+
+def iter_visualisations(payload, uuid=None, profile=False):
+    """
+    Render the visualisations of the payload one at a time (in the order of
+    ``PLOTLY_PLOTS``), yielding the key and visualisation of each as soon as
+    it is ready, so that a report can be sent as it is rendered.
+
+    """
+    with repohealth.metrics.timer(
+            'repohealth_stage_seconds', stage='visualisation_render',
+            size=repohealth.metrics.size_class(len(payload['commits']))):
+        if uuid is None:
+            yield from _visualisations(payload)
+            return
+        with repohealth.profiling.job(CACHE_PROFILES, uuid, 'visualisations',
+                                      profile=profile):
+            yield from _visualisations(payload)
+
+
+def _visualisations(payload):
+    from repohealth.analysis import PLOTLY_PLOTS
+    from repohealth.analysis.contributor_activity import shared_activity
+
+    with shared_activity(payload):
+        yield from _render_visualisations(payload, PLOTLY_PLOTS)
+
+
+def _render_visualisations(payload, plots):
+    pending = pending_plots(payload)
+
+    for key, title, mod in plots:
+        if key in pending:
+            yield key, {'title': title, 'pending': True}
+            continue
 
-    for key, title, mod in PLOTLY_PLOTS:
         prep_fn_name = '{}_prep'.format(key)
         viz_fn_name = '{}_viz'.format(key)
         prepare = getattr(mod, prep_fn_name)
@@ -302,10 +1166,7 @@ def visualisations(payload):
             logging.exception(traceback.format_exc())
             continue
 
-        if not isinstance(fig, go.Figure):
-            fig = go.Figure(fig)
-        fig.layout.margin = go.Margin(t=4, b=40, l=40, r=20, pad=1)
-        fig.layout.legend = dict(x=0.1, y=1)
+        fig = _layout(fig)
         visualisation = html(fig)
         del fig
 
@@ -322,5 +1183,22 @@ def visualisations(payload):
         visualisation['code'] = code
         visualisation['title'] = title
 
-        visualisations[key] = visualisation
-    return visualisations
+        yield key, visualisation
+
+
+def main():
+    import argparse
+    import repohealth.warm
+
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+    repohealth.warm.add_arguments(subparsers.add_parser(
+        'warm', help='Ingest a list of repos into the cache.'))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
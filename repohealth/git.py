@@ -1,11 +1,204 @@
+import array
+import asyncio
+import collections
 import datetime
+import os
+import re
+import subprocess
+
 import git
+import numpy as np
 import pandas as pd
 from io import StringIO
 import json
 
 
-def commits(repo):
+async def _git(*args, cwd=None, progress=None, input=None):
+    """
+    Run git asynchronously, passing each line of its (``--progress``)
+    output on stderr to the progress callback as it arrives. The chunks of
+    bytes of the ``input`` async iterator, if given, are written to git's
+    stdin.
+
+    """
+    # Never prompt for credentials (e.g. for a private repo).
+    env = dict(os.environ, GIT_TERMINAL_PROMPT='0')
+    proc = await asyncio.create_subprocess_exec(
+        'git', *args, cwd=cwd, env=env,
+        stdin=subprocess.DEVNULL if input is None else subprocess.PIPE,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    tail = collections.deque(maxlen=20)
+
+    async def feed():
+        try:
+            async for chunk in input:
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+            proc.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            # git has exited, and its status says why.
+            pass
+
+    feeder = None if input is None else asyncio.ensure_future(feed())
+    try:
+        remainder = b''
+        while True:
+            chunk = await proc.stderr.read(2 ** 12)
+            if not chunk:
+                break
+            # Progress is reported as lines that end with a carriage return.
+            lines = re.split(b'[\r\n]', remainder + chunk)
+            remainder = lines.pop()
+            for line in lines:
+                line = line.decode('utf-8', 'replace').strip()
+                if line:
+                    tail.append(line)
+                    if progress is not None:
+                        progress(line)
+        if feeder is not None:
+            await feeder
+        status = await proc.wait()
+    except BaseException:
+        # Including cancellation, in which case git mustn't be left behind.
+        if feeder is not None:
+            feeder.cancel()
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+    if status != 0:
+        raise git.GitCommandError(['git'] + list(args), status,
+                                  '\n'.join(tail))
+
+
+async def clone(url, target, progress=None, reference=None, blobless=False):
+    """
+    Clone the repo at ``url`` into ``target``, without blocking the event
+    loop. Objects that the ``reference`` repo (e.g. a mirror of the repo
+    that this one is a fork of) already has are borrowed from it (through
+    git's alternates), rather than fetched.
+
+    A ``blobless`` clone only has the commits and trees (and no working
+    tree), which is enough for the commit metadata. The file contents are
+    fetched later (see ``fetch_blobs``), or as git needs them.
+
+    """
+    args = ['clone', '--progress']
+    if reference is not None:
+        args.extend(['--reference-if-able', reference])
+    if blobless:
+        args.extend(['--filter=blob:none', '--no-checkout'])
+    await _git(*(args + [url, target]), progress=progress)
+
+
+def is_partial(repo):
+    """
+    Whether the repo is a partial (e.g. blobless) clone.
+
+    """
+    return repo.config_reader().has_option('remote "origin"',
+                                           'partialclonefilter')
+
+
+async def missing_objects(target):
+    """
+    Generate the ids of the objects (e.g. the blobs of a blobless clone)
+    that are missing from the partial clone at ``target``, as chunks of
+    newline terminated lines (without fetching them).
+
+    """
+    proc = await asyncio.create_subprocess_exec(
+        'git', 'rev-list', '--objects', '--all', '--missing=print',
+        cwd=target, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL)
+    try:
+        remainder = b''
+        while True:
+            chunk = await proc.stdout.read(2 ** 16)
+            if not chunk:
+                break
+            lines = (remainder + chunk).split(b'\n')
+            remainder = lines.pop()
+            # The missing objects are those prefixed with "?".
+            missing = [line[1:] for line in lines if line.startswith(b'?')]
+            if missing:
+                yield b'\n'.join(missing) + b'\n'
+        status = await proc.wait()
+    except BaseException:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        raise
+    if status != 0:
+        raise git.GitCommandError(['git', 'rev-list', '--missing=print'],
+                                  status)
+
+
+async def fetch_blobs(target, progress=None):
+    """
+    Fetch the objects that the partial clone at ``target`` left out.
+
+    Without this, ``git log --shortstat`` would fetch the missing blobs
+    lazily, with a round trip to the server for every commit. Only the
+    missing objects are fetched (by id, as git's own lazy fetches do), so
+    the commits and trees aren't downloaded again, and the clone keeps its
+    filter.
+
+    """
+    missing = missing_objects(target)
+    try:
+        first = await missing.__anext__()
+    except StopAsyncIteration:
+        return
+
+    async def ids():
+        yield first
+        async for chunk in missing:
+            yield chunk
+
+    # --stdin and --no-write-fetch-head need git >= 2.29. The fetch would
+    # otherwise repack in the background, which isn't worth it for a clone
+    # that is about to be analysed (and removed).
+    await _git('-c', 'fetch.negotiationAlgorithm=noop', 'fetch', 'origin',
+               '--no-tags', '--no-write-fetch-head', '--recurse-submodules=no',
+               '--filter=blob:none', '--no-auto-gc', '--progress', '--stdin',
+               cwd=target, progress=progress, input=ids())
+
+
+async def mirror(url, target, progress=None):
+    """
+    Create (or bring up to date) a bare mirror of the repo at ``url``,
+    without blocking the event loop.
+
+    """
+    if os.path.exists(target):
+        await _git('remote', 'update', '--prune', cwd=target)
+    else:
+        await _git('clone', '--mirror', '--progress', url, target,
+                   progress=progress)
+
+
+async def fetch(target, progress=None):
+    """
+    Fetch all of the remotes of the clone at ``target``, without blocking
+    the event loop.
+
+    """
+    await _git('fetch', '--all', '--progress', cwd=target, progress=progress)
+
+
+def commits(repo, stats=True):
+    """
+    The commits of the repo, ordered by date. Without ``stats``, the
+    (slow to compute) number of files changed and lines inserted and deleted
+    by each commit are left out.
+
+    """
+    if not stats:
+        log_output = repo.git.log('--all', '--format=%ai|%aN|%aE|%h', '--reverse')
+        commit_lines = [line.strip() for line in log_output.split('\n') if line]
+        return _commit_records(commit_lines, ['date', 'name', 'email', 'sha'])
+
      # Get all contributions, ordered by date.
     log_output = repo.git.log('--all', '--format=%ai|%aN|%aE|%h|', '--reverse', '--shortstat')
     commit_lines = []
@@ -36,8 +229,15 @@ def commits(repo):
 
             commit_has_stat = False
             commit_lines.append(line.strip())
-   
+
+    if commit_lines and not commit_has_stat:
+        commit_lines[-1] = commit_lines[-1] + '0|0|0'
+
     headings = ['date', 'name', 'email', 'sha', 'changed_files', 'insertions', 'deletions']
+    return _commit_records(commit_lines, headings)
+
+
+def _commit_records(commit_lines, headings):
     commits = pd.read_csv(StringIO('\n'.join(commit_lines)), sep='|', parse_dates=[0],
                           infer_datetime_format=True, names=headings)
     commits.sort_values('date', inplace=True)
@@ -59,40 +259,124 @@ def commits(repo):
     return commits
 
 
-def contributors(repo):
-    max_samples = 30
+def _nul_separated(stream, chunk_size=2 ** 16):
+    # Yield the NUL separated fields of a (binary) stream.
+    remainder = b''
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        fields = (remainder + chunk).split(b'\0')
+        remainder = fields.pop()
+        for field in fields:
+            yield field.decode('utf-8', 'replace')
+    if remainder:
+        yield remainder.decode('utf-8', 'replace')
 
-    # Get all contributions, ordered by date.
-    all_contribs = repo.git.log('--all', '--format=%aD|%aN|%aE', '--reverse')
 
-    all_contribs = pd.read_csv(StringIO(all_contribs), sep='|', parse_dates=[0], infer_datetime_format=True, names=['Date', 'Name', 'Email'])
+def churn(repo):
+    """
+    Build a per-path churn index by streaming ``git log --numstat``.
+
+    Path strings are interned, and the per-path counts are held in arrays,
+    so the memory needed is proportional to the number of distinct paths,
+    not to the number of file changes in the history.
+
+    """
+    path_ids = {}
+    commits, insertions, deletions = (array.array('q'), array.array('q'),
+                                      array.array('q'))
+
+    # With -z, paths are never quoted, and a rename is reported as an empty
+    # path followed by the old and new paths as fields of their own.
+    proc = repo.git.log('--all', '--numstat', '--format=', '-z',
+                        as_process=True)
+    try:
+        fields = _nul_separated(proc.stdout)
+        for field in fields:
+            field = field.lstrip('\n')
+            if not field:
+                continue
+            added, removed, path = field.split('\t', 2)
+            if not path:
+                next(fields)
+                path = next(fields)
 
-    # Drop all but the first commit for each user 
-    first_commits = all_contribs.drop_duplicates(subset='Email')
+            path_id = path_ids.get(path)
+            if path_id is None:
+                path_id = path_ids[path] = len(path_ids)
+                commits.append(0)
+                insertions.append(0)
+                deletions.append(0)
 
-    combined = lambda ds: ', '.join('{0.Name}|{0.Email}'.format(row) for index, row in ds.iterrows())
-    commits_grouped = first_commits.set_index('Date').groupby(pd.TimeGrouper(freq='M'))
-    
-    isodt = lambda pd_dt: datetime.datetime.strftime(pd_dt, '%Y-%m-%dT%H:%M:%SZ')
+            commits[path_id] += 1
+            # Binary files have a "-" rather than a line count.
+            if added != '-':
+                insertions[path_id] += int(added)
+                deletions[path_id] += int(removed)
+    except BaseException:
+        # Don't leave git blocked on writing to a pipe that nobody reads.
+        proc.proc.kill()
+        proc.proc.wait()
+        raise
+    proc.wait()
 
-    first_commit_counts = commits_grouped.apply(combined)
-    first_commit_counts = first_commit_counts.to_frame('New contributors')
-    first_commit_counts['Count'] = commits_grouped.count()['Name'].values
-    results = {}
+    return {'paths': list(path_ids),
+            'commits': commits.tolist(),
+            'insertions': insertions.tolist(),
+            'deletions': deletions.tolist()}
 
-    first_commits = [{'date': isodt(row['Date']), 'name': row['Name'], 'email': row['Email']}
-                      for _, row in first_commits.iterrows()]
 
+def churn_hotspots(index, count=50):
+    """
+    Return the ``count`` paths with the most commits from a churn index,
+    as a list of records.
+
+    """
+    commits = np.asarray(index['commits'])
+    lines = np.asarray(index['insertions']) + np.asarray(index['deletions'])
+    # Order by number of commits, breaking ties with the lines changed.
+    order = np.lexsort((-lines, -commits))[:count]
+    return [{'path': index['paths'][i],
+             'commits': int(commits[i]),
+             'insertions': int(index['insertions'][i]),
+             'deletions': int(index['deletions'][i])}
+            for i in order]
+
+
+def contributors(repo):
+    """
+    Return the first commit of each contributor, along with those first
+    commits grouped by month.
+
+    """
+    from repohealth.analysis.contributor_activity import contributor_activity
+
+    # Get all contributions, ordered by date.
+    all_contribs = repo.git.log('--all', '--format=%aI|%aN|%aE', '--reverse')
+    all_contribs = pd.read_csv(StringIO(all_contribs), sep='|',
+                               names=['Date', 'Name', 'Email'])
+    dates = pd.to_datetime(all_contribs['Date'], utc=True).dt.tz_localize(None)
+
+    activity = contributor_activity(dates.values, all_contribs['Email'].values)
+    names = all_contribs.drop_duplicates(subset='Email').set_index('Email')['Name']
+
+    isodt = lambda dt: str(np.datetime_as_string(dt, unit='s')) + 'Z'
+
+    order = np.argsort(activity['first_seen'], kind='mergesort')
+    first_commits = [{'date': isodt(activity['first_seen'][i]),
+                      'name': names[activity['author'][i]],
+                      'email': activity['author'][i]}
+                     for i in order]
+
+    first_month = activity['first_seen'][order].astype('datetime64[M]')
+    bounds = np.searchsorted(first_month, activity['month'])
+    bounds = np.append(bounds, len(first_commits))
     first_commits_grouped = []
-    for index, rows in commits_grouped:
-        first_commits_grouped.append({'T1': isodt(index),
-                                      'count': len(rows),
-                                      'first_contributions': [{'date': isodt(ind), 'name': row['Name'], 'email': row['Email']}
-                                                               for ind, row in rows.iterrows()]})
-    results['first_commit_T1M_groups'] = first_commits_grouped
-    results['first_commits'] = sorted(first_commits, key=lambda commit: commit['date'])
-
-    return results
+    for month, start, end in zip(activity['month'], bounds[:-1], bounds[1:]):
+        first_commits_grouped.append({'T1': isodt(month),
+                                      'count': int(end - start),
+                                      'first_contributions': first_commits[start:end]})
+
+    return {'first_commit_T1M_groups': first_commits_grouped,
+            'first_commits': first_commits}
 
 
 if __name__ == '__main__':
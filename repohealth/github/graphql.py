@@ -0,0 +1,191 @@
+"""
+Fetch the issues and stargazers of a repo from GitHub's GraphQL API, as an
+alternative to the REST listings of ``repohealth.github.issues`` and
+``repohealth.github.stargazers`` (see ``GITHUB_BACKEND`` in
+``repohealth.generate``).
+
+Only the fields that make it into the payload are requested, and the
+results are the same records as those of the REST fetchers. GraphQL pages
+are followed by cursor, so they are fetched one after the other rather than
+concurrently, but the issues and the pull requests (which are separate
+connections in GraphQL) are fetched in the same queries.
+
+"""
+import json
+import logging
+
+import tornado.gen
+from tornado.httpclient import AsyncHTTPClient
+
+import repohealth.metrics
+from repohealth.github.pagination import fetch_page, PAGE_SIZE
+
+
+#: The fields of an issue or pull request that are requested.
+ISSUE_FIELDS = """
+        pageInfo { hasNextPage endCursor }
+        nodes {
+          number state createdAt closedAt updatedAt
+          comments { totalCount }
+          author { login ... on User { databaseId } ... on Bot { databaseId } }
+        }
+"""
+
+ISSUES_QUERY = """
+query($owner: String!, $name: String!, $since: DateTime,
+      $issues: Boolean!, $issuesCursor: String,
+      $pulls: Boolean!, $pullsCursor: String) {
+  rateLimit { cost remaining }
+  repository(owner: $owner, name: $name) {
+    issues(first: %(page_size)d, after: $issuesCursor,
+           filterBy: {since: $since},
+           orderBy: {field: CREATED_AT, direction: DESC})
+        @include(if: $issues) {%(fields)s}
+    pullRequests(first: %(page_size)d, after: $pullsCursor,
+                 orderBy: {field: UPDATED_AT, direction: DESC})
+        @include(if: $pulls) {%(fields)s}
+  }
+}
+""" % {'page_size': PAGE_SIZE, 'fields': ISSUE_FIELDS}
+
+STARGAZERS_QUERY = """
+query($owner: String!, $name: String!, $cursor: String) {
+  rateLimit { cost remaining }
+  repository(owner: $owner, name: $name) {
+    stargazers(first: %(page_size)d, after: $cursor,
+               orderBy: {field: STARRED_AT, direction: ASC}) {
+      pageInfo { hasNextPage endCursor }
+      edges { starredAt node { login databaseId } }
+    }
+  }
+}
+""" % {'page_size': PAGE_SIZE}
+
+#: The user that GitHub attributes the issues of deleted accounts to (which
+#: have no author in GraphQL).
+GHOST = {'login': 'ghost', 'databaseId': 10137}
+
+
+class GraphQLError(Exception):
+    """The errors of a GraphQL response."""
+    def __init__(self, errors):
+        super(GraphQLError, self).__init__(
+            '; '.join(error.get('message', str(error)) for error in errors))
+        self.errors = errors
+
+
+def graphql_url(repo):
+    """
+    The GraphQL endpoint of the API that the (PyGithub) repo came from.
+
+    """
+    base = repo.url.split('/repos/')[0]
+    if base.endswith('/v3'):
+        # GitHub Enterprise serves REST from /api/v3 and GraphQL from /api.
+        base = base[:-len('/v3')]
+    return base + '/graphql'
+
+
+@tornado.gen.coroutine
+def query(client, url, token, text, variables, endpoint, pool=None):
+    """
+    Run the GraphQL query (through the token pool, if given), and return its
+    data.
+
+    """
+    headers = {'User-Agent': 'tornado',
+               'Authorization': 'bearer {}'.format(token),
+               'Content-Type': 'application/json'}
+    body = json.dumps({'query': text, 'variables': variables})
+    content, _ = yield fetch_page(client, url, headers, endpoint, body=body,
+                                  pool=pool)
+    if content.get('errors'):
+        raise GraphQLError(content['errors'])
+    data = content['data']
+    if data.get('rateLimit'):
+        repohealth.metrics.increment('repohealth_github_graphql_cost_total',
+                                     data['rateLimit']['cost'],
+                                     endpoint=endpoint)
+    return data
+
+
+def project_issue(node):
+    author = node['author'] or GHOST
+    return {'user/login': author['login'],
+            'user/id': author.get('databaseId'),
+            'number': node['number'],
+            'comments': node['comments']['totalCount'],
+            'created_at': node['createdAt'],
+            # Merged pull requests are "closed" issues in the REST API.
+            'state': 'open' if node['state'] == 'OPEN' else 'closed',
+            'closed_at': node['closedAt']}
+
+
+@tornado.gen.coroutine
+def repo_issues(repo, token, since=None, pool=None):
+    """
+    Fetch all of the issues (and pull requests) of the repo, or only those
+    updated at or after ``since`` (an ISO 8601 timestamp), newest first.
+    Equivalent to ``repohealth.github.issues.repo_issues``.
+
+    """
+    client = AsyncHTTPClient()
+    url = graphql_url(repo)
+    owner, name = repo.full_name.split('/')
+    variables = {'owner': owner, 'name': name, 'since': since,
+                 'issues': True, 'issuesCursor': None,
+                 'pulls': True, 'pullsCursor': None}
+    issues = []
+    while variables['issues'] or variables['pulls']:
+        data = yield query(client, url, token, ISSUES_QUERY, variables,
+                           'graphql_issues', pool)
+        repository = data['repository']
+        for kind, connection in [('issues', 'issues'),
+                                 ('pulls', 'pullRequests')]:
+            if not variables[kind]:
+                continue
+            page = repository[connection]
+            nodes = page['nodes']
+            more = page['pageInfo']['hasNextPage']
+            if kind == 'pulls' and since is not None:
+                # Pull requests can't be filtered by "since", but they are
+                # ordered by when they were updated.
+                fresh = [node for node in nodes if node['updatedAt'] >= since]
+                more = more and len(fresh) == len(nodes)
+                nodes = fresh
+            issues.extend(project_issue(node) for node in nodes)
+            variables[kind] = more
+            variables[kind + 'Cursor'] = page['pageInfo']['endCursor']
+    issues.sort(key=lambda issue: issue['number'], reverse=True)
+    return issues
+
+
+@tornado.gen.coroutine
+def repo_stargazers(repo, token, pool=None):
+    """
+    Fetch all of the stargazers of the repo, in the order that they starred
+    it. Equivalent to ``repohealth.github.stargazers.repo_stargazers``.
+
+    """
+    client = AsyncHTTPClient()
+    url = graphql_url(repo)
+    owner, name = repo.full_name.split('/')
+    variables = {'owner': owner, 'name': name, 'cursor': None}
+    stargazers = []
+    while True:
+        data = yield query(client, url, token, STARGAZERS_QUERY, variables,
+                           'graphql_stargazers', pool)
+        page = data['repository']['stargazers']
+        stargazers.extend({'user/login': edge['node']['login'],
+                           'user/id': edge['node']['databaseId'],
+                           'starred_at': edge['starredAt']}
+                          for edge in page['edges'])
+        if not page['pageInfo']['hasNextPage']:
+            break
+        variables['cursor'] = page['pageInfo']['endCursor']
+
+    if len(stargazers) != repo.stargazers_count:
+        logging.warning('The number of expected stargazers ({}) did not '
+                        'match the number we received ({}).'
+                        ''.format(repo.stargazers_count, len(stargazers)))
+    return stargazers
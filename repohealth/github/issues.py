@@ -1,95 +1,53 @@
-import json
-import logging
-from urllib.parse import urlparse, parse_qs
-import traceback
-
-import github as gh
-import tornado.httpclient
-from tornado.httpclient import AsyncHTTPClient
 from tornado.gen import coroutine
 
+from repohealth.github.pagination import fetch_all
 
-def parse_link(link_header):
-    l0, l1 = link_header.split(',')
-    next_url = l0.strip()[1:-len('>; rel="next"')]
-    last_url = l1.strip()[1:-len('>; rel="last"')]
-    return next_url, last_url
 
+#: The keys of the issues' users, and of the issues, that are kept.
+USER_KEYS = ['login', 'id']
+ISSUE_KEYS = ['number', 'comments', 'created_at', 'state', 'closed_at']
 
-def handle_response(issues, response):
-    if not response.error:
-        content = json.loads(response.body.decode('utf-8'))
-        issues.extend(content)
 
+def project_issues(issues):
+    """
+    Project a page of issues (as returned by the API) down to the records
+    that make it into the payload.
 
-@coroutine
-def repo_issues(repo, token):
-    issues_url = repo.issues_url.format(**{'/number': ''})
-    page_size = 100
-
-    headers = {'User-Agent': 'tornado'}
-    headers['Authorization'] = 'token {}'.format(token)
+    """
+    return [dict(**{'user/{}'.format(key): issue['user'][key]
+                    for key in USER_KEYS},
+                 **{key: issue[key] for key in ISSUE_KEYS})
+            for issue in issues]
 
-    # Be good citizens and allow a maximum of 40 concurrent requests.
-    client = AsyncHTTPClient(max_clients=40)
-    url = issues_url + "?per_page={}&page={}&state=all".format(page_size, 1)
-    response = yield client.fetch(url, headers=headers)
 
-    issues = []
-    handle_response(issues, response)
+@coroutine
+def repo_issues(repo, token, since=None, project=project_issues, pool=None):
+    """
+    Fetch all of the issues (and pull requests) of the repo, or only those
+    updated at or after ``since`` (an ISO 8601 timestamp), newest first.
 
-    if 'Link' not in response.headers:
-        return issues
+    Each page of issues is projected (with ``project``, see
+    ``project_issues``) as it arrives. Use ``project=None`` for the issues
+    as they are returned by the API. The requests are made through the
+    token pool, if given (see ``repohealth.github.tokens``).
 
-    next_url, last_url = parse_link(response.headers['Link'])
-    qs = parse_qs(urlparse(last_url).query)
-    last_page = int(qs['page'][0])
+    """
+    issues_url = repo.issues_url.format(**{'/number': ''})
 
-    from functools import partial
-    get_issues = partial(handle_response, issues)
-    futures = []
-    for page in range(2, last_page + 1):
-        url = ("{}?per_page={}&page={}&state=all"
-               "".format(issues_url, page_size, page))
-        f = client.fetch(url, headers=headers, callback=get_issues)
-        f.url = url
-        futures.append(f)
-
-    error_count = 0
-
-    while futures:
-        waited = False
-        for future in futures[:]:
-            future = futures.pop(0)
-            try:
-                yield future
-            except tornado.httpclient.HTTPError as err:
-                # Try again, but give it a little while...
-                url = future.url
-                if error_count < 5:
-                    f = client.fetch(future.url, headers=headers,
-                                     callback=get_issues)
-                    f.url = future.url
-                    futures.append(f)
-                else:
-                    if not waited:
-                        # Give Github some time to get over our request
-                        # before we retry.
-                        logging.exception("Sleeping attempt {} to rectify "
-                                          "fetch error.".format(error_count))
-                        yield tornado.gen.sleep(15)
-                        error_count += 1
-                        waited = True
-
-                    logging.exception('A problem with {} occured after {} '
-                                      'attempts. Skipping'
-                                      ''.format(url, error_count))
-                    logging.exception(traceback.format_exc())
+    headers = {'User-Agent': 'tornado'}
+    headers['Authorization'] = 'token {}'.format(token)
 
+    params = {'state': 'all'}
+    if since is not None:
+        params['since'] = since
+    issues = yield fetch_all(issues_url, headers, 'issues', params=params,
+                             project=project, pool=pool)
     return issues
 
 
 if __name__ == '__main__':
+    import github as gh
+
     token = '...'
 
     g = gh.Github(token)
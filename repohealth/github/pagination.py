@@ -0,0 +1,169 @@
+"""
+Fetch all of the pages of a GitHub API listing concurrently.
+
+The first page tells us (through its "Link" header) how many pages there
+are, and the rest are then fetched concurrently. Failed requests are
+retried with an exponential backoff (honouring any "Retry-After" that
+GitHub asks for). With a token pool (see ``repohealth.github.tokens``),
+each request waits for a slot of the pool, and is made with the token that
+has the most quota to spare.
+
+"""
+import json
+import logging
+from urllib.parse import urlencode, urlparse, parse_qs
+
+import tornado.gen
+import tornado.httpclient
+from tornado.httpclient import AsyncHTTPClient
+
+import repohealth.metrics
+from repohealth.github.tokens import authorization
+
+
+#: The number of items requested per page (the most that GitHub allows).
+PAGE_SIZE = 100
+
+#: The number of times that a failed request is retried.
+RETRIES = 5
+
+#: The delay (in seconds) before the first retry of a request, which is
+#: doubled for each subsequent retry.
+RETRY_DELAY = 1
+
+
+def parse_link(link_header):
+    # The header looks like '<url>; rel="next", <url>; rel="last"', though
+    # GitHub also includes "prev" and "first" links after the first page.
+    links = {}
+    for link in link_header.split(','):
+        url, rel = link.split(';', 1)
+        links[rel.strip()[len('rel="'):-1]] = url.strip()[1:-1]
+    return links.get('next'), links.get('last')
+
+
+def _retry_delay(err, attempt):
+    """
+    The delay before retrying the failed request, or None if it shouldn't
+    be retried.
+
+    """
+    response = getattr(err, 'response', None)
+    code = getattr(err, 'code', 599)
+    retry_after = None
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+    if retry_after is not None:
+        # Secondary rate limiting.
+        return max(float(retry_after), RETRY_DELAY * 2 ** attempt)
+    if code >= 500:
+        return RETRY_DELAY * 2 ** attempt
+    return None
+
+
+@tornado.gen.coroutine
+def fetch_page(client, url, headers, endpoint, body=None, pool=None):
+    """
+    Fetch a page (POSTing the body, if there is one), and return its decoded
+    content and the response.
+
+    With a pool, the request is made (within the pool's cap) with the
+    token of the pool that has the most quota to spare, which may be the
+    token of the headers.
+
+    """
+    method = 'GET' if body is None else 'POST'
+    _, own_token = authorization(headers)
+    for attempt in range(RETRIES + 1):
+        token = own_token
+        if pool is not None:
+            slot, token, request_headers = yield pool.acquire(headers)
+        else:
+            request_headers = headers
+        try:
+            response = yield client.fetch(url, method=method,
+                                          headers=request_headers, body=body)
+        except (tornado.httpclient.HTTPError, IOError) as err:
+            # Tornado 6 raises connection errors as they are, rather than
+            # as an HTTPError with a 599 code.
+            code = getattr(err, 'code', 599)
+            if pool is not None:
+                response = getattr(err, 'response', None)
+                pool.release(slot, token, code,
+                             None if response is None else response.headers)
+            repohealth.metrics.increment('repohealth_github_requests_total',
+                                         endpoint=endpoint, code=code)
+            delay = _retry_delay(err, attempt)
+            if delay is None and token != own_token and code in (401, 403):
+                # A shared token that has run out (or been revoked), so try
+                # another.
+                delay = 0
+            if delay is None or attempt == RETRIES:
+                raise
+            logging.warning('Retrying {} in {:.0f}s after: {}'
+                            ''.format(url, delay, err))
+            yield tornado.gen.sleep(delay)
+            continue
+
+        if pool is not None:
+            pool.release(slot, token, response.code, response.headers)
+        repohealth.metrics.increment('repohealth_github_requests_total',
+                                     endpoint=endpoint, code=response.code)
+        repohealth.metrics.increment('repohealth_github_bytes_total',
+                                     len(response.body), endpoint=endpoint)
+        return json.loads(response.body.decode('utf-8')), response
+
+
+@tornado.gen.coroutine
+def _fetch_projected(client, url, headers, endpoint, project, pool):
+    content, _ = yield fetch_page(client, url, headers, endpoint, pool=pool)
+    return project(content)
+
+
+def _all(items):
+    return items
+
+
+@tornado.gen.coroutine
+def fetch_all(url, headers, endpoint, params=None, project=None, pool=None):
+    """
+    Fetch all of the items of the listing at the given URL (with the given
+    query parameters), in order.
+
+    With ``project``, the items of each page are replaced by
+    ``project(items)`` as soon as the page arrives, so that only the
+    projected items (rather than every page of the API's responses) are
+    held until the listing is complete.
+
+    A page that still fails after retrying fails the whole listing (rather
+    than leaving a gap in it). The requests are made through the token
+    pool, if given (see ``fetch_page``).
+
+    """
+    if project is None:
+        project = _all
+    # Be good citizens and allow a maximum of 40 concurrent requests.
+    client = AsyncHTTPClient(max_clients=40)
+
+    def page_url(page):
+        query = dict(params or {}, per_page=PAGE_SIZE, page=page)
+        return '{}?{}'.format(url, urlencode(sorted(query.items())))
+
+    content, response = yield fetch_page(client, page_url(1), headers,
+                                         endpoint, pool=pool)
+    items = list(project(content))
+    del content
+
+    last_url = None
+    if 'Link' in response.headers:
+        _, last_url = parse_link(response.headers['Link'])
+    if last_url is None:
+        return items
+
+    last_page = int(parse_qs(urlparse(last_url).query)['page'][0])
+    pages = yield [_fetch_projected(client, page_url(page), headers,
+                                    endpoint, project, pool)
+                   for page in range(2, last_page + 1)]
+    for content in pages:
+        items.extend(content)
+    return items
@@ -0,0 +1,331 @@
+"""
+A pool of the GitHub tokens that the fetches of every job may use, and a
+cap on the number of GitHub API requests in flight at once.
+
+The pool holds the service tokens (``GITHUB_TOKENS``) and the tokens of
+users who have opted in to sharing them, alongside the token of each job
+that fetches through it. Each request is made with whichever of the job's
+token and the shared tokens has the most quota to spare (as per the
+``X-RateLimit-*`` headers of its latest response, less its requests in
+flight), so that simultaneous jobs spread their requests over the pool
+rather than exhausting (or being secondary rate limited on) one token::
+
+    pool = TokenPool(['service-token'], max_requests=40)
+    issues = yield repo_issues(repo, user_token, pool=pool)
+
+The requests in flight are capped by ``max_requests``, across all of the
+processes that share the pool's slots directory (e.g. the executor workers
+of an instance), and the quota of each token is shared through the store
+(e.g. the cache index), which is where the Status page reads it from. The
+users' tokens are shared through the store too, so that they join the pool
+of every process (and leave it when the user opts out).
+
+"""
+import hashlib
+import os
+import random
+import threading
+import time
+
+import fasteners
+import tornado.gen
+
+
+#: The service tokens (comma separated), which every job may use.
+SERVICE_TOKENS = [token.strip()
+                  for token in os.environ.get('GITHUB_TOKENS', '').split(',')
+                  if token.strip()]
+
+#: The most GitHub API requests that may be in flight at once, across the
+#: jobs of every executor worker.
+MAX_REQUESTS = int(os.environ.get('REPOHEALTH_GITHUB_MAX_REQUESTS', 40))
+
+#: The quota of a token that hasn't been used yet (GitHub's hourly limit).
+DEFAULT_LIMIT = 5000
+
+#: The number of seconds between writes (and reads) of the quotas in the
+#: store.
+QUOTA_INTERVAL = 1
+
+#: The number of seconds that a token with bad credentials is left out for.
+BAD_TOKEN_SECONDS = 3600
+
+
+def fingerprint(token):
+    """
+    An identifier of the token, which doesn't give the token away.
+
+    """
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()[:12]
+
+
+class Slots(object):
+    """
+    A counting semaphore of ``n`` slots, shared by the threads of this
+    process and, through lock files in ``directory`` (if given), by other
+    processes. Waiting for a slot polls, so that it works from any thread
+    (and IOLoop).
+
+    """
+    def __init__(self, n, directory=None):
+        self.n = n
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def try_acquire(self):
+        """
+        Take a free slot, returning it (or None if they are all taken).
+
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked process holds none of the slots of its parent.
+                self._held = set()
+                self._locks = {}
+                self._pid = os.getpid()
+            for slot in random.sample(range(self.n), self.n):
+                if slot in self._held:
+                    continue
+                if self.directory is not None:
+                    lock = self._locks.get(slot)
+                    if lock is None:
+                        lock = self._locks[slot] = fasteners.InterProcessLock(
+                            os.path.join(self.directory,
+                                         'slot-{}.lock'.format(slot)))
+                    if not lock.acquire(blocking=False):
+                        continue
+                self._held.add(slot)
+                return slot
+        return None
+
+    @tornado.gen.coroutine
+    def acquire(self):
+        delay = 0.005
+        while True:
+            slot = self.try_acquire()
+            if slot is not None:
+                return slot
+            yield tornado.gen.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def release(self, slot):
+        with self._lock:
+            self._held.discard(slot)
+            if self.directory is not None:
+                self._locks[slot].release()
+
+
+def authorization(headers):
+    """
+    The scheme ("token" or "bearer") and the token (or None) of the
+    Authorization of the request headers.
+
+    """
+    auth = headers.get('Authorization')
+    if not auth:
+        return 'token', None
+    scheme, token = auth.split(' ', 1)
+    return scheme, token
+
+
+class TokenPool(object):
+    """
+    The tokens that are shared between jobs, their quotas, and the slots of
+    the requests in flight.
+
+    Parameters
+    ----------
+    tokens : list of str
+        The service tokens.
+    max_requests : int
+        The most requests in flight at once.
+    slots_dir : str or None
+        The directory of the slots' lock files, to share the cap with other
+        processes (otherwise it is only shared by the threads of this one).
+    store : object or None
+        Where the quotas and the users' tokens are shared (with
+        ``update_quota``, ``quotas``, ``share_token``, ``unshare_token`` and
+        ``shared_tokens`` methods, see ``repohealth.cache_index.CacheIndex``).
+
+    """
+    def __init__(self, tokens=(), max_requests=MAX_REQUESTS, slots_dir=None,
+                 store=None):
+        self.slots = Slots(max_requests, slots_dir)
+        self.store = store
+        self.tokens = {}
+        self._lock = threading.Lock()
+        self._read = 0
+        for number, token in enumerate(tokens, 1):
+            self.add(token, 'service {}'.format(number))
+
+    def add(self, token, label=None, shared=True):
+        """
+        Add the token to the pool, shared with every job (or, if not
+        ``shared``, only tracking its quota).
+
+        """
+        with self._lock:
+            self._add(token, label, shared)
+
+    def _add(self, token, label, shared):
+        state = self.tokens.get(token)
+        if state is None:
+            state = self.tokens[token] = {
+                'fingerprint': fingerprint(token), 'label': label,
+                'shared': shared, 'stored': False, 'limit': None,
+                'remaining': None, 'reset': 0, 'updated': 0, 'written': 0,
+                'in_flight': 0}
+        elif shared:
+            state.update(label=label or state['label'], shared=True)
+        return state
+
+    def share(self, token, label):
+        """
+        Share the (user's) token with every job, including (through the
+        store) those of other processes.
+
+        """
+        with self._lock:
+            state = self._add(token, label, shared=True)
+            state['stored'] = self.store is not None
+        if self.store is not None:
+            self.store.share_token(token, label)
+
+    def unshare(self, token):
+        """
+        Stop sharing the (user's) token with every job.
+
+        """
+        with self._lock:
+            state = self.tokens.get(token)
+            if state is not None:
+                state.update(shared=False, stored=False)
+        if self.store is not None:
+            self.store.unshare_token(token)
+
+    def _spare(self, state, now):
+        if state['remaining'] is None or state['reset'] <= now:
+            remaining = state['limit'] or DEFAULT_LIMIT
+        else:
+            remaining = state['remaining']
+        return remaining - state['in_flight']
+
+    def _read_store(self, now):
+        # Catch up with the tokens that are shared, and the quotas that
+        # other processes have seen.
+        if self.store is None or now - self._read < QUOTA_INTERVAL:
+            return
+        self._read = now
+        shared = self.store.shared_tokens()
+        for token, label in shared.items():
+            self._add(token, label, shared=True)['stored'] = True
+        for token, state in self.tokens.items():
+            if state['stored'] and token not in shared:
+                # The user has opted out.
+                state.update(shared=False, stored=False)
+        quotas = {quota['fingerprint']: quota
+                  for quota in self.store.quotas()}
+        for state in self.tokens.values():
+            quota = quotas.get(state['fingerprint'])
+            if quota is not None and quota['updated'] > state['updated']:
+                state.update(limit=quota['quota_limit'],
+                             remaining=quota['remaining'],
+                             reset=quota['reset'], updated=quota['updated'],
+                             written=quota['updated'])
+
+    def choose(self, token=None):
+        """
+        Take the token (of the shared ones, and the given one) with the
+        most quota to spare, or None if there aren't any. The given token is
+        used if none of them have any quota left.
+
+        """
+        now = time.time()
+        with self._lock:
+            if token is not None:
+                self._add(token, None, shared=False)
+            self._read_store(now)
+            candidates = [candidate for candidate, state in self.tokens.items()
+                          if state['shared'] or candidate == token]
+            if not candidates:
+                return None
+            best = max(candidates, key=lambda candidate: (
+                self._spare(self.tokens[candidate], now), candidate == token))
+            if self._spare(self.tokens[best], now) <= 0 and token is not None:
+                best = token
+            self.tokens[best]['in_flight'] += 1
+            return best
+
+    @tornado.gen.coroutine
+    def acquire(self, headers):
+        """
+        Wait for a slot, and return it along with the token chosen for the
+        request and the headers to make it with (the Authorization of which
+        is that of the job's own token, if any).
+
+        """
+        slot = yield self.slots.acquire()
+        scheme, token = authorization(headers)
+        chosen = self.choose(token)
+        if chosen is not None:
+            headers = dict(headers)
+            headers['Authorization'] = '{} {}'.format(scheme, chosen)
+        return slot, chosen, headers
+
+    def release(self, slot, token, code=None, headers=None):
+        """
+        Free the slot, and record the quota of the token from the response
+        headers (or that the token is unusable, after a 401).
+
+        """
+        self.slots.release(slot)
+        if token is None:
+            return
+        now = time.time()
+        with self._lock:
+            state = self.tokens[token]
+            state['in_flight'] -= 1
+            if code == 401:
+                # Bad credentials (e.g. a revoked token).
+                state.update(limit=state['limit'] or DEFAULT_LIMIT,
+                             remaining=0, reset=now + BAD_TOKEN_SECONDS,
+                             updated=now)
+            elif headers is not None and 'X-RateLimit-Remaining' in headers:
+                remaining = int(headers['X-RateLimit-Remaining'])
+                reset = float(headers.get('X-RateLimit-Reset', 0))
+                if reset == state['reset'] and state['remaining'] is not None:
+                    # Responses can arrive out of order.
+                    remaining = min(remaining, state['remaining'])
+                state.update(limit=int(headers.get('X-RateLimit-Limit',
+                                                   DEFAULT_LIMIT)),
+                             remaining=remaining, reset=reset, updated=now)
+            else:
+                return
+            if self.store is None or now - state['written'] < QUOTA_INTERVAL:
+                return
+            state['written'] = now
+            quota = dict(state)
+        self.store.update_quota(quota['fingerprint'], label=quota['label'],
+                                quota_limit=quota['limit'],
+                                remaining=quota['remaining'],
+                                reset=quota['reset'], updated=quota['updated'])
+
+    def flush(self):
+        """
+        Write the latest quota of each token to the store.
+
+        """
+        if self.store is None:
+            return
+        with self._lock:
+            quotas = [dict(state) for state in self.tokens.values()
+                      if state['updated'] > state['written']]
+            for state in self.tokens.values():
+                state['written'] = max(state['written'], state['updated'])
+        for quota in quotas:
+            self.store.update_quota(quota['fingerprint'], label=quota['label'],
+                                    quota_limit=quota['limit'],
+                                    remaining=quota['remaining'],
+                                    reset=quota['reset'],
+                                    updated=quota['updated'])
@@ -0,0 +1,320 @@
+"""
+Lightweight counters and timings, exposed in the Prometheus text format.
+
+Each process (the web process and every executor worker) records into its
+own in-memory registry, which is flushed to a JSON file of its own in the
+metrics directory. The ``/metrics`` endpoint sums the files of all of the
+processes (folding those of processes that have exited into a single
+compacted file, so that recycled workers don't accumulate files)::
+
+    with metrics.timer('repohealth_stage_seconds', stage='issues_fetch'):
+        ...
+    metrics.increment('repohealth_github_requests_total', endpoint='issues')
+    metrics.flush(directory)
+
+"""
+from contextlib import contextmanager
+import glob
+import json
+import os
+import threading
+import time
+import uuid as uuid_lib
+
+import fasteners
+
+
+#: The upper bounds of the histogram buckets (in seconds).
+BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800)
+
+#: The upper bounds of the histogram buckets of memory metrics (in bytes).
+MEMORY_BUCKETS = (64e6, 128e6, 256e6, 512e6, 1e9, 2e9, 4e9, 8e9)
+
+#: The descriptions of the known metrics.
+HELP = {
+    'repohealth_stage_seconds':
+        'The time taken by each stage of producing a report.',
+    'repohealth_template_render_seconds':
+        'The time taken to render each template.',
+    'repohealth_github_requests_total':
+        'The number of GitHub API requests made, by endpoint and status.',
+    'repohealth_github_bytes_total':
+        'The number of bytes downloaded from the GitHub API.',
+    'repohealth_github_graphql_cost_total':
+        'The rate-limit points spent on GitHub GraphQL queries.',
+    'repohealth_cache_requests_total':
+        'The number of cache lookups, by cache file kind and hit/miss.',
+    'repohealth_job_peak_rss_bytes':
+        'The peak resident memory of the executor worker during each job.',
+    'repohealth_worker_recycles_total':
+        'The number of times the executor workers were recycled, by reason.',
+}
+
+
+class Registry(object):
+    """
+    The counters and histograms of a single process. Metrics may be
+    recorded from any thread (e.g. the executor's callbacks).
+
+    """
+    def __init__(self):
+        self.pid = os.getpid()
+        # A unique name, so that a recycled pid doesn't clobber the flushed
+        # metrics of a previous process.
+        self.name = '{}-{}'.format(self.pid, uuid_lib.uuid4().hex[:8])
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._observe(key, value, buckets)
+
+    def _observe(self, key, value, buckets):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = {
+                'bounds': list(buckets), 'buckets': [0] * len(buckets),
+                'sum': 0, 'count': 0}
+        for i, bound in enumerate(histogram['bounds']):
+            if value <= bound:
+                histogram['buckets'][i] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+    def total(self, name):
+        """The sum of the named counter over all of its labels."""
+        with self._lock:
+            return sum(value for (counter, _), value in self.counters.items()
+                       if counter == name)
+
+    def to_json(self):
+        # A copy, taken under the lock, so that it can be serialised safely.
+        with self._lock:
+            return {'counters': [[name, dict(labels), value]
+                                 for (name, labels), value
+                                 in self.counters.items()],
+                    'histograms': [[name, dict(labels),
+                                    dict(histogram,
+                                         buckets=list(histogram['buckets']))]
+                                   for (name, labels), histogram
+                                   in self.histograms.items()]}
+
+
+_REGISTRY = None
+
+
+def registry():
+    """
+    The registry of this process (a forked process gets a fresh one).
+
+    """
+    global _REGISTRY
+    if _REGISTRY is None or _REGISTRY.pid != os.getpid():
+        _REGISTRY = Registry()
+    return _REGISTRY
+
+
+def increment(name, value=1, **labels):
+    registry().increment(name, value, **labels)
+
+
+def observe(name, value, buckets=BUCKETS, **labels):
+    registry().observe(name, value, buckets, **labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    """
+    Observe the time taken by the body of the with statement.
+
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+class StageTimer(object):
+    """
+    Time the stages of a job, and record them once the job's labels (such
+    as its size class) are known.
+
+    """
+    def __init__(self, name='repohealth_stage_seconds'):
+        self.name = name
+        self.timings = []
+
+    @contextmanager
+    def stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.append((stage, time.perf_counter() - start))
+
+    def record(self, **labels):
+        for stage, seconds in self.timings:
+            observe(self.name, seconds, stage=stage, **labels)
+        self.timings = []
+
+
+def size_class(n_commits):
+    """
+    Bucket a repo by its number of commits.
+
+    """
+    for bound, label in [(1000, 'small'), (10000, 'medium'),
+                         (100000, 'large')]:
+        if n_commits < bound:
+            return label
+    return 'huge'
+
+
+def flush(directory):
+    """
+    Write this process's metrics to the metrics directory.
+
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    reg = registry()
+    fname = os.path.join(directory, '{}.json'.format(reg.name))
+    tmp_fname = fname + '.tmp'
+    with open(tmp_fname, 'w') as fh:
+        json.dump(reg.to_json(), fh)
+    os.replace(tmp_fname, fname)
+
+
+#: The name of the file holding the metrics of processes that have exited.
+COMPACTED = 'compacted'
+
+
+def _read(fname):
+    try:
+        with open(fname, 'r') as fh:
+            return json.load(fh)
+    except (IOError, ValueError):
+        return None
+
+
+def _merge(total, content):
+    for name, labels, value in content['counters']:
+        total.increment(name, value, **labels)
+    for name, labels, histogram in content['histograms']:
+        key = (name, tuple(sorted(labels.items())))
+        bounds = histogram.get('bounds', list(BUCKETS))
+        existing = total.histograms.setdefault(
+            key, {'bounds': bounds, 'buckets': [0] * len(bounds),
+                  'sum': 0, 'count': 0})
+        if existing['bounds'] != bounds:
+            # The buckets changed between versions, so can't be summed.
+            continue
+        existing['buckets'] = [a + b for a, b in zip(existing['buckets'],
+                                                     histogram['buckets'])]
+        existing['sum'] += histogram['sum']
+        existing['count'] += histogram['count']
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def compact(directory):
+    """
+    Fold the metrics of the processes that have exited into the compacted
+    file, and remove their files.
+
+    """
+    with fasteners.InterProcessLock(os.path.join(directory, 'compact.lock')):
+        dead = []
+        for fname in glob.glob(os.path.join(directory, '*.json')):
+            name = os.path.basename(fname)[:-len('.json')]
+            pid = name.split('-')[0]
+            if name != COMPACTED and pid.isdigit() and not _alive(int(pid)):
+                dead.append(fname)
+        if not dead:
+            return
+
+        compacted = os.path.join(directory, COMPACTED + '.json')
+        total = Registry()
+        for fname in [compacted] + dead:
+            content = _read(fname)
+            if content is not None:
+                _merge(total, content)
+        tmp_fname = compacted + '.tmp'
+        with open(tmp_fname, 'w') as fh:
+            json.dump(total.to_json(), fh)
+        os.replace(tmp_fname, compacted)
+        for fname in dead:
+            os.remove(fname)
+
+
+def collect(directory):
+    """
+    Sum the flushed metrics of all processes into a single registry.
+
+    """
+    total = Registry()
+    if not os.path.exists(directory):
+        return total
+    compact(directory)
+    for fname in glob.glob(os.path.join(directory, '*.json')):
+        content = _read(fname)
+        if content is not None:
+            _merge(total, content)
+    return total
+
+
+def _labels(labels, **extra):
+    labels = list(labels) + sorted(extra.items())
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(
+        key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in labels) + '}'
+
+
+def prometheus_text(reg):
+    """
+    Render the registry in the Prometheus text exposition format.
+
+    """
+    lines = []
+    seen = set()
+
+    def header(name, kind):
+        if name not in seen:
+            seen.add(name)
+            if name in HELP:
+                lines.append('# HELP {} {}'.format(name, HELP[name]))
+            lines.append('# TYPE {} {}'.format(name, kind))
+
+    for (name, labels), value in sorted(reg.counters.items()):
+        header(name, 'counter')
+        lines.append('{}{} {}'.format(name, _labels(labels), value))
+    for (name, labels), histogram in sorted(reg.histograms.items()):
+        header(name, 'histogram')
+        for bound, count in zip(histogram['bounds'], histogram['buckets']):
+            lines.append('{}_bucket{} {}'.format(
+                name, _labels(labels, le=bound), count))
+        lines.append('{}_bucket{} {}'.format(
+            name, _labels(labels, le='+Inf'), histogram['count']))
+        lines.append('{}_sum{} {}'.format(name, _labels(labels),
+                                          histogram['sum']))
+        lines.append('{}_count{} {}'.format(name, _labels(labels),
+                                            histogram['count']))
+    return '\n'.join(lines) + '\n'
@@ -41,6 +41,8 @@ def notebook(uuid, payload, visualisations):
         ['from plotly.offline import iplot, init_notebook_mode\n',
          'init_notebook_mode()']))
     for visualisation in visualisations.values():
+        if visualisation.get('pending'):
+            continue
         nb.cells.append(nbf.new_markdown_cell(visualisation['title']))
         nb.cells.append(nbf.new_code_cell(visualisation['code']))
 
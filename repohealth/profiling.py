@@ -0,0 +1,161 @@
+"""
+Opt-in profiling of slow jobs.
+
+A job (e.g. ``prepare_repo_data`` or ``visualisations`` of a repo) is
+profiled either when explicitly requested, or on its next run once a run
+has exceeded ``PROFILE_THRESHOLD`` seconds. A profiled run produces a
+cProfile (pstats) dump, a tracemalloc snapshot taken close to the peak of
+traced memory, and a small JSON record describing the run.
+
+"""
+from contextlib import contextmanager
+import cProfile
+import datetime
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+
+#: Jobs that take longer than this many seconds are profiled on their next
+#: run (0 disables automatic profiling).
+PROFILE_THRESHOLD = float(os.environ.get('REPOHEALTH_PROFILE_THRESHOLD', 0))
+
+
+def _basename(uuid, kind):
+    return '{}.{}'.format(uuid.replace('/', '__'), kind)
+
+
+def mark(directory, uuid, kind):
+    """
+    Mark the job so that its next run is profiled.
+
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(os.path.join(directory, _basename(uuid, kind) + '.mark'), 'w'):
+        pass
+
+
+def _pop_mark(directory, uuid, kind):
+    fname = os.path.join(directory, _basename(uuid, kind) + '.mark')
+    try:
+        os.remove(fname)
+    except OSError:
+        return False
+    return True
+
+
+class PeakSnapshotter(object):
+    """
+    Periodically take a tracemalloc snapshot whenever the traced memory
+    grows (by more than 10%) beyond that of the last snapshot, so that the
+    final snapshot is representative of the peak.
+
+    """
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.snapshot = None
+        self.snapshot_bytes = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _check(self):
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self.snapshot_bytes * 1.1:
+            self.snapshot = tracemalloc.take_snapshot()
+            self.snapshot_bytes = current
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._check()
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._check()
+
+
+@contextmanager
+def profiled(directory, uuid, kind):
+    """
+    Profile the body of the with statement, writing the results to the
+    given directory.
+
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    now = datetime.datetime.utcnow()
+    name = '{}.{}'.format(_basename(uuid, kind), now.strftime('%Y%m%dT%H%M%S'))
+
+    tracemalloc.start()
+    snapshotter = PeakSnapshotter()
+    snapshotter.start()
+    profile = cProfile.Profile()
+    start = time.perf_counter()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        duration = time.perf_counter() - start
+        snapshotter.stop()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        fname = os.path.join(directory, name)
+        profile.dump_stats(fname + '.pstats')
+        snapshotter.snapshot.dump(fname + '.tracemalloc')
+        record = {'name': name, 'uuid': uuid, 'kind': kind,
+                  'created': now.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                  'seconds': duration, 'peak_bytes': peak,
+                  'snapshot_bytes': snapshotter.snapshot_bytes,
+                  'files': [name + '.pstats', name + '.tracemalloc']}
+        with open(fname + '.json', 'w') as fh:
+            json.dump(record, fh)
+        logging.info('Profiled {} of {} in {:.1f}s (written to {})'
+                     ''.format(kind, uuid, duration, fname))
+
+
+@contextmanager
+def job(directory, uuid, kind, profile=False, threshold=None):
+    """
+    Run a job, profiling it if requested (or if it was marked for profiling
+    by a previous slow run), and marking it for profiling if it is slower
+    than the threshold.
+
+    """
+    if threshold is None:
+        threshold = PROFILE_THRESHOLD
+    if _pop_mark(directory, uuid, kind):
+        profile = True
+
+    if profile:
+        with profiled(directory, uuid, kind):
+            yield
+    else:
+        start = time.perf_counter()
+        yield
+        duration = time.perf_counter() - start
+        if threshold and duration > threshold:
+            logging.warning('{} of {} took {:.1f}s, it will be profiled on '
+                            'its next run.'.format(kind, uuid, duration))
+            mark(directory, uuid, kind)
+
+
+def profiles(directory):
+    """
+    The records of all of the profiles in the directory, newest first.
+
+    """
+    records = []
+    for fname in glob.glob(os.path.join(directory, '*.json')):
+        with open(fname, 'r') as fh:
+            records.append(json.load(fh))
+    return sorted(records, key=lambda record: record['created'], reverse=True)
@@ -0,0 +1,76 @@
+"""
+Compact monthly rollups of a repository's health metrics.
+
+A rollup is a few KB of monthly series computed once from the full
+payload, and is all that is needed to compare repositories side-by-side.
+
+"""
+import numpy as np
+
+from repohealth.analysis.contributor_activity import payload_activity
+from repohealth.analysis.issue_lifecycle import payload_lifecycle
+
+
+#: Increment this to invalidate previously computed rollups.
+ROLLUP_VERSION = 1
+
+#: The series held in a rollup, in the order they are presented.
+SERIES = (
+    ('commits', 'Commits per month'),
+    ('active_contributors', 'Monthly active contributors'),
+    ('bus_factor', 'Bus factor (12 months)'),
+    ('stargazers', 'Stargazers'),
+    ('open_issues', 'Open issues'),
+)
+
+
+def _series(months, values):
+    if len(months) == 0:
+        return {'start': None, 'values': []}
+    return {'start': str(months[0].astype('datetime64[M]')),
+            'values': [int(value) for value in values]}
+
+
+def _stargazer_months(payload):
+    starred = np.array([star['starred_at'][:7]
+                        for star in payload['github']['stargazers']],
+                       dtype='datetime64[M]')
+    if len(starred) == 0:
+        return starred, np.array([], dtype=np.int64)
+    starred.sort()
+    month_idx = (starred - starred[0]).astype(np.int64)
+    months = starred[0] + np.arange(month_idx[-1] + 1)
+    return months, np.cumsum(np.bincount(month_idx))
+
+
+def rollup(uuid, payload):
+    """
+    Compute the rollup for the given repository payload.
+
+    """
+    activity = payload_activity(payload)
+    monthly_issues = payload_lifecycle(payload)['monthly']
+    issue_months = monthly_issues.index.values.astype('datetime64[M]')
+
+    series = {
+        'commits': _series(activity['month'], activity['monthly_commits']),
+        'active_contributors': _series(activity['month'], activity['active']),
+        'bus_factor': _series(activity['month'], activity['bus_factor']),
+        'stargazers': _series(*_stargazer_months(payload)),
+        'open_issues': _series(issue_months, monthly_issues['backlog']),
+    }
+    return {'version': ROLLUP_VERSION,
+            'uuid': uuid,
+            'name': payload['github']['repo']['full_name'],
+            'series': series}
+
+
+def series_dates(series):
+    """
+    Return the month of each value in a rollup series, as ISO date strings.
+
+    """
+    if not series['values']:
+        return []
+    months = np.datetime64(series['start'], 'M') + np.arange(len(series['values']))
+    return [str(month) + '-01' for month in months]
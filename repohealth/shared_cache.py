@@ -0,0 +1,100 @@
+"""
+An optional second-level cache in an S3-compatible object store, which is
+shared between instances of the service (e.g. Heroku dynos) and survives
+their restarts.
+
+The local cache (``CACHE_ROOT``) stays in front of it: the files of a
+finished payload (and its rollup) are written through to the store, and a
+repo that isn't in the local cache is read through from the store, when it
+has a fresh copy, rather than being ingested again (see
+``repohealth.generate.share_payload`` and ``fetch_shared``)::
+
+    REPOHEALTH_S3_BUCKET=repohealth python -m repohealth.webapp
+
+boto3 is only needed (and imported) when the shared cache is enabled. Any
+S3-compatible store (e.g. MinIO, with ``REPOHEALTH_S3_ENDPOINT_URL``) will
+do, and the credentials are found by boto3 in the usual way (e.g.
+``AWS_ACCESS_KEY_ID`` and ``AWS_SECRET_ACCESS_KEY``).
+
+"""
+import os
+
+
+#: The bucket of the shared cache (which is disabled if this is empty).
+BUCKET = os.environ.get('REPOHEALTH_S3_BUCKET', '')
+
+#: The prefix of the shared cache's keys in the bucket.
+PREFIX = os.environ.get('REPOHEALTH_S3_PREFIX', 'repohealth/')
+
+#: The endpoint of an S3-compatible store other than AWS S3 (e.g. MinIO).
+ENDPOINT_URL = os.environ.get('REPOHEALTH_S3_ENDPOINT_URL') or None
+
+
+def _missing(err):
+    # boto3 (and the fake) raise a ClientError with a response like
+    # {'Error': {'Code': 'NoSuchKey'}} for a missing key.
+    code = getattr(err, 'response', {}).get('Error', {}).get('Code')
+    return code in ('NoSuchKey', '404')
+
+
+class S3Store(object):
+    """
+    The objects of the shared cache, under the given prefix of the bucket.
+
+    The client is a boto3 S3 client (by default, made on first use for the
+    given endpoint), or anything with the same ``get_object`` and
+    ``put_object`` methods (e.g. ``repohealth.benchmarks.fake_s3.FakeS3``).
+
+    """
+    def __init__(self, bucket, prefix='', endpoint_url=None, client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.pid = os.getpid()
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3', endpoint_url=self.endpoint_url)
+        return self._client
+
+    def get(self, key):
+        """
+        The content (bytes) of the object, or None if there isn't one.
+
+        """
+        try:
+            response = self.client.get_object(Bucket=self.bucket,
+                                              Key=self.prefix + key)
+        except Exception as err:
+            if _missing(err):
+                return None
+            raise
+        return response['Body'].read()
+
+    def put(self, key, content):
+        """
+        Write the object, from bytes or a file object.
+
+        """
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key,
+                               Body=content)
+
+
+_STORE = None
+
+
+def store():
+    """
+    The store of the shared cache, or None if it isn't enabled (see
+    ``BUCKET``). A forked process gets a store (and client) of its own.
+
+    """
+    global _STORE
+    if not BUCKET:
+        return None
+    if _STORE is None or _STORE.pid != os.getpid():
+        _STORE = S3Store(BUCKET, PREFIX, ENDPOINT_URL)
+    return _STORE
@@ -0,0 +1,90 @@
+import numpy as np
+
+import repohealth.analysis.contributor_activity
+from repohealth.analysis.contributor_activity import (
+    contributor_activity, active_contributors_prep, bus_factor_prep,
+    shared_activity)
+
+
+def dates(*values):
+    return np.array(values, dtype='datetime64[ns]')
+
+
+def test_monthly_counts():
+    activity = contributor_activity(
+        dates('2018-01-05', '2018-01-20', '2018-03-01', '2018-03-02'),
+        ['a', 'b', 'a', 'c'])
+    assert list(activity['month'].astype(str)) == ['2018-01', '2018-02',
+                                                    '2018-03']
+    assert list(activity['active']) == [2, 0, 2]
+    assert list(activity['new']) == [2, 0, 1]
+
+
+def test_first_and_last_seen_unsorted():
+    activity = contributor_activity(
+        dates('2018-03-01', '2018-01-05', '2018-02-01', '2018-01-20'),
+        ['a', 'a', 'b', 'a'])
+    by_author = dict(zip(activity['author'],
+                         zip(activity['first_seen'].astype(str),
+                             activity['last_seen'].astype(str),
+                             activity['commits'])))
+    assert by_author['a'] == ('2018-01-05T00:00:00.000000000',
+                              '2018-03-01T00:00:00.000000000', 3)
+    assert by_author['b'] == ('2018-02-01T00:00:00.000000000',
+                              '2018-02-01T00:00:00.000000000', 1)
+
+
+def test_bus_factor():
+    # One dominant author in the first month, then three equal authors.
+    activity = contributor_activity(
+        dates(*(['2018-01-01'] * 4 + ['2018-01-02'] +
+                ['2018-02-01', '2018-02-02', '2018-02-03'])),
+        ['a'] * 4 + ['b'] + ['c', 'd', 'e'],
+        window=1)
+    assert list(activity['bus_factor']) == [1, 2]
+
+    activity = contributor_activity(
+        dates(*(['2018-01-01'] * 4 + ['2018-01-02'] +
+                ['2018-02-01', '2018-02-02', '2018-02-03'])),
+        ['a'] * 4 + ['b'] + ['c', 'd', 'e'],
+        window=2)
+    # 8 commits in the window: a has 4, which is exactly half.
+    assert list(activity['bus_factor']) == [1, 1]
+
+
+def test_bus_factor_empty_month():
+    activity = contributor_activity(dates('2018-01-01', '2018-03-01'),
+                                    ['a', 'b'], window=1)
+    assert list(activity['bus_factor']) == [1, 0, 1]
+
+
+def test_empty():
+    activity = contributor_activity(dates(), [])
+    assert len(activity['month']) == 0
+    assert len(activity['bus_factor']) == 0
+
+
+def test_payload_prep():
+    payload = {'commits': [
+        {'date': '2018-01-31 23:30:00-05:00', 'email': 'a@example.com'},
+        {'date': '2018-02-01 10:00:00+00:00', 'email': 'b@example.com'}]}
+    monthly = active_contributors_prep(payload)
+    # The first commit is in February once converted to UTC.
+    assert list(monthly['active']) == [2]
+    assert list(bus_factor_prep(payload)) == [1]
+
+
+def test_shared_activity(monkeypatch):
+    calls = []
+    compute = repohealth.analysis.contributor_activity._payload_activity
+    monkeypatch.setattr(repohealth.analysis.contributor_activity,
+                        '_payload_activity',
+                        lambda payload: calls.append(1) or compute(payload))
+    payload = {'commits': [
+        {'date': '2018-02-01 10:00:00+00:00', 'email': 'a@example.com'}]}
+    with shared_activity(payload):
+        active_contributors_prep(payload)
+        bus_factor_prep(payload)
+    assert len(calls) == 1
+    bus_factor_prep(payload)
+    assert len(calls) == 2
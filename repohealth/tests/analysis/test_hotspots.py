@@ -0,0 +1,17 @@
+from repohealth.analysis.hotspots import hotspots_prep, hotspots_viz
+
+
+def test_hotspots_order():
+    payload = {'hotspots': [{'path': 'a', 'commits': 5, 'insertions': 10,
+                             'deletions': 0},
+                            {'path': 'b', 'commits': 1, 'insertions': 1,
+                             'deletions': 1}]}
+    hotspots = hotspots_prep(payload)
+    # The hottest path is plotted at the top.
+    assert list(hotspots['path']) == ['b', 'a']
+
+
+def test_hotspots_without_churn():
+    hotspots = hotspots_prep({'commits': []})
+    assert hotspots.empty
+    assert len(hotspots_viz(hotspots).data) == 1
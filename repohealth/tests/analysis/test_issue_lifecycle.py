@@ -0,0 +1,51 @@
+import numpy as np
+
+from repohealth.analysis.issue_lifecycle import (
+    issue_lifecycle, open_backlog_prep, time_to_close_prep)
+
+
+def dates(*values):
+    return np.array(values, dtype='datetime64[ns]')
+
+
+def test_backlog_events():
+    lifecycle = issue_lifecycle(
+        dates('2018-01-01', '2018-01-02', '2018-01-03'),
+        dates('2018-01-04', 'NaT', '2018-01-03'))
+    assert list(lifecycle['event_time'].astype('datetime64[D]').astype(str)) == [
+        '2018-01-01', '2018-01-02', '2018-01-03', '2018-01-03', '2018-01-04']
+    # An issue opened and closed at the same moment is never in the backlog.
+    assert list(lifecycle['backlog']) == [1, 2, 2, 2, 1]
+
+
+def test_monthly():
+    lifecycle = issue_lifecycle(
+        dates('2018-01-01', '2018-01-11', '2018-01-21', '2018-03-01'),
+        dates('2018-01-02', '2018-03-11', 'NaT', '2018-03-02'))
+    monthly = lifecycle['monthly']
+    assert list(monthly.index.strftime('%Y-%m')) == ['2018-01', '2018-02',
+                                                     '2018-03']
+    assert list(monthly['opened']) == [3, 0, 1]
+    assert list(monthly['closed']) == [1, 0, 2]
+    assert list(monthly['backlog']) == [2, 2, 1]
+    assert monthly['close_p50'].iloc[0] == 1
+    assert np.isnan(monthly['close_p50'].iloc[1])
+    # Closed after 1 day and 59 days.
+    assert monthly['close_p50'].iloc[2] == 30
+    assert list(monthly.columns) == ['opened', 'closed', 'backlog',
+                                     'close_p50', 'close_p90']
+
+
+def test_no_issues():
+    lifecycle = issue_lifecycle(dates(), dates())
+    assert len(lifecycle['backlog']) == 0
+    assert len(lifecycle['monthly']) == 0
+
+
+def test_payload_prep():
+    issues = [{'created_at': '2018-01-01T00:00:00Z',
+               'closed_at': '2018-01-03T00:00:00Z'},
+              {'created_at': '2018-01-02T00:00:00Z', 'closed_at': None}]
+    payload = {'github': {'issues': issues}}
+    assert list(open_backlog_prep(payload)) == [1, 2, 1]
+    assert list(time_to_close_prep(payload)['close_p50']) == [2]
@@ -0,0 +1,16 @@
+from repohealth.benchmarks.compare import compare
+
+
+def results(seconds):
+    return {'results': [{'name': 'git.commits', 'scale': 10,
+                         'seconds': seconds, 'peak_bytes': 100},
+                        {'name': 'only.here', 'scale': 10, 'seconds': 1}]}
+
+
+def test_compare():
+    rows, regressions = compare(results(1.0), results(1.1))
+    assert len(rows) == 3
+    assert regressions == []
+
+    rows, regressions = compare(results(1.0), results(2.0))
+    assert regressions == [('git.commits', 10, 'seconds', 1.0, 2.0, 2.0)]
@@ -0,0 +1,173 @@
+import json
+import urllib.error
+import urllib.request
+
+from github import Github
+import pytest
+import tornado.ioloop
+
+from repohealth.benchmarks.fake_github import FakeGitHub, STAR_MEDIA_TYPE
+from repohealth.benchmarks.synthetic import synthetic_github
+import repohealth.github.graphql
+import repohealth.github.pagination
+from repohealth.github.issues import repo_issues
+from repohealth.github.pagination import parse_link
+from repohealth.github.stargazers import repo_stargazers
+
+
+@pytest.fixture
+def fake():
+    fake = FakeGitHub(rate_limit=10)
+    fake.add_repo('org/repo', synthetic_github('org/repo', n_issues=250,
+                                               n_stargazers=30))
+    fake.start_in_thread()
+    yield fake
+    fake.stop()
+
+
+def get(url, token='a-token', accept=None):
+    request = urllib.request.Request(url)
+    request.add_header('Authorization', 'token {}'.format(token))
+    if accept:
+        request.add_header('Accept', accept)
+    with urllib.request.urlopen(request) as response:
+        return (json.loads(response.read().decode('utf-8')),
+                response.headers)
+
+
+def test_issues_pagination(fake):
+    url = fake.base_url + '/repos/org/repo/issues?per_page=100&state=all'
+    issues, headers = get(url)
+    assert len(issues) == 100
+    assert issues[0]['number'] == 250
+    next_url, last_url = parse_link(headers['Link'])
+    assert last_url.endswith('page=3&per_page=100&state=all')
+
+    issues, headers = get(next_url)
+    assert issues[0]['number'] == 150
+    assert parse_link(headers['Link'])[1] == last_url
+    assert headers['X-RateLimit-Remaining'] == '8'
+
+    issues, headers = get(last_url)
+    assert len(issues) == 50
+    assert parse_link(headers['Link']) == (None, None)
+
+
+def test_stargazers_media_type(fake):
+    url = fake.base_url + '/repos/org/repo/stargazers'
+    assert 'starred_at' not in get(url)[0][0]
+    stars = get(url, accept=STAR_MEDIA_TYPE)[0]
+    assert len(stars) == 30
+    assert set(stars[0]) == {'starred_at', 'user'}
+
+
+def test_pygithub(fake):
+    repo = Github('a-token', base_url=fake.base_url).get_repo('org/repo')
+    assert repo.stargazers_count == 30
+    assert repo.stargazers_url.startswith(fake.base_url)
+
+
+def test_faults(fake):
+    url = fake.base_url + '/repos/org/repo'
+    fake.error_rate = 1
+    with pytest.raises(urllib.error.HTTPError) as err:
+        get(url)
+    assert err.value.code == 502
+
+    fake.error_rate = 0
+    for _ in range(9):
+        get(url)
+    with pytest.raises(urllib.error.HTTPError) as err:
+        get(url)
+    assert err.value.code == 403
+    assert err.value.headers['X-RateLimit-Remaining'] == '0'
+    # Quota is per token.
+    get(url, token='another-token')
+    assert fake.stats['403-rate-limit'] == 1
+
+
+def fetch(fetcher, repo):
+    loop = tornado.ioloop.IOLoop()
+    try:
+        return loop.run_sync(lambda: fetcher(repo, 'a-token'))
+    finally:
+        loop.close()
+
+
+def test_fetchers(fake):
+    fake.rate_limit = 20
+    fake.add_repo('org/stars', synthetic_github('org/stars', n_issues=0,
+                                                n_stargazers=250))
+    gh = Github('a-token', base_url=fake.base_url)
+
+    issues = fetch(repo_issues, gh.get_repo('org/repo'))
+    # All of the pages, in order.
+    assert [issue['number'] for issue in issues] == list(range(250, 0, -1))
+
+    stargazers = fetch(repo_stargazers, gh.get_repo('org/stars'))
+    assert len(stargazers) == 250
+    assert set(stargazers[0]) == {'starred_at', 'user/login', 'user/id'}
+    assert fake.stats['stargazers'] == 3
+
+
+def test_fetch_projection(fake):
+    github = synthetic_github('org/repo', n_issues=250, n_stargazers=30)
+    repo = Github('a-token', base_url=fake.base_url).get_repo('org/repo')
+    # The issues are projected back to those of the payload.
+    assert fetch(repo_issues, repo) == github['issues'][::-1]
+    issues = fetch(lambda repo, token: repo_issues(repo, token, project=None),
+                   repo)
+    assert 'body' in issues[0]
+
+
+def test_fetch_issues_since(fake):
+    github = synthetic_github('org/repo', n_issues=250, n_stargazers=30)
+    since = github['issues'][200]['created_at']
+    repo = Github('a-token', base_url=fake.base_url).get_repo('org/repo')
+    issues = fetch(lambda repo, token: repo_issues(repo, token, since=since),
+                   repo)
+    assert issues
+    assert ({issue['number'] for issue in issues} ==
+            {issue['number'] for issue in github['issues']
+             if (issue['closed_at'] or issue['created_at']) >= since})
+
+
+def test_fetch_retries(fake, monkeypatch):
+    monkeypatch.setattr(repohealth.github.pagination, 'RETRY_DELAY', 0)
+    fake.rate_limit = 100
+    repo = Github('a-token', base_url=fake.base_url).get_repo('org/repo')
+    fake.error_rate = 0.5
+    issues = fetch(repo_issues, repo)
+    assert len(issues) == 250
+    assert fake.stats['502'] > 0
+
+
+def test_graphql_fetchers(fake):
+    fake.rate_limit = 100
+    fake.add_repo('org/stars', synthetic_github('org/stars', n_issues=0,
+                                                n_stargazers=250))
+    gh = Github('a-token', base_url=fake.base_url)
+    repo = gh.get_repo('org/repo')
+    # The same records as the REST fetchers.
+    assert (fetch(repohealth.github.graphql.repo_issues, repo) ==
+            fetch(repo_issues, repo))
+    stars = gh.get_repo('org/stars')
+    fake.reset_stats()
+    assert (fetch(repohealth.github.graphql.repo_stargazers, stars) ==
+            fetch(repo_stargazers, stars))
+    assert fake.stats['graphql'] == 3
+    assert fake.graphql_used['a-token'] == 3
+
+
+def test_graphql_since(fake):
+    fake.rate_limit = 100
+    github = synthetic_github('org/repo', n_issues=250, n_stargazers=30)
+    since = github['issues'][200]['created_at']
+    repo = Github('a-token', base_url=fake.base_url).get_repo('org/repo')
+    fake.reset_stats()
+    issues = fetch(lambda repo, token: repohealth.github.graphql.repo_issues(
+        repo, token, since=since), repo)
+    assert issues == fetch(
+        lambda repo, token: repo_issues(repo, token, since=since), repo)
+    # The pull requests stop at the first page that predates "since".
+    assert fake.stats['graphql'] == 1
@@ -0,0 +1,23 @@
+import pytest
+
+from repohealth.benchmarks.loadtest import parse_mix, summarise
+
+
+def test_parse_mix():
+    assert parse_mix('request=4,report') == [('request', 4), ('report', 1)]
+    with pytest.raises(ValueError):
+        parse_mix('request=4,status=1')
+
+
+def test_summarise():
+    samples = {'data': [(0.01 * i, 200) for i in range(1, 101)],
+               'report': [(1, 200), (2, 500)]}
+    data, report = summarise(samples, elapsed=10, concurrency=5)
+    assert data['name'] == 'loadtest.data'
+    assert data['scale'] == 5
+    assert data['requests_per_second'] == 10
+    assert data['errors'] == 0
+    assert data['p50_seconds'] == pytest.approx(0.505)
+    assert data['p99_seconds'] == pytest.approx(0.9901)
+    assert report['errors'] == 1
+    assert report['codes'] == {'200': 1, '500': 1}
@@ -0,0 +1,36 @@
+import git
+
+from repohealth.benchmarks.synthetic import (
+    RepoShape, fast_import_stream, synthetic_github, synthetic_repo)
+
+
+def test_deterministic():
+    shape = RepoShape(50, seed=3)
+    assert list(fast_import_stream(shape)) == list(fast_import_stream(shape))
+    assert (list(fast_import_stream(shape)) !=
+            list(fast_import_stream(RepoShape(50, seed=4))))
+
+
+def test_synthetic_repo(tmpdir):
+    shape = RepoShape(100, n_authors=5, n_branches=2, merge_every=10)
+    repo = git.Repo(synthetic_repo(shape, str(tmpdir.join('repo'))))
+
+    log = repo.git.log('--all', '--no-merges', '--format=%x00%ae',
+                       '--numstat').split('\x00')[1:]
+    log = [entry.split() for entry in log]
+    merges = repo.git.log('--all', '--merges', '--format=%h').split()
+    assert len(log) + len(merges) == 100
+    assert len(merges) > 0
+    assert {entry[0] for entry in log} <= {
+        'author{}@example.com'.format(i) for i in range(5)}
+    # Each changed file is an "insertions deletions path" triple.
+    assert all(1 <= (len(entry) - 1) // 3 <= shape.max_files
+               for entry in log)
+
+
+def test_synthetic_github():
+    github = synthetic_github('org/repo', n_issues=20, n_stargazers=7)
+    assert github['repo']['full_name'] == 'org/repo'
+    assert len(github['issues']) == 20
+    assert len(github['stargazers']) == 7
+    assert synthetic_github('org/repo', 20, 7) == github
@@ -0,0 +1,63 @@
+import multiprocessing
+
+import pytest
+
+from repohealth.cache_index import CacheIndex
+
+
+@pytest.fixture
+def index(tmpdir):
+    return CacheIndex(str(tmpdir.join('cache', 'index.sqlite')))
+
+
+def test_entries(index):
+    assert index.entry('org/repo') is None
+    index.update('org/repo', state='ready', updated=10.0,
+                 summary={'uuid': 'org/repo'})
+    index.update('org/failed', state='failed', failure={'status': 502})
+    entry = index.entry('org/repo')
+    assert (entry['state'], entry['updated']) == ('ready', 10.0)
+    assert entry['failure'] is None
+    assert index.entry('org/failed')['failure'] == {'status': 502}
+    assert index.summaries() == {'org/repo': {'uuid': 'org/repo'}}
+
+    index.remove('org/repo')
+    assert index.entry('org/repo') is None
+    with pytest.raises(ValueError):
+        index.update('org/repo', size=10)
+
+
+def test_status(index):
+    assert index.status('org/repo') is None
+    index.update_status('org/repo', lambda status: (status or []) + ['a'])
+    index.update_status('org/repo', lambda status: (status or []) + ['b'])
+    assert index.status('org/repo') == ['a', 'b']
+
+    def fail(status):
+        raise RuntimeError()
+    with pytest.raises(RuntimeError):
+        index.update_status('org/repo', fail)
+    assert index.status('org/repo') == ['a', 'b']
+
+
+def test_populate(tmpdir):
+    path = str(tmpdir.join('index.sqlite'))
+    populate = lambda: [('org/repo', {'state': 'partial'})]
+    assert CacheIndex(path, populate).entry('org/repo')['state'] == 'partial'
+    # An existing index isn't populated again.
+    assert CacheIndex(path, lambda: []).entry('org/repo') is not None
+
+
+def _update(index):
+    index.update('org/child', state='ready')
+
+
+def test_fork(index):
+    # The child doesn't use the parent's connection.
+    index.update('org/parent', state='ready')
+    process = multiprocessing.get_context('fork').Process(target=_update,
+                                                          args=(index,))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert index.entry('org/child')['state'] == 'ready'
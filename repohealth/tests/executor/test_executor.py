@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from repohealth.executor import RecyclingExecutor
+
+
+def allocate_in_subprocess(n_bytes):
+    code = 'bytearray({})'.format(n_bytes)
+    return subprocess.call([sys.executable, '-c', code])
+
+
+def allocate(n_bytes):
+    data = bytearray(n_bytes)
+    data[::4096] = b'x' * len(data[::4096])
+    return os.getpid()
+
+
+@pytest.fixture
+def executor():
+    executor = RecyclingExecutor(max_workers=1, max_jobs=2,
+                                 memory_limit=200 * 1024 ** 2)
+    yield executor
+    executor.shutdown()
+
+
+def test_recycle_after_max_jobs(executor):
+    pids = [executor.submit(os.getpid).result() for _ in range(5)]
+    assert pids[0] == pids[1] != pids[2] == pids[3] != pids[4]
+    assert executor.generation == 3
+
+
+def test_prewarm_is_not_counted(executor):
+    executor.prewarm()
+    pids = [executor.submit(os.getpid).result() for _ in range(3)]
+    assert pids[0] == pids[1] != pids[2]
+
+
+def test_recycle_above_max_rss(executor):
+    executor.max_jobs = None
+    # Start the worker, then recycle it after every job.
+    executor.submit(allocate, 0).result()
+    executor.max_rss = 1
+    first = executor.submit(os.getpid).result()
+    assert executor.submit(os.getpid).result() != first
+
+
+def test_peak_rss(executor):
+    executor.submit(allocate, 100 * 1024 ** 2).result()
+    executor.submit(allocate, 0).result()
+    big, small = list(executor.recent_jobs)
+    assert big['job'] == 'allocate(104857600)'
+    assert big['peak_rss_bytes'] > small['peak_rss_bytes'] + 90 * 1024 ** 2
+
+
+def test_memory_limit(executor):
+    with pytest.raises(MemoryError):
+        executor.submit(allocate, 400 * 1024 ** 2).result()
+    # The worker survives, and the limit only applies to the job.
+    assert executor.submit(allocate, 100 * 1024 ** 2).result()
+
+
+def test_memory_limit_excludes_subprocesses(executor):
+    # The subprocesses of a job (e.g. git) have their own memory.
+    assert executor.submit(allocate_in_subprocess,
+                           2 * 1024 ** 3).result() == 0
@@ -0,0 +1,20 @@
+import pytest
+
+import repohealth.generate
+
+
+@pytest.fixture
+def cache_root(tmpdir, monkeypatch):
+    """
+    Point all of the repohealth.generate cache locations at a temporary
+    directory.
+
+    """
+    old_root = repohealth.generate.CACHE_ROOT
+    new_root = str(tmpdir.join('ephemeral_storage'))
+    for name in dir(repohealth.generate):
+        value = getattr(repohealth.generate, name)
+        if isinstance(value, str) and value.startswith(old_root):
+            monkeypatch.setattr(repohealth.generate, name,
+                                new_root + value[len(old_root):])
+    return new_root
@@ -0,0 +1,32 @@
+import json
+import os
+
+import pytest
+
+import repohealth.generate as generate
+
+
+@pytest.mark.parametrize('compression, magic', [
+    ('none', b'{'), ('gzip', generate.GZIP_MAGIC),
+    ('zstd', generate.ZSTD_MAGIC)])
+def test_compressed_cache(cache_root, monkeypatch, compression, magic):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    monkeypatch.setattr(generate, 'CACHE_COMPRESSION', compression)
+    os.makedirs(os.path.join(cache_root, 'org'))
+    fname = generate.CACHE_COMMITS.format('org/repo')
+    content = {'commits': [{'name': 'Zoë', 'email': 'a'}] * 100}
+    generate.write_cache(fname, content)
+    with open(fname, 'rb') as fh:
+        assert fh.read(len(magic)) == magic
+    assert generate.load_cache(fname) == content
+
+
+def test_uncompressed_cache(cache_root, monkeypatch):
+    # A file from before the cache was compressed.
+    monkeypatch.setattr(generate, 'CACHE_COMPRESSION', 'gzip')
+    os.makedirs(cache_root)
+    fname = generate.CACHE_GH.format('repo')
+    with open(fname, 'w') as fh:
+        json.dump({'repo': {}}, fh)
+    assert generate.load_cache(fname) == {'repo': {}}
@@ -0,0 +1,68 @@
+import asyncio
+import os
+import time
+
+import git
+
+import repohealth.generate as generate
+import repohealth.git
+
+
+def test_clone_fork_with_reference(cache_root, tmpdir):
+    parent = git.Repo.init(str(tmpdir.join('parent')))
+    parent.index.commit('Initial commit')
+    fork = git.Repo.clone_from(parent.git_dir, str(tmpdir.join('fork')))
+    fork.index.commit('A commit of the fork')
+    info = {'full_name': 'org/fork', 'fork': True,
+            'clone_url': 'file://' + fork.git_dir,
+            'source': {'full_name': 'Org/Parent',
+                       'clone_url': 'file://' + parent.git_dir}}
+
+    reference = generate.clone_reference(info)
+    assert reference == generate.CACHE_MIRROR.format('org/parent')
+    assert git.Repo(reference).bare
+
+    target = str(tmpdir.join('clone'))
+    asyncio.run(repohealth.git.clone(info['clone_url'], target,
+                                     reference=reference))
+    alternates = os.path.join(target, '.git', 'objects', 'info', 'alternates')
+    with open(alternates, 'r') as fh:
+        assert os.path.realpath(fh.read().strip()) == os.path.realpath(
+            os.path.join(reference, 'objects'))
+    assert git.Repo(target).head.commit == fork.head.commit
+
+    # The parent itself now uses the mirror of its forks.
+    assert generate.clone_reference({'full_name': 'org/parent',
+                                     'fork': False}) == reference
+    assert generate.clone_reference({'full_name': 'org/other',
+                                     'fork': False}) is None
+
+
+def test_clone_reference_failure(cache_root, tmpdir):
+    info = {'full_name': 'org/fork', 'fork': True,
+            'parent': {'full_name': 'org/missing',
+                       'clone_url': str(tmpdir.join('missing'))}}
+    # The fork is cloned in full instead.
+    assert generate.clone_reference(info) is None
+
+
+def test_mirror_eviction(cache_root, tmpdir):
+    parent = git.Repo.init(str(tmpdir.join('parent')))
+    parent.index.commit('Initial commit')
+    for name in ['old', 'new']:
+        generate.clone_reference({
+            'full_name': 'org/fork', 'fork': True,
+            'parent': {'full_name': 'org/' + name,
+                       'clone_url': parent.git_dir}})
+    old, new = [generate.CACHE_MIRROR.format('org/' + name)
+                for name in ['old', 'new']]
+    an_hour_ago = time.time() - 3600
+    os.utime(old, (an_hour_ago, an_hour_ago))
+
+    generate.evict_mirrors(max_age=60)
+    assert not os.path.exists(old)
+    assert os.path.isdir(new)
+
+    # The mirror of a repo goes along with the rest of its cache.
+    generate.clear_cache('org/new')
+    assert not os.path.exists(new)
@@ -0,0 +1,12 @@
+import subprocess
+import sys
+
+
+def test_lazy_imports():
+    # The web app imports repohealth.generate, so it mustn't pull in the
+    # heavy dependencies (which are only needed to produce a report).
+    code = ('import sys, repohealth.generate; '
+            'print(",".join(sorted(set(sys.modules) & {})))'.format(
+                {'pandas', 'plotly', 'github', 'git', 'nbformat'}))
+    output = subprocess.check_output([sys.executable, '-c', code])
+    assert output.decode('ascii').strip() == ''
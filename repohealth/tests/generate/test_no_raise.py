@@ -0,0 +1,62 @@
+import os
+
+import repohealth.generate as generate
+
+
+def test_memory_error(cache_root):
+    os.makedirs(os.path.join(cache_root, 'org'))
+    with generate.no_raise('org/repo'):
+        raise MemoryError()
+    result = generate.cached_failure('org/repo')
+    assert result['status'] == 507
+    assert 'too large' in result['message']
+
+
+class BadGateway(Exception):
+    status = 502
+
+
+def age_failure(uuid, seconds):
+    index = generate.cache_index()
+    index.update(uuid, updated=index.entry(uuid)['updated'] - seconds)
+
+
+def test_transient_failure(cache_root, monkeypatch):
+    monkeypatch.setattr(generate, 'FAILURE_RETRY_SECONDS', 60)
+    os.makedirs(os.path.join(cache_root, 'org'))
+    with generate.no_raise('org/repo', attempts=3):
+        raise BadGateway()
+    result = generate.cached_failure('org/repo')
+    assert (result['status'], result['transient']) == (502, True)
+    # Backed off for the third failure in a row.
+    assert result['retry_in'] == 240
+    assert generate.cache_available('org/repo')
+
+    age_failure('org/repo', 241)
+    assert generate.cached_failure('org/repo') is None
+    assert not generate.cache_available('org/repo')
+    assert generate.cache_age('org/repo') is None
+
+
+def test_permanent_failure(cache_root, monkeypatch):
+    monkeypatch.setattr(generate, 'PERMANENT_FAILURE_SECONDS', 3600)
+    os.makedirs(os.path.join(cache_root, 'org'))
+    generate.write_failure('org/missing', {'status': 404, 'message': ''})
+    age_failure('org/missing', 600)
+    assert not generate.cached_failure('org/missing')['transient']
+    assert generate.cache_available('org/missing')
+    age_failure('org/missing', 3000)
+    assert not generate.cache_available('org/missing')
+
+
+def test_retry(cache_root, monkeypatch):
+    # Nothing is listening, so fetching from "GitHub" fails.
+    monkeypatch.setattr(generate, 'GITHUB_API_URL', 'http://127.0.0.1:9')
+    os.makedirs(os.path.join(cache_root, 'org'))
+    with generate.no_raise('org/repo'):
+        raise BadGateway()
+    assert generate.repo_data('org/repo', 'token')['status'] == 502
+
+    age_failure('org/repo', generate.FAILURE_RETRY_SECONDS)
+    result = generate.repo_data('org/repo', 'token')
+    assert (result['status'], result['attempts']) == (500, 2)
@@ -0,0 +1,19 @@
+import repohealth.generate as generate
+
+
+def test_pending_plots():
+    assert generate.pending_plots({'commits': []}) == []
+    pending = generate.pending_plots({'commits': [],
+                                      'pending': ['line_stats']})
+    assert 'commit_LOC_delta' in pending
+    assert 'new_contributors' not in pending
+
+
+def test_iter_visualisations():
+    payload = {'commits': [], 'pending': ['line_stats'],
+               'github': {'repo': {}, 'issues': [], 'stargazers': []}}
+    plots = generate.iter_visualisations(payload)
+    # The plots are rendered (and so can be sent) one at a time, in order.
+    assert next(plots) == ('all_commits', {'title': 'All commits',
+                                           'pending': True})
+    plots.close()
@@ -0,0 +1,30 @@
+import os
+
+import repohealth.generate as generate
+
+
+def age(uuid, seconds, column='updated'):
+    index = generate.cache_index()
+    index.update(uuid, **{column: index.entry(uuid)[column] - seconds})
+
+
+def test_needs_refresh(cache_root, monkeypatch):
+    monkeypatch.setattr(generate, 'FRESHNESS_HOURS', 1)
+    os.makedirs(os.path.join(cache_root, 'org'))
+    assert not generate.needs_refresh('org/repo')
+    generate.write_cache(generate.CACHE_GH.format('org/repo'), {})
+    generate.write_cache(generate.CACHE_COMMITS.format('org/repo'), {})
+    generate.index_payload('org/repo', 'ready')
+    assert not generate.needs_refresh('org/repo')
+
+    age('org/repo', 3600)
+    assert generate.needs_refresh('org/repo')
+
+    # A failed refresh isn't retried until its failure expires.
+    generate.write_failure('org/repo', {'status': 502}, refresh=True)
+    assert not generate.needs_refresh('org/repo')
+    age('org/repo', generate.FAILURE_RETRY_SECONDS, 'refresh_failed')
+    assert generate.needs_refresh('org/repo')
+
+    monkeypatch.setattr(generate, 'FRESHNESS_HOURS', 0)
+    assert not generate.needs_refresh('org/repo')
@@ -0,0 +1,84 @@
+import os
+import time
+
+import pytest
+
+from repohealth.benchmarks.fake_s3 import FakeS3
+import repohealth.generate as generate
+import repohealth.shared_cache as shared_cache
+
+
+@pytest.fixture
+def fake_s3(cache_root, monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setattr(shared_cache, 'BUCKET', 'bucket')
+    monkeypatch.setattr(shared_cache, '_STORE',
+                        shared_cache.S3Store('bucket', client=fake))
+    os.makedirs(os.path.join(cache_root, 'org'))
+    return fake
+
+
+def ingest(uuid, updated):
+    generate.write_cache(generate.CACHE_GH.format(uuid),
+                         {'repo': {'full_name': uuid}, 'issues': [],
+                          'stargazers': []})
+    generate.write_cache(generate.CACHE_COMMITS.format(uuid),
+                         {'commits': [{'email': 'a'}]})
+    generate.index_payload(uuid, 'ready', updated=updated)
+    generate.share_payload(uuid, updated)
+
+
+def test_share(fake_s3, monkeypatch):
+    monkeypatch.setattr(generate, 'FRESHNESS_HOURS', 1)
+    updated = time.time() - 60
+    ingest('org/repo', updated)
+    assert ('bucket', 'org/repo.manifest.json') in fake_s3.objects
+
+    # Another instance (or this one, after a restart).
+    generate.clear_cache('org/repo')
+    assert generate.fetch_shared('org/repo', newer_than=updated) is None
+    assert not os.path.exists(generate.CACHE_GH.format('org/repo'))
+    assert generate.fetch_shared('org/repo') == updated
+    assert generate.load_cache(generate.CACHE_COMMITS.format('org/repo')) == {
+        'commits': [{'email': 'a'}]}
+
+    # A stale copy is ingested again instead.
+    monkeypatch.setattr(generate, 'FRESHNESS_HOURS', 60 / 3600)
+    assert generate.fetch_shared('org/repo') is None
+
+
+def test_read_through(fake_s3, monkeypatch):
+    # Nothing is listening, so GitHub isn't used.
+    monkeypatch.setattr(generate, 'GITHUB_API_URL', 'http://127.0.0.1:9')
+    updated = time.time() - 60
+    ingest('org/repo', updated)
+    generate.clear_cache('org/repo')
+
+    payload = generate.repo_data('org/repo', 'token')
+    assert payload['commits'] == [{'email': 'a'}]
+    assert generate.in_cache() == ['org/repo']
+    assert generate.cache_age('org/repo') >= 60
+    # Nothing new to share.
+    assert fake_s3.stats['put_object'] == 3
+
+
+def test_partial_is_not_shared(fake_s3, monkeypatch):
+    monkeypatch.setattr(generate, 'GITHUB_API_URL', 'http://127.0.0.1:9')
+    generate.write_cache(generate.CACHE_GH.format('org/repo'),
+                         {'repo': {'full_name': 'org/repo'}, 'issues': [],
+                          'stargazers': []})
+    generate.write_cache(generate.CACHE_COMMITS.format('org/repo'),
+                         {'commits': [], 'pending': ['line_stats']})
+    generate.index_payload('org/repo', 'partial')
+
+    # The partial payload is served while its line stats are computed.
+    payload = generate.repo_data('org/repo', 'token')
+    assert payload['pending'] == ['line_stats']
+    assert generate.cache_index().entry('org/repo')['state'] == 'partial'
+    assert fake_s3.stats['put_object'] == 0
+
+    # Nor is a partial payload ever read through from the shared cache.
+    generate.share_payload('org/repo', time.time())
+    generate.clear_cache('org/repo')
+    assert generate.fetch_shared('org/repo') is None
+    assert not os.path.exists(generate.CACHE_COMMITS.format('org/repo'))
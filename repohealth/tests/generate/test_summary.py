@@ -0,0 +1,90 @@
+import datetime
+import json
+import os
+
+import repohealth.generate as generate
+
+
+def payload(stars=10):
+    return {'commits': [{'email': 'a'}, {'email': 'b'}, {'email': 'a'}],
+            'github': {'repo': {'name': 'repo', 'full_name': 'org/repo',
+                                'stargazers_count': stars,
+                                'forks_count': 2,
+                                'owner': {'login': 'org'}},
+                       'issues': [{}],
+                       'stargazers': [{}] * stars}}
+
+
+def test_summary():
+    record = generate.summary('org/repo', payload(),
+                              datetime.datetime(2018, 1, 2, 3, 4, 5))
+    assert record['uuid'] == 'org/repo'
+    assert record['repo']['stargazers_count'] == 10
+    assert 'owner' not in record['repo']
+    assert record['counts'] == {'commits': 3, 'contributors': 2,
+                                'issues': 1, 'stargazers': 10}
+    assert record['updated'] == '2018-01-02T03:04:05Z'
+
+
+def test_summary_index(cache_root):
+    assert generate.summaries() == {}
+    os.makedirs(os.path.join(cache_root, 'org'))
+    generate.write_summary('org/repo', payload())
+    generate.write_summary('org/other', payload(stars=3))
+    assert generate.in_cache() == ['org/other', 'org/repo']
+    assert generate.summaries()['org/other']['repo']['stargazers_count'] == 3
+
+    generate.write_summary('org/other', payload(stars=4))
+    assert generate.summaries()['org/other']['repo']['stargazers_count'] == 4
+
+    generate.clear_cache('org/other')
+    assert generate.in_cache() == ['org/repo']
+
+
+def test_index_import(cache_root):
+    # Repos cached before the index existed.
+    os.makedirs(os.path.join(cache_root, 'org'))
+    content = payload()
+    for uuid in ['org/repo', 'org/partial']:
+        generate.write_cache(generate.CACHE_GH.format(uuid),
+                             content['github'])
+    generate.write_cache(generate.CACHE_COMMITS.format('org/repo'),
+                         {'commits': content['commits']})
+    generate.write_cache(generate.CACHE_SUMMARY.format('org/repo'),
+                         {'uuid': 'org/repo'})
+    generate.write_cache(generate.CACHE_COMMITS.format('org/partial'),
+                         {'commits': [], 'pending': ['line_stats']})
+
+    assert generate.summaries() == {'org/repo': {'uuid': 'org/repo'}}
+    entry = generate.cache_index().entry('org/repo')
+    assert entry['commits_bytes'] == os.path.getsize(
+        generate.CACHE_COMMITS.format('org/repo'))
+    assert generate.cache_index().entry('org/partial')['state'] == 'partial'
+    assert generate.cache_available('org/partial')
+
+
+def test_summary_index_backfill(cache_root):
+    # A repo cached before summaries existed.
+    os.makedirs(os.path.join(cache_root, 'org'))
+    content = payload(stars=5)
+    generate.write_cache(generate.CACHE_GH.format('org/old'),
+                         content['github'])
+    generate.write_cache(generate.CACHE_COMMITS.format('org/old'),
+                         {'commits': content['commits']})
+    # One that is part way through being ingested.
+    generate.write_cache(generate.CACHE_GH.format('org/partial'),
+                         content['github'])
+    generate.write_cache(generate.CACHE_COMMITS.format('org/partial'), {})
+    assert generate.in_cache() == ['org/old']
+    assert generate.summaries()['org/old']['counts']['stargazers'] == 5
+    assert generate.cache_index().entry('org/old')['state'] == 'ready'
+    assert not generate.cache_available('org/partial')
+
+
+def test_index_legacy_failure(cache_root):
+    # A failure cached before the index existed.
+    os.makedirs(os.path.join(cache_root, 'org'))
+    with open(generate.CACHE_EXCEPTION.format('org/repo'), 'w') as fh:
+        json.dump({'status': 404, 'message': 'Not found'}, fh)
+    assert generate.cached_failure('org/repo')['status'] == 404
+    assert generate.in_cache() == []
@@ -0,0 +1,81 @@
+import os
+
+import git
+import pytest
+
+import repohealth.generate as generate
+from repohealth.warm import read_slugs, warm
+
+
+def fake_job(uuid, token, fresh_clone=False):
+    # Stands in for the ingestion of a repo, which costs 10 requests.
+    generate.write_cache(generate.CACHE_COMMITS.format(uuid), [])
+    generate.index_payload(uuid, 'ready')
+    return (200 if token == 'good' else 500), 10
+
+
+def test_read_slugs(tmpdir):
+    fname = str(tmpdir.join('repos.txt'))
+    with open(fname, 'w') as fh:
+        fh.write('# Nightly\nNumPy/numpy\n\nscipy/scipy  # Science\n')
+    assert read_slugs(['a/b', 'numpy/numpy'], fname) == [
+        'a/b', 'numpy/numpy', 'scipy/scipy']
+    with pytest.raises(ValueError):
+        read_slugs(['../etc'])
+
+
+def test_warm(cache_root):
+    os.makedirs(os.path.join(cache_root, 'org'))
+    generate.write_cache(generate.CACHE_COMMITS.format('org/fresh'), [])
+    generate.index_payload('org/fresh', 'ready')
+    uuids = ['org/fresh', 'org/a', 'org/b', 'org/c']
+
+    # The budget is spent after the second job.
+    summary = warm(uuids, ['good', 'bad'], budget=15, job=fake_job)
+    assert (summary['fresh'], summary['ingested'], summary['failed'],
+            summary['not_started'], summary['requests']) == (1, 1, 1, 1, 20)
+    assert os.path.exists(generate.CACHE_COMMITS.format('org/b'))
+    assert not os.path.exists(generate.CACHE_COMMITS.format('org/c'))
+
+    # Everything is fresh now, apart from the repo that wasn't started.
+    summary = warm(uuids, ['good'], job=fake_job)
+    assert (summary['fresh'], summary['ingested']) == (3, 1)
+
+
+def test_warm_budget_spent_partway(cache_root):
+    os.makedirs(os.path.join(cache_root, 'org'))
+    uuids = ['org/a', 'org/b', 'org/c', 'org/d', 'org/e']
+    # More repos than processes, and the budget is spent by the first jobs
+    # (the jobs that aren't started mustn't keep hold of their process).
+    summary = warm(uuids, ['good'], processes=2, budget=5, job=fake_job)
+    assert (summary['ingested'], summary['not_started']) == (2, 3)
+
+
+def cloned_job(uuid, token, fresh_clone=False):
+    cloned = os.path.isdir(generate.CACHE_CLONE.format(uuid))
+    return (200 if cloned and fresh_clone else 500), 0
+
+
+def test_warm_clones(cache_root, tmpdir, caplog):
+    source = git.Repo.init(str(tmpdir.join('source')))
+    source.index.commit('Initial commit')
+    os.makedirs(os.path.join(cache_root, 'org'))
+    uuids = ['org/a', 'org/b', 'org/c']
+    for uuid in uuids:
+        generate.write_cache(generate.CACHE_GH.format(uuid),
+                             {'repo': {'full_name': uuid, 'fork': False,
+                                       'clone_url': source.git_dir}})
+    # A fork, which is cloned with reference to a mirror of its parent.
+    generate.write_cache(generate.CACHE_GH.format('org/a'),
+                         {'repo': {'full_name': 'org/a', 'fork': True,
+                                   'clone_url': source.git_dir,
+                                   'parent': {'full_name': 'org/parent',
+                                              'clone_url': source.git_dir}}})
+
+    summary = warm(uuids, ['token'], clones=2, job=cloned_job)
+    # The jobs found their clones, which were cleaned up afterwards.
+    assert summary['ingested'] == 3
+    assert not any(os.path.exists(generate.CACHE_CLONE.format(uuid))
+                   for uuid in uuids)
+    assert os.path.isdir(generate.CACHE_MIRROR.format('org/parent'))
+    assert 'Unable to mirror' not in caplog.text
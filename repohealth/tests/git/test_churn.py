@@ -0,0 +1,66 @@
+import os
+
+import git
+import pytest
+
+import repohealth.git
+from repohealth.git import churn, churn_hotspots
+
+
+@pytest.fixture
+def repo(tmpdir):
+    repo = git.Repo.init(str(tmpdir))
+    writer = repo.config_writer()
+    writer.set_value('user', 'name', 'Tester')
+    writer.set_value('user', 'email', 'tester@example.com')
+    writer.release()
+
+    def commit(path, content, message):
+        fname = os.path.join(str(tmpdir), path)
+        if not os.path.exists(os.path.dirname(fname)):
+            os.makedirs(os.path.dirname(fname))
+        with open(fname, 'w') as fh:
+            fh.write(content)
+        repo.git.add(path)
+        repo.git.commit('-m', message)
+
+    commit('README', 'a\nb\n', 'First')
+    commit('src/code.py', 'x = 1\n', 'Add code')
+    commit('src/code.py', 'x = 2\ny = 3\n', 'Change code')
+    repo.git.mv('src/code.py', 'src/renamed.py')
+    repo.git.commit('-m', 'Rename')
+    commit('src/renamed.py', 'x = 2\n', 'Change renamed')
+    commit('odd\t"name".txt', 'z\n', 'Add an awkward path')
+    return repo
+
+
+def test_churn(repo):
+    index = churn(repo)
+    records = {path: (commits, ins, dels)
+               for path, commits, ins, dels in zip(
+                    index['paths'], index['commits'],
+                    index['insertions'], index['deletions'])}
+    assert records == {'README': (1, 2, 0),
+                       'src/code.py': (2, 3, 1),
+                       # The rename (no changes), plus the later change.
+                       'src/renamed.py': (2, 0, 1),
+                       'odd\t"name".txt': (1, 1, 0)}
+
+
+def test_churn_parse_error(repo, monkeypatch):
+    # A failure part way through the log mustn't leave git (or us) hanging.
+    monkeypatch.setattr(repohealth.git, '_nul_separated',
+                        lambda stream: iter(['not numstat']))
+    with pytest.raises(ValueError):
+        churn(repo)
+
+
+def test_churn_hotspots():
+    index = {'paths': ['a', 'b', 'c'],
+             'commits': [1, 5, 5],
+             'insertions': [100, 1, 10],
+             'deletions': [0, 1, 0]}
+    hotspots = churn_hotspots(index, count=2)
+    assert [hotspot['path'] for hotspot in hotspots] == ['c', 'b']
+    assert hotspots[0] == {'path': 'c', 'commits': 5,
+                           'insertions': 10, 'deletions': 0}
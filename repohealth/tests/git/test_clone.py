@@ -0,0 +1,73 @@
+import asyncio
+
+import git
+import pytest
+
+import repohealth.git
+
+
+@pytest.fixture
+def source(tmpdir):
+    repo = git.Repo.init(str(tmpdir.join('source')))
+    repo.index.commit('Initial commit')
+    return repo
+
+
+def test_clone_and_fetch(source, tmpdir):
+    target = str(tmpdir.join('clone'))
+    lines = []
+    # A file:// URL uses the same transport (and progress) as a remote.
+    asyncio.run(repohealth.git.clone('file://' + source.git_dir, target,
+                                     progress=lines.append))
+    assert any(line.startswith('Cloning into') for line in lines)
+    clone = git.Repo(target)
+    assert clone.head.commit == source.head.commit
+
+    source.index.commit('Another commit')
+    asyncio.run(repohealth.git.fetch(target))
+    assert clone.remotes.origin.refs[0].commit == source.head.commit
+
+
+def test_clone_error(tmpdir):
+    with pytest.raises(git.GitCommandError) as err:
+        asyncio.run(repohealth.git.clone(str(tmpdir.join('missing')),
+                                         str(tmpdir.join('clone'))))
+    assert 'does not exist' in err.value.stderr
+
+
+def test_concurrent_clones(source, tmpdir):
+    async def clone_all():
+        await asyncio.gather(*[
+            repohealth.git.clone(source.git_dir, str(tmpdir.join(str(i))))
+            for i in range(4)])
+    asyncio.run(clone_all())
+    assert all(tmpdir.join(str(i)).join('.git').check() for i in range(4))
+
+
+def test_blobless_clone(source, tmpdir):
+    source.git.config('uploadpack.allowFilter', 'true')
+    with open(str(tmpdir.join('source', 'README')), 'w') as fh:
+        fh.write('Hello')
+    source.index.add(['README'])
+    source.index.commit('Add a README')
+
+    target = str(tmpdir.join('clone'))
+    asyncio.run(repohealth.git.clone('file://' + source.git_dir, target,
+                                     blobless=True))
+    clone = git.Repo(target)
+    assert repohealth.git.is_partial(clone)
+    missing = clone.git.rev_list('--objects', '--all', '--missing=print')
+    assert '?' + source.head.commit.tree['README'].hexsha in missing.split()
+
+    lines = []
+    asyncio.run(repohealth.git.fetch_blobs(target, progress=lines.append))
+    assert lines
+    missing = clone.git.rev_list('--objects', '--all', '--missing=print')
+    assert '?' not in missing
+    # The clone keeps its filter (for any future fetches).
+    assert repohealth.git.is_partial(clone)
+
+    # There is nothing left to fetch.
+    lines = []
+    asyncio.run(repohealth.git.fetch_blobs(target, progress=lines.append))
+    assert lines == []
@@ -0,0 +1,26 @@
+from github import Github
+import pytest
+import tornado.httpclient
+import tornado.ioloop
+
+from repohealth.benchmarks.fake_github import FakeGitHub
+from repohealth.benchmarks.synthetic import synthetic_github
+from repohealth.github.issues import repo_issues
+
+
+def test_failed_page():
+    # The quota runs out part way through the (ten) pages of issues.
+    fake = FakeGitHub(rate_limit=4)
+    fake.add_repo('org/repo', synthetic_github('org/repo', n_issues=1000,
+                                               n_stargazers=0))
+    fake.start_in_thread()
+    loop = tornado.ioloop.IOLoop()
+    try:
+        repo = Github('user', base_url=fake.base_url).get_repo('org/repo')
+        # The listing fails, rather than leaving out the pages that failed.
+        with pytest.raises(tornado.httpclient.HTTPError) as err:
+            loop.run_sync(lambda: repo_issues(repo, 'user'))
+        assert err.value.code == 403
+    finally:
+        loop.close()
+        fake.stop()
@@ -0,0 +1,128 @@
+import multiprocessing
+
+from github import Github
+import pytest
+import tornado.ioloop
+
+from repohealth.benchmarks.fake_github import FakeGitHub
+from repohealth.benchmarks.synthetic import synthetic_github
+from repohealth.cache_index import CacheIndex
+from repohealth.github.issues import repo_issues
+import repohealth.github.tokens as tokens
+from repohealth.github.tokens import Slots, TokenPool, fingerprint
+
+
+def quota(remaining, limit=5000, reset=4102444800):
+    return {'X-RateLimit-Remaining': str(remaining),
+            'X-RateLimit-Limit': str(limit),
+            'X-RateLimit-Reset': str(reset)}
+
+
+def respond(pool, token, code=200, headers=None):
+    # As fetch_page does, with a token that the pool chose.
+    pool.release(pool.slots.try_acquire(), token, code, headers)
+
+
+def test_choose():
+    pool = TokenPool(['a', 'b'])
+    # A job's own token is preferred, all else being equal...
+    assert pool.choose('own') == 'own'
+    # ... but not over the tokens with more quota to spare.
+    assert pool.choose('own') in ('a', 'b')
+
+    pool = TokenPool(['a', 'b'])
+    assert [pool.choose(), pool.choose()] == ['a', 'b']
+    respond(pool, 'a', headers=quota(100))
+    respond(pool, 'b', headers=quota(10))
+    assert pool.choose() == 'a'
+    # A token with bad credentials is left out.
+    respond(pool, 'a', 401)
+    assert pool.choose() == 'b'
+    # Exhausted tokens leave the job with its own.
+    respond(pool, 'b', headers=quota(0))
+    assert pool.choose('own') == 'own'
+    assert TokenPool().choose() is None
+
+
+def test_store(tmpdir):
+    index = CacheIndex(str(tmpdir.join('index.sqlite')))
+    pool = TokenPool(['a', 'b'], store=index)
+    assert pool.choose() == 'a'
+    respond(pool, 'a', headers=quota(0))
+    [stored] = index.quotas()
+    assert stored['fingerprint'] == fingerprint('a')
+    assert (stored['label'], stored['remaining']) == ('service 1', 0)
+    # Another process's pool learns of the quota from the store.
+    assert TokenPool(['a', 'b'], store=index).choose() == 'b'
+    # An older quota doesn't replace a newer one.
+    index.update_quota(fingerprint('a'), stored['updated'] - 1, remaining=1)
+    assert index.quotas()[0]['remaining'] == 0
+
+
+def test_shared_tokens(tmpdir, monkeypatch):
+    monkeypatch.setattr(tokens, 'QUOTA_INTERVAL', 0)
+    index = CacheIndex(str(tmpdir.join('index.sqlite')))
+    # The pools of two processes, one of which runs a job of the user.
+    pool, other = TokenPool(store=index), TokenPool(store=index)
+    pool.share('user-token', 'user someone')
+    assert other.choose() == 'user-token'
+    assert other.tokens['user-token']['label'] == 'user someone'
+
+    # The user opts out (through yet another process).
+    TokenPool(store=index).unshare('user-token')
+    assert other.choose() is None
+    assert pool.choose() is None
+
+
+def _try_acquire(slots, queue):
+    queue.put(slots.try_acquire())
+
+
+def test_slots(tmpdir):
+    slots = Slots(2, str(tmpdir.join('slots')))
+    held = {slots.try_acquire(), slots.try_acquire()}
+    assert held == {0, 1}
+    assert slots.try_acquire() is None
+
+    # The slots are shared with other processes.
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    process = context.Process(target=_try_acquire,
+                              args=(Slots(2, slots.directory), queue))
+    process.start()
+    assert queue.get(timeout=10) is None
+    process.join()
+    slots.release(1)
+    process = context.Process(target=_try_acquire,
+                              args=(Slots(2, slots.directory), queue))
+    process.start()
+    assert queue.get(timeout=10) == 1
+    process.join()
+
+
+@pytest.fixture
+def fake():
+    fake = FakeGitHub()
+    fake.add_repo('org/repo', synthetic_github('org/repo', n_issues=1000,
+                                               n_stargazers=0))
+    fake.start_in_thread()
+    yield fake
+    fake.stop()
+
+
+def test_fetch_through_pool(fake):
+    pool = TokenPool(['service-1', 'service-2'], max_requests=3)
+    repo = Github('user', base_url=fake.base_url).get_repo('org/repo')
+    loop = tornado.ioloop.IOLoop()
+    try:
+        issues = loop.run_sync(lambda: repo_issues(repo, 'user', pool=pool))
+    finally:
+        loop.close()
+    assert len(issues) == 1000
+    # The pages are spread over the pool's tokens (and the user's).
+    assert {token: fake.used[token] > 0
+            for token in ['user', 'service-1', 'service-2']} == {
+                'user': True, 'service-1': True, 'service-2': True}
+    assert sum(fake.used.values()) == 1 + 10
+    assert max(fake.in_flight.values()) == 0
+    assert pool.tokens['service-1']['remaining'] == 5000 - fake.used['service-1']
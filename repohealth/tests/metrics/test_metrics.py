@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import repohealth.metrics as metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, '_REGISTRY', registry)
+    return registry
+
+
+def test_histogram(registry):
+    metrics.observe('repohealth_stage_seconds', 0.2, stage='clone')
+    metrics.observe('repohealth_stage_seconds', 20, stage='clone')
+    histogram = registry.histograms[('repohealth_stage_seconds',
+                                     (('stage', 'clone'),))]
+    assert histogram['count'] == 2
+    assert histogram['sum'] == 20.2
+    # Buckets are cumulative.
+    assert histogram['buckets'][metrics.BUCKETS.index(0.5)] == 1
+    assert histogram['buckets'][metrics.BUCKETS.index(30)] == 2
+
+
+def test_stage_timer(registry):
+    timer = metrics.StageTimer()
+    with timer.stage('log_parse'):
+        pass
+    with timer.stage('cache_write'):
+        pass
+    assert registry.histograms == {}
+    timer.record(size=metrics.size_class(5000))
+    assert sorted(registry.histograms) == [
+        ('repohealth_stage_seconds', (('size', 'medium'),
+                                      ('stage', 'cache_write'))),
+        ('repohealth_stage_seconds', (('size', 'medium'),
+                                      ('stage', 'log_parse')))]
+
+
+def test_collect(registry, tmpdir, monkeypatch):
+    directory = str(tmpdir.join('metrics'))
+    metrics.increment('repohealth_github_requests_total', 3,
+                      endpoint='issues', code=200)
+    metrics.observe('repohealth_stage_seconds', 1, stage='clone')
+    metrics.flush(directory)
+
+    # Another process' metrics.
+    monkeypatch.setattr(metrics, '_REGISTRY', metrics.Registry())
+    metrics.increment('repohealth_github_requests_total', 2,
+                      endpoint='issues', code=200)
+    metrics.observe('repohealth_stage_seconds', 100, stage='clone')
+    metrics.flush(directory)
+    assert len(os.listdir(directory)) == 2
+
+    text = metrics.prometheus_text(metrics.collect(directory))
+    lines = text.splitlines()
+    assert '# TYPE repohealth_github_requests_total counter' in lines
+    assert ('repohealth_github_requests_total{code="200",endpoint="issues"} 5'
+            in lines)
+    assert '# TYPE repohealth_stage_seconds histogram' in lines
+    assert 'repohealth_stage_seconds_bucket{stage="clone",le="1"} 1' in lines
+    assert 'repohealth_stage_seconds_bucket{stage="clone",le="+Inf"} 2' in lines
+    assert 'repohealth_stage_seconds_sum{stage="clone"} 101' in lines
+    assert 'repohealth_stage_seconds_count{stage="clone"} 2' in lines
+
+
+def test_compact(registry, tmpdir):
+    directory = str(tmpdir.join('metrics'))
+    metrics.increment('repohealth_worker_recycles_total', reason='max_jobs')
+    metrics.flush(directory)
+    # The metrics of a process that has since exited.
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    with open(os.path.join(directory, '{}-dead.json'.format(proc.pid)),
+              'w') as fh:
+        json.dump(registry.to_json(), fh)
+
+    for _ in range(2):
+        total = metrics.collect(directory)
+        assert list(total.counters.values()) == [2]
+    assert sorted(name for name in os.listdir(directory)
+                  if name.endswith('.json')) == sorted(
+        ['compacted.json', '{}.json'.format(registry.name)])
@@ -0,0 +1,48 @@
+import os
+import pstats
+import time
+import tracemalloc
+
+import repohealth.profiling as profiling
+
+
+def work():
+    return [list(range(1000)) for _ in range(100)]
+
+
+def test_profiled_job(tmpdir):
+    directory = str(tmpdir)
+    with profiling.job(directory, 'org/repo', 'repo_data', profile=True):
+        work()
+
+    [record] = profiling.profiles(directory)
+    assert record['uuid'] == 'org/repo'
+    assert record['kind'] == 'repo_data'
+    assert record['peak_bytes'] > 100 * 1000 * 8
+    stats = pstats.Stats(os.path.join(directory, record['files'][0]))
+    assert any(func[2] == 'work' for func in stats.stats)
+    snapshot = tracemalloc.Snapshot.load(
+        os.path.join(directory, record['files'][1]))
+    assert snapshot.statistics('lineno')
+
+
+def test_threshold(tmpdir):
+    directory = str(tmpdir)
+    with profiling.job(directory, 'org/repo', 'visualisations', threshold=1):
+        pass
+    assert os.listdir(directory) == []
+
+    with profiling.job(directory, 'org/repo', 'visualisations',
+                       threshold=0.01):
+        time.sleep(0.02)
+    assert profiling.profiles(directory) == []
+    assert os.listdir(directory) == ['org__repo.visualisations.mark']
+
+    # The next run is profiled.
+    with profiling.job(directory, 'org/repo', 'visualisations',
+                       threshold=0.01):
+        pass
+    [record] = profiling.profiles(directory)
+    assert record['kind'] == 'visualisations'
+    assert not os.path.exists(
+        os.path.join(directory, 'org__repo.visualisations.mark'))
@@ -0,0 +1,38 @@
+from repohealth.rollup import rollup, series_dates
+
+
+def payload():
+    commits = [{'date': '2018-01-01 10:00:00+00:00', 'email': 'a'},
+               {'date': '2018-01-02 10:00:00+00:00', 'email': 'b'},
+               {'date': '2018-03-01 10:00:00+00:00', 'email': 'a'}]
+    issues = [{'created_at': '2018-02-01T00:00:00Z', 'closed_at': None}]
+    stargazers = [{'starred_at': '2018-04-01T00:00:00Z'},
+                  {'starred_at': '2018-02-01T00:00:00Z'},
+                  {'starred_at': '2018-02-11T00:00:00Z'}]
+    return {'commits': commits,
+            'github': {'repo': {'full_name': 'Org/Repo'},
+                       'issues': issues, 'stargazers': stargazers}}
+
+
+def test_rollup():
+    result = rollup('org/repo', payload())
+    assert result['name'] == 'Org/Repo'
+    series = result['series']
+    assert series['commits'] == {'start': '2018-01', 'values': [2, 0, 1]}
+    assert series['active_contributors'] == {'start': '2018-01',
+                                             'values': [2, 0, 1]}
+    assert series['stargazers'] == {'start': '2018-02', 'values': [2, 2, 3]}
+    assert series['open_issues'] == {'start': '2018-02', 'values': [1]}
+
+
+def test_rollup_empty():
+    empty = payload()
+    empty['github']['stargazers'] = []
+    assert rollup('org/repo', empty)['series']['stargazers'] == {
+        'start': None, 'values': []}
+
+
+def test_series_dates():
+    assert series_dates({'start': '2018-11', 'values': [1, 2, 3]}) == [
+        '2018-11-01', '2018-12-01', '2019-01-01']
+    assert series_dates({'start': None, 'values': []}) == []
@@ -0,0 +1,32 @@
+import io
+
+import pytest
+
+from repohealth.benchmarks.fake_s3 import FakeS3
+import repohealth.shared_cache as shared_cache
+
+
+def test_store():
+    fake = FakeS3()
+    store = shared_cache.S3Store('bucket', 'prefix/', client=fake)
+    assert store.get('org/repo.github.json') is None
+    store.put('org/repo.github.json', b'{}')
+    store.put('org/repo.commits.json', io.BytesIO(b'[]'))
+    assert store.get('org/repo.commits.json') == b'[]'
+    assert sorted(fake.objects) == [('bucket', 'prefix/org/repo.commits.json'),
+                                    ('bucket', 'prefix/org/repo.github.json')]
+
+
+def test_store_error():
+    class Broken(object):
+        def get_object(self, Bucket, Key):
+            raise IOError('Connection refused')
+
+    store = shared_cache.S3Store('bucket', client=Broken())
+    with pytest.raises(IOError):
+        store.get('org/repo.github.json')
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(shared_cache, 'BUCKET', '')
+    assert shared_cache.store() is None
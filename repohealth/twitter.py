@@ -290,14 +290,15 @@ def tweet_status():
     patterns = TweetPattern.all_patterns_all_subclasses()
 
     import repohealth.generate
-    avail = repohealth.generate.in_cache()
+    summaries = repohealth.generate.summaries()
 
     api = twitter_api()
     recently_tweeted = list(get_tweets(api))
 
-    # We don't need a token - the report is already generated.
-    content = {uuid: repohealth.generate.repo_data(uuid, token=None)
-               for uuid in avail}
+    # The summaries hold all of the repo metadata that we need, so there is
+    # no need to load the full report payloads.
+    content = {uuid: {'github': {'repo': summary['repo']}}
+               for uuid, summary in summaries.items()}
 
     # Universally add extra content to our report context.
     for uuid, context in content.items():
@@ -0,0 +1,251 @@
+"""
+Warm the cache offline, by ingesting repos before anybody asks for them.
+
+This is the ``warm`` command of ``python -m repohealth.generate``::
+
+    python -m repohealth.generate warm numpy/numpy scipy/scipy
+    python -m repohealth.generate warm --file repos.txt --processes 4 \\
+        --clones 16 --budget 20000 --max-age 24
+
+The repos are ingested into the same cache (``REPOHEALTH_CACHE_ROOT``) that
+the web app reads. Repos that were ingested less than ``--max-age`` hours
+ago are skipped, and the GitHub tokens (``--tokens``, or the comma separated
+``GITHUB_TOKENS``) are shared out between the jobs. Once the jobs have made
+``--budget`` GitHub requests, no more jobs are started (the jobs that are
+already running are allowed to finish). With ``--clones``, the clones are
+made concurrently by this process (with asyncio), ahead of the ingestion
+jobs, so that a few processes can keep many clones in flight.
+
+"""
+import asyncio
+import collections
+import itertools
+import logging
+import os
+import re
+import shutil
+import sys
+import time
+
+from repohealth.executor import RecyclingExecutor
+import repohealth.generate
+import repohealth.git
+import repohealth.metrics
+
+
+#: Repos that were ingested less than this many hours ago are skipped.
+MAX_AGE_HOURS = float(os.environ.get('REPOHEALTH_WARM_MAX_AGE_HOURS', 24))
+
+#: An "org/repo" slug (as accepted by the web app's report routes).
+SLUG = re.compile(r'[\w\-]+/[\w\-]+')
+
+
+def read_slugs(slugs=(), fname=None):
+    """
+    The unique repo uuids of the given slugs, followed by those of the
+    given file (one per line, with "#" comments).
+
+    """
+    slugs = list(slugs)
+    if fname is not None:
+        with open(fname, 'r') as fh:
+            for line in fh:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    slugs.append(line)
+    uuids = []
+    for slug in slugs:
+        if not SLUG.fullmatch(slug):
+            raise ValueError('"{}" is not an "org/repo" slug.'.format(slug))
+        uuid = slug.lower()
+        if uuid not in uuids:
+            uuids.append(uuid)
+    return uuids
+
+
+def warm_repo(uuid, token, fresh_clone=False):
+    """
+    Ingest the repo (in an executor worker), and return its status and the
+    number of GitHub requests that were made. With ``fresh_clone``, the repo
+    has just been cloned into the cache (with ``--clones``).
+
+    """
+    requests = repohealth.metrics.registry().total
+    before = requests('repohealth_github_requests_total')
+    status = repohealth.generate.prepare_repo_data(uuid, token,
+                                                   fresh_clone=fresh_clone)
+    return status, requests('repohealth_github_requests_total') - before
+
+
+def repo_info(uuid, token):
+    """
+    The GitHub API data of the repo (from the cache, or GitHub), and the
+    number of GitHub requests that were made to get it.
+
+    """
+    cache = repohealth.generate.CACHE_GH.format(uuid)
+    if os.path.exists(cache):
+        return repohealth.generate.load_cache(cache)['repo'], 0
+    from github import Github
+    github = Github(token, base_url=repohealth.generate.GITHUB_API_URL)
+    return github.get_repo(uuid).raw_data, 1
+
+
+def warm(uuids, tokens, processes=1, clones=0, budget=None, max_age=None,
+         job=warm_repo):
+    """
+    Ingest the given repos (unless they are fresh) with the given number of
+    processes, and return a summary of the run.
+
+    With ``clones``, up to that many repos are cloned concurrently (by this
+    process, ahead of their ingestion jobs), so that the ingestion processes
+    aren't left waiting on the network.
+
+    """
+    return asyncio.run(_warm(uuids, tokens, processes, clones, budget,
+                             max_age, job))
+
+
+async def _warm(uuids, tokens, processes, clones, budget, max_age, job):
+    if max_age is None:
+        max_age = MAX_AGE_HOURS * 3600
+    loop = asyncio.get_event_loop()
+    if sys.version_info < (3, 8):
+        # Attach the child watcher to this (the main thread's) loop, so that
+        # the mirrors of clone_reference can be made (with asyncio) from
+        # the threads of the executor.
+        asyncio.get_child_watcher()
+    start = time.perf_counter()
+    counts = collections.Counter()
+    spent = [0]
+    job_slots = asyncio.Semaphore(processes)
+    # The repos that have been cloned, but not yet ingested, count towards
+    # the clones too (so that the clones don't run away from the jobs).
+    clone_slots = asyncio.Semaphore(clones or 1)
+
+    def budget_spent():
+        return budget is not None and spent[0] >= budget
+
+    async def prefetch(uuid, token):
+        # Clone the repo, returning whether there is now a clone to remove.
+        target = repohealth.generate.CACHE_CLONE.format(uuid)
+        if os.path.exists(target):
+            return False
+        try:
+            repo, n_requests = await loop.run_in_executor(None, repo_info,
+                                                          uuid, token)
+            spent[0] += n_requests
+            reference = await loop.run_in_executor(
+                None, repohealth.generate.clone_reference, repo)
+            await repohealth.git.clone(
+                repo['clone_url'], target, reference=reference,
+                blobless=repohealth.generate.BLOBLESS_CLONES)
+        except Exception:
+            # Leave it to the job (which records its failures).
+            logging.exception('Unable to clone {}'.format(uuid))
+        return os.path.exists(target)
+
+    def start_job(uuid):
+        # Whether to start the job of the repo (from scratch).
+        if budget_spent():
+            counts['not_started'] += 1
+            return False
+        if repohealth.generate.cache_age(uuid) is not None:
+            # Stale (or a cached failure), so start from scratch.
+            repohealth.generate.clear_cache(uuid)
+        return True
+
+    async def ingest(uuid, token):
+        cloned = False
+        if clones:
+            async with clone_slots:
+                if not start_job(uuid):
+                    return
+                cloned = await prefetch(uuid, token)
+                # The clone slot is held until the job has started.
+                await job_slots.acquire()
+        else:
+            await job_slots.acquire()
+        try:
+            if not clones and not start_job(uuid):
+                return
+            try:
+                status, n_requests = await asyncio.wrap_future(
+                    executor.submit(job, uuid, token, fresh_clone=cloned))
+            except Exception:
+                logging.exception('Unable to warm {}'.format(uuid))
+                status, n_requests = 500, 0
+        finally:
+            job_slots.release()
+            target = repohealth.generate.CACHE_CLONE.format(uuid)
+            if cloned and os.path.exists(target):
+                shutil.rmtree(target)
+        spent[0] += n_requests
+        counts['ingested' if status == 200 else 'failed'] += 1
+        logging.info('Warmed {} (status {}, {} GitHub requests)'
+                     ''.format(uuid, status, n_requests))
+
+    todo = []
+    for uuid in uuids:
+        age = repohealth.generate.cache_age(uuid)
+        if age is not None and age < max_age:
+            counts['fresh'] += 1
+        else:
+            todo.append(uuid)
+
+    tokens = itertools.cycle(tokens)
+    executor = RecyclingExecutor(
+        max_workers=processes, max_jobs=10,
+        initializer=repohealth.generate.warm_imports)
+    try:
+        await asyncio.gather(*[ingest(uuid, next(tokens)) for uuid in todo])
+    finally:
+        executor.shutdown()
+
+    seconds = time.perf_counter() - start
+    return {'repos': len(uuids), 'ingested': counts['ingested'],
+            'failed': counts['failed'], 'fresh': counts['fresh'],
+            'not_started': counts['not_started'], 'requests': spent[0],
+            'seconds': seconds,
+            'repos_per_minute': (counts['ingested'] + counts['failed']) /
+                                seconds * 60}
+
+
+def add_arguments(parser):
+    parser.add_argument('slugs', nargs='*', metavar='ORG/REPO',
+                        help='The repos to warm.')
+    parser.add_argument('--file',
+                        help='A file of repos to warm (one per line).')
+    parser.add_argument('--tokens',
+                        default=os.environ.get('GITHUB_TOKENS', ''),
+                        help='Comma separated GitHub tokens to share between '
+                             'the jobs (default: $GITHUB_TOKENS).')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='The number of repos to ingest concurrently.')
+    parser.add_argument('--clones', type=int, default=0,
+                        help='The number of repos to clone concurrently, '
+                             'ahead of their ingestion (by default, each '
+                             'repo is cloned by its ingestion process).')
+    parser.add_argument('--budget', type=int, default=None,
+                        help='Start no more jobs once this many GitHub '
+                             'requests have been made.')
+    parser.add_argument('--max-age', type=float, default=MAX_AGE_HOURS,
+                        help='Skip repos that were ingested less than this '
+                             'many hours ago.')
+    parser.set_defaults(func=main)
+
+
+def main(args):
+    tokens = [token.strip() for token in args.tokens.split(',')
+              if token.strip()]
+    if not tokens:
+        raise SystemExit('At least one GitHub token is needed (--tokens or '
+                         'GITHUB_TOKENS).')
+    uuids = read_slugs(args.slugs, args.file)
+    summary = warm(uuids, tokens, processes=args.processes,
+                   clones=args.clones, budget=args.budget,
+                   max_age=args.max_age * 3600)
+    print('Warmed {repos} repos in {seconds:.1f}s ({repos_per_minute:.1f} '
+          'repos/minute): {ingested} ingested, {failed} failed, {fresh} '
+          'already fresh, {not_started} not started (budget). {requests} '
+          'GitHub requests.'.format(**summary))
@@ -1,7 +1,6 @@
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 import os
 
-import requests
 import tornado.autoreload
 import tornado.ioloop
 import tornado.web
@@ -10,12 +9,48 @@ from tornado.log import enable_pretty_logging
 
 from repohealth.webapp.handlers import (
     MainHandler, APIDataAvailableHandler,
-    APIDataHandler, RepoReport, Status, Error404)
+    APIDataHandler, APICompareHandler, RepoReport, RepoCompare, Status,
+    ShareToken, MetricsHandler, ProfileDownload, Error404)
 from repohealth.auth.github import (
     GithubAuthHandler, GithubAuthLogout)
+from repohealth.executor import RecyclingExecutor
+import repohealth.generate
 import repohealth.twitter
 
 
+#: Whether to import the heavy dependencies in the executor workers as soon
+#: as the app starts, rather than in the first job.
+PREWARM = os.environ.get('REPOHEALTH_PREWARM', '1') != '0'
+
+#: Recycle the executor workers after this many jobs each (0 for never).
+WORKER_MAX_JOBS = int(os.environ.get('REPOHEALTH_WORKER_MAX_JOBS', 10))
+
+#: Recycle the executor workers once one of them holds more than this many
+#: MB of resident memory after a job (0 for no limit).
+WORKER_MAX_RSS_MB = int(os.environ.get('REPOHEALTH_WORKER_MAX_RSS_MB', 0))
+
+#: The number of MB that a job may grow a worker by before it fails with a
+#: "too large" error (0 for no limit).
+JOB_MEMORY_LIMIT_MB = int(os.environ.get('REPOHEALTH_JOB_MEMORY_LIMIT_MB', 0))
+
+
+def make_executor(n_processes):
+    """
+    The executor of the report jobs, configured from the environment.
+
+    """
+    executor = RecyclingExecutor(
+        max_workers=n_processes,
+        max_jobs=WORKER_MAX_JOBS,
+        max_rss=WORKER_MAX_RSS_MB * 1024 ** 2,
+        memory_limit=JOB_MEMORY_LIMIT_MB * 1024 ** 2,
+        initializer=repohealth.generate.warm_imports if PREWARM else None)
+    if PREWARM:
+        # The workers are only started on the first submission.
+        executor.prewarm()
+    return executor
+
+
 def routes():
     return [
         tornado.web.URLSpec(r'/oauth', GithubAuthHandler, name='auth_github'),
@@ -23,9 +58,14 @@ def routes():
         (r'/static/(.*)', tornado.web.StaticFileHandler),
         (r'/api/request/(.*)', APIDataAvailableHandler),
         (r'/api/data/([\w\-]+)/([\w\-]+)', APIDataHandler),
+        (r'/api/compare', APICompareHandler),
         tornado.web.URLSpec(r'/report/([\w\-]+)/([\w\-]+)', RepoReport),
+        (r'/compare', RepoCompare),
         (r'/logout', GithubAuthLogout),
         (r'/status', Status),
+        (r'/status/share-token', ShareToken),
+        (r'/status/profiles/([\w\-\.]+)', ProfileDownload),
+        (r'/metrics', MetricsHandler),
         ]
 
 
@@ -85,7 +125,7 @@ def main():
         http_server.bind(port)
         http_server.start(n_processes)
 
-    executor = ProcessPoolExecutor(max_workers=n_processes)
+    executor = make_executor(n_processes)
     app.settings['executor'] = executor
 
     if DEBUG:
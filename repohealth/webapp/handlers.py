@@ -2,9 +2,10 @@ import datetime
 import logging
 import os
 import json
+import re
+import time
 import traceback
 
-from github import Github
 import jinja2
 import tornado.autoreload
 import tornado.ioloop
@@ -14,9 +15,17 @@ from tornado.escape import json_encode
 
 from repohealth.auth.github import (
         BaseHandler as OAuthBase)
-import repohealth.notebook
 import repohealth.generate
 import repohealth.github.emojis
+import repohealth.github.tokens
+import repohealth.metrics
+import repohealth.profiling
+
+
+#: The GitHub logins of the admins (who may, for example, profile jobs).
+ADMINS = {login.strip().lower()
+          for login in os.environ.get('REPOHEALTH_ADMINS', '').split(',')
+          if login.strip()}
 
 
 def repo_uuid(org_or_user, repo_name):
@@ -24,15 +33,57 @@ def repo_uuid(org_or_user, repo_name):
 
 
 class BaseHandler(OAuthBase):
-    def render_template(self, template_name, **kwargs):
+    def is_admin(self):
+        user = self.get_current_user()
+        return user is not None and user.get('login', '').lower() in ADMINS
+
+    def submit_job(self, uuid, token, profile=False, refresh=False):
+        """
+        Submit the job of preparing (or refreshing) the repo's data to the
+        executor. If the token is that of a user who has opted in to sharing
+        it, it is shared with every job (see ``ShareToken``).
+
+        """
+        datastore = self.settings['datastore']
+        executor = self.settings['executor']
+        user = self.get_current_user()
+        shared_by = None
+        if (user is not None and user.get('share_token') and
+                user.get('access_token') == token):
+            shared_by = user['login']
+        future = executor.submit(repohealth.generate.prepare_repo_data,
+                                 uuid, token, profile=profile,
+                                 refresh=refresh, shared_by=shared_by)
+        future._start_time = datetime.datetime.utcnow()
+        datastore[uuid] = future
+        future.add_done_callback(lambda future: datastore.pop(uuid))
+        return future
+
+    def refresh_if_stale(self, uuid, token):
+        """
+        Submit a job to refresh the repo's cached data in the background if
+        it is stale, and return whether the data is being refreshed.
+
+        """
+        datastore = self.settings['datastore']
+        if uuid not in datastore and repohealth.generate.needs_refresh(uuid):
+            self.submit_job(uuid, token, refresh=True)
+        return uuid in datastore
+
+    def get_jinja_template(self, template_name):
         template_dirs = self.settings["template_path"]
         env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dirs))
         env.filters['gh_emoji'] = repohealth.github.emojis.to_html
-        template = env.get_template(template_name)
-        content = template.render(kwargs)
+        return env.get_template(template_name)
+
+    def render_template(self, template_name, **kwargs):
+        template = self.get_jinja_template(template_name)
+        with repohealth.metrics.timer('repohealth_template_render_seconds',
+                                      template=template_name):
+            content = template.render(kwargs)
         return content
 
-    def render(self, template_name, **kwargs):
+    def template_context(self, **kwargs):
         """
         This is for making some extra context variables available to
         the template.
@@ -48,12 +99,48 @@ class BaseHandler(OAuthBase):
             'user': self.get_current_user(),
             'handler': self
         })
-        content = self.render_template(template_name, **kwargs)
+        return kwargs
+
+    def render(self, template_name, **kwargs):
+        content = self.render_template(template_name,
+                                       **self.template_context(**kwargs))
         self.write(content)
 
+    def render_streamed(self, template_name, **kwargs):
+        """
+        Render the template and finish the response, sending what has been
+        rendered so far whenever the template takes the next item of an
+        iterable that is wrapped with ``flushing``.
+
+        """
+        template = self.get_jinja_template(template_name)
+        for chunk in template.generate(self.template_context(**kwargs)):
+            self.write(chunk)
+        self.finish()
+
+    def flushing(self, items):
+        """
+        Wrap the (lazily computed) items, to flush the response before
+        computing each of them.
+
+        """
+        items = iter(items)
+        while not self.request.connection.stream.closed():
+            self.flush()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            yield item
+
     def _handle_request_exception(self, e):
         tb = traceback.format_exc()
         logging.error(tb)
+        if self._headers_written:
+            # Part of the page has already been sent (see render_streamed).
+            if not self._finished:
+                self.finish()
+            return
         self.set_status(500)
         self.finish(self.render('error.html', traceback=tb))
 
@@ -110,7 +197,12 @@ class RepoReport(BaseHandler):
 
         datastore = self.settings['datastore']
 
+        # Admins may profile the job (or the render) with ?profile=1.
+        profile = self.get_argument('profile', '') == '1' and self.is_admin()
+
         if not repohealth.generate.cache_available(uuid):
+            if profile and uuid not in datastore:
+                self.submit_job(uuid, token, profile=True)
             # Do what we do with the data handler (return 202 until we
             # are ready)
             return self.report_not_ready(uuid, token)
@@ -124,6 +216,9 @@ class RepoReport(BaseHandler):
             data_fn = tornado.gen.coroutine(repohealth.generate.repo_data)
             payload = yield data_fn(uuid, token)
 
+            # A stale report is served as it is, whilst it is refreshed.
+            refreshing = self.refresh_if_stale(uuid, token)
+
             if payload.get('status', 200) != 200:
                 code = getattr(payload, 'status', 500)
                 self.set_status(code)
@@ -142,12 +237,14 @@ class RepoReport(BaseHandler):
                         'error.html', error=payload["message"],
                         repo_slug=uuid))
 
-            viz_fn = tornado.gen.coroutine(repohealth.generate.visualisations)
-            visualisations = yield viz_fn(payload)
-
             if format == 'notebook':
-                content = repohealth.notebook.notebook(uuid, payload,
-                                                       visualisations)
+                viz_fn = tornado.gen.coroutine(
+                    repohealth.generate.visualisations)
+                visualisations = yield viz_fn(payload, uuid=uuid,
+                                              profile=profile)
+                # nbformat is slow to import, and rarely needed.
+                from repohealth.notebook import notebook
+                content = notebook(uuid, payload, visualisations)
                 fname = "health_{}.ipynb".format(uuid.replace('/', '_'))
 
                 self.set_header("Content-Type", 'application/x-ipynb+json')
@@ -155,20 +252,159 @@ class RepoReport(BaseHandler):
                                 'attachment; filename="{}'.format(fname))
                 return self.finish(content)
             else:
-                self.finish(self.render('report.html', payload=payload,
-                                        viz=visualisations,
-                                        repo_slug=uuid))
+                # Send the repo's summary straight away, followed by each
+                # plot as soon as it is rendered.
+                visualisations = repohealth.generate.iter_visualisations(
+                    payload, uuid=uuid, profile=profile)
+                now = datetime.datetime.utcnow()
+                age = repohealth.generate.cache_age(uuid) or 0
+                updated = pretty_timedelta(
+                    now - datetime.timedelta(seconds=age), now)
+                self.render_streamed('report.html', payload=payload,
+                                     viz=self.flushing(visualisations),
+                                     repo_slug=uuid, refreshing=refreshing,
+                                     updated=updated)
+
+
+#: The maximum number of repos that may be compared at once.
+MAX_COMPARE = 20
+
+#: An "org/repo" slug (as accepted by the report routes).
+SLUG = re.compile(r'[\w\-]+/[\w\-]+')
+
+
+def compare_uuids(repos):
+    """
+    Parse the comma separated "org/repo" list of a comparison request.
+
+    """
+    slugs = [slug.strip() for slug in repos.split(',') if slug.strip()]
+    if not slugs or not all(SLUG.fullmatch(slug) for slug in slugs):
+        raise tornado.web.HTTPError(
+            400, 'Please give a comma separated list of GitHub repositories '
+                 '(e.g. "numpy/numpy,scipy/scipy").')
+    if len(slugs) > MAX_COMPARE:
+        raise tornado.web.HTTPError(
+            400, 'At most {} repositories may be compared.'.format(MAX_COMPARE))
+    uuids = []
+    for slug in slugs:
+        uuid = repo_uuid(*slug.split('/'))
+        if uuid not in uuids:
+            uuids.append(uuid)
+    return uuids
+
+
+class RepoCompare(BaseHandler):
+    @tornado.web.authenticated
+    def get(self):
+        try:
+            uuids = compare_uuids(self.get_argument('repos', ''))
+        except tornado.web.HTTPError as err:
+            self.set_status(err.status_code)
+            return self.finish(self.render('error.html', error=err.log_message))
+
+        rollups, missing, visualisations = repohealth.generate.comparison(uuids)
+        self.finish(self.render('compare.html', rollups=rollups,
+                                missing=missing, viz=visualisations))
+
+
+class APICompareHandler(BaseHandler):
+    @tornado.web.authenticated
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        try:
+            uuids = compare_uuids(self.get_argument('repos', ''))
+        except tornado.web.HTTPError as err:
+            self.set_status(err.status_code)
+            return self.finish(json_encode({'status': err.status_code,
+                                            'message': err.log_message}))
+
+        rollups = {}
+        for uuid in uuids:
+            rollup = repohealth.generate.repo_rollup(uuid)
+            if rollup is not None:
+                rollups[uuid] = rollup
+        self.finish(json_encode(
+            {'status': 200,
+             'content': rollups,
+             'missing': [uuid for uuid in uuids if uuid not in rollups]}))
+
+
+def token_quotas(user):
+    """
+    The quotas of the GitHub tokens, as last seen by the jobs, with the
+    user's own token marked.
+
+    """
+    own = repohealth.github.tokens.fingerprint(user['access_token'])
+    now = time.time()
+    quotas = []
+    for quota in repohealth.generate.cache_index().quotas():
+        quota = dict(quota, own=quota['fingerprint'] == own)
+        if quota['reset'] is not None and quota['reset'] <= now:
+            # The quota has been reset since it was seen.
+            quota['remaining'] = quota['quota_limit']
+        quota['reset_minutes'] = max((quota['reset'] or now) - now, 0) / 60
+        quotas.append(quota)
+    return quotas
 
 
 class Status(BaseHandler):
     @tornado.web.authenticated
     def get(self):
         user = self.get_current_user()
-        gh = Github(user['access_token'])
+        profiles = []
+        if self.is_admin():
+            profiles = repohealth.profiling.profiles(
+                repohealth.generate.CACHE_PROFILES)
         self.finish(self.render('status.html',
                                 futures=self.settings['datastore'],
-                                cached_jobs=repohealth.generate.in_cache(),
-                                user=user, gh=gh))
+                                cached_jobs=repohealth.generate.summaries(),
+                                profiles=profiles,
+                                recent_jobs=getattr(self.settings['executor'],
+                                                    'recent_jobs', []),
+                                quotas=token_quotas(user), user=user))
+
+
+class ShareToken(BaseHandler):
+    @tornado.web.authenticated
+    def post(self):
+        # Opt in (or out) of sharing the user's token with the other jobs.
+        user = dict(self.get_current_user())
+        user['share_token'] = self.get_argument('share', '0') == '1'
+        pool = repohealth.generate.token_pool()
+        if user['share_token']:
+            pool.share(user['access_token'], 'user {}'.format(user['login']))
+        else:
+            pool.unshare(user['access_token'])
+        self.set_secure_cookie('user', json_encode(user), expires_days=5)
+        self.redirect('/status')
+
+
+class ProfileDownload(BaseHandler):
+    @tornado.web.authenticated
+    def get(self, fname):
+        path = os.path.join(repohealth.generate.CACHE_PROFILES, fname)
+        if not self.is_admin() or not os.path.isfile(path):
+            self.set_status(404)
+            return self.finish(self.render(
+                'error.html', error='Profile "{}" not found.'.format(fname)))
+        self.set_header('Content-Type', 'application/octet-stream')
+        self.set_header('Content-Disposition',
+                        'attachment; filename="{}"'.format(fname))
+        with open(path, 'rb') as fh:
+            self.finish(fh.read())
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        # Include the metrics of this (web) process alongside those that
+        # the executor workers have flushed.
+        directory = repohealth.generate.CACHE_METRICS
+        repohealth.metrics.flush(directory)
+        registry = repohealth.metrics.collect(directory)
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.finish(repohealth.metrics.prometheus_text(registry))
 
 
 class APIDataAvailableHandler(BaseHandler):
@@ -206,20 +442,16 @@ class APIDataAvailableHandler(BaseHandler):
             return response
 
         datastore = self.settings['datastore']
-        executor = self.settings['executor']
 
         status = repohealth.generate.job_status(uuid)
 
         if repohealth.generate.cache_available(uuid):
             return {'status': 200, 'message': "ready",
-                    'status_info': status}
+                    'status_info': status,
+                    'refreshing': self.refresh_if_stale(uuid, token)}
 
         if uuid not in datastore:
-            future = executor.submit(repohealth.generate.prepare_repo_data,
-                                     uuid, token)
-            future._start_time = datetime.datetime.utcnow()
-            datastore[uuid] = future
-            future.add_done_callback(lambda future: datastore.pop(uuid))
+            self.submit_job(uuid, token)
 
             # The status code should be set to "Submitted, and processing"
             self.set_status(202)
@@ -267,7 +499,9 @@ class APIDataHandler(APIDataAvailableHandler):
             else:
                 self.finish(json_encode(
                     {'status': 200,
-                     'content': result}))
+                     'content': result,
+                     'pending_plots':
+                         repohealth.generate.pending_plots(result)}))
 
 
 class MainHandler(BaseHandler):
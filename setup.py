@@ -22,6 +22,12 @@ setuptools.setup(
         'tornado',
         'tweepy',
     ],
+    extras_require={
+        # The shared cache (see repohealth.shared_cache).
+        's3': ['boto3'],
+        # Compressing the cache with zstd (REPOHEALTH_CACHE_COMPRESSION).
+        'zstd': ['zstandard'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "License :: OSI Approved :: MIT License",